@@ -0,0 +1,323 @@
+"""
+End-to-end benchmarks against a local LLM stub.
+
+    python -m benchmarks.bench all --preset small
+    python -m benchmarks.bench pipeline --texts 50 --images 20 --latency 0.2
+    python -m benchmarks.bench scaling --scales 1000,10000,100000,1000000
+    python -m benchmarks.bench all --save-baseline main
+    python -m benchmarks.bench all --compare main
+
+`pipeline` generates a synthetic corpus (text files, image pages, scanned
+and born-digital PDFs) in a temporary directory and runs the raw, OCR and
+generation stages on it, with src.backends.set_backend(StubBackend). It
+reports pages/sec for ingestion (raw + OCR), chunks/sec for generation and
+merging, peak RSS and the per-stage times from src.metrics. `scaling`
+measures merge_fragment, Turtle and N-Triples serialization,
+visualize_ontology and the LOD export at each ontology size. Each benchmark
+runs in its own process, so peak RSS is its own.
+
+Results are flat {metric: value} maps. Baselines are kept in
+benchmarks/baselines/<name>.json; --compare prints the change of every
+metric and exits with status 1 if a time, throughput or memory metric got
+worse by more than --threshold (times under --min-seconds are ignored).
+"""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the benchmarks run in temporary working directories
+sys.path.insert(0, REPO)
+BASELINES = os.path.join(REPO, "benchmarks", "baselines")
+PRESETS = {
+    "small": dict(texts=5, words_per_text=2000, images=4, scanned_pdfs=1, digital_pdfs=2, pages_per_pdf=3),
+    "medium": dict(texts=40, words_per_text=4000, images=20, scanned_pdfs=4, digital_pdfs=8, pages_per_pdf=6),
+    "large": dict(texts=200, words_per_text=8000, images=100, scanned_pdfs=10, digital_pdfs=40, pages_per_pdf=12),
+}
+DEFAULT_SCALES = "1000,10000,100000,1000000"
+# metric name suffixes, by which direction is better; anything else is informational
+HIGHER_IS_BETTER = ("_per_sec",)
+LOWER_IS_BETTER = ("_seconds", "_mb")
+
+def peak_rss_mb():
+    """Peak resident set size of this process and, separately, of its finished child processes (e.g. rasterizers)."""
+    # ru_maxrss is in kilobytes, on macOS in bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+    return own, children
+
+def _quiet(verbose):
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+
+def _workdir(keep):
+    workdir = tempfile.mkdtemp(prefix="ontology-bench-")
+    os.chdir(workdir)
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(filename="logs/app.log", level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if keep:
+        print(f"Working directory: {workdir}", file=sys.stderr)
+    return workdir
+
+def bench_pipeline(args):
+    from benchmarks.corpus import make_corpus
+    from benchmarks.stub import StubBackend
+    from src.backends import set_backend
+    from src.document_loader import load_documents
+    from src.manifest import Manifest
+    from src.metrics import metrics
+    from src.pipeline import ingest_raw, rasterize_pdfs, ocr_image, run_pipeline
+
+    _workdir(args.keep)
+    os.environ.setdefault("GROQ_MODEL", "benchmark-stub")
+    # validation issues are counted, not sent to the (stub) LLM
+    os.environ.setdefault("VALIDATION_ESCALATE", "0")
+    sizes = {key: getattr(args, key) if getattr(args, key) is not None else value
+             for key, value in PRESETS[args.preset].items()}
+    if shutil.which("pdfinfo") is None and (sizes["scanned_pdfs"] or sizes["digital_pdfs"]):
+        print("poppler is not installed: the corpus has no PDFs", file=sys.stderr)
+        sizes["scanned_pdfs"] = sizes["digital_pdfs"] = 0
+    corpus = make_corpus("data/raw", seed=args.seed, **sizes)
+    stub = StubBackend(latency=args.latency)
+    set_backend(stub)
+
+    with _quiet(args.verbose):
+        start = time.perf_counter()
+        manifest = Manifest()
+        pending_pdfs = {}
+        for doc_path in load_documents("data/raw"):
+            ingest_raw(doc_path, manifest, "data/images", False, pending_pdfs)
+        rasterize_pdfs(pending_pdfs, manifest)
+        for doc_path in load_documents("data/images"):
+            ocr_image(doc_path, manifest)
+        manifest.flush()
+        ingest_seconds = time.perf_counter() - start
+        ocr_calls = stub.calls
+
+        start = time.perf_counter()
+        run_pipeline(skip_raw=True, skip_ocr=True, use_cache=False, concurrency=args.concurrency)
+        generation_seconds = time.perf_counter() - start
+
+    summary = metrics.summary()
+    chunks = summary["counters"].get("chunks{generation}", 0)
+    own_rss, children_rss = peak_rss_mb()
+    results = {
+        "pipeline.pages": corpus["pages"],
+        "pipeline.text_words": corpus["text_words"],
+        "pipeline.chunks": chunks,
+        "pipeline.ocr_calls": ocr_calls,
+        "pipeline.generation_calls": stub.calls - ocr_calls,
+        "pipeline.ingest_seconds": ingest_seconds,
+        "pipeline.pages_per_sec": corpus["pages"] / ingest_seconds if ingest_seconds else 0.0,
+        "pipeline.generation_seconds": generation_seconds,
+        "pipeline.chunks_per_sec": chunks / generation_seconds if generation_seconds else 0.0,
+        "pipeline.peak_rss_mb": own_rss,
+        "pipeline.children_peak_rss_mb": children_rss,
+    }
+    for stage, values in summary["stages"].items():
+        results[f"pipeline.stage.{stage}_seconds"] = values["seconds"]
+    return results
+
+def bench_scale(triples, args):
+    import visualise
+    from benchmarks.corpus import NumberedTerms, synthetic_fragment
+    from src.ontology_builder import OntologyBuilder
+
+    _workdir(args.keep)
+    rng = random.Random(triples)
+    per_fragment = 60
+    terms = NumberedTerms(max(triples // 3, 10))
+    fragments = [synthetic_fragment(rng, terms, per_fragment) for _ in range(math.ceil(triples / per_fragment))]
+    # no journal: measures merging itself
+    ob = OntologyBuilder("http://example.com/ontology", state_dir="")
+    prefix = f"scaling.{triples}"
+    results = {}
+
+    with _quiet(args.verbose):
+        start = time.perf_counter()
+        for fragment in fragments:
+            ob.merge_fragment(fragment)
+        merge_seconds = time.perf_counter() - start
+        del fragments
+        results[f"{prefix}.triples"] = len(ob.graph)
+        results[f"{prefix}.merge_seconds"] = merge_seconds
+        results[f"{prefix}.merge_triples_per_sec"] = len(ob.graph) / merge_seconds if merge_seconds else 0.0
+
+        start = time.perf_counter()
+        ob.export_turtle("output/ontology.ttl")
+        results[f"{prefix}.serialize_turtle_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        ob.graph.serialize(destination="output/ontology.nt", format="nt", encoding="utf-8")
+        results[f"{prefix}.serialize_nt_seconds"] = time.perf_counter() - start
+        ob.close()
+        del ob
+
+        if triples <= args.visualize_max:
+            start = time.perf_counter()
+            visualise.visualize_ontology("output/ontology.nt", output_html="output/ontology.html")
+            results[f"{prefix}.visualize_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        visualise.export_lod("output/ontology.nt", output_html="output/ontology_lod.html")
+        results[f"{prefix}.visualize_lod_seconds"] = time.perf_counter() - start
+
+    results[f"{prefix}.peak_rss_mb"] = peak_rss_mb()[0]
+    return results
+
+def _run_child(command, args):
+    """Runs one benchmark in a fresh interpreter and returns its results."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    argv = [sys.executable, "-m", "benchmarks.bench", *command, "--output", output,
+            "--latency", str(args.latency), "--seed", str(args.seed), "--preset", args.preset,
+            "--visualize-max", str(args.visualize_max)]
+    if args.concurrency is not None:
+        argv += ["--concurrency", str(args.concurrency)]
+    for key in PRESETS["small"]:
+        if getattr(args, key) is not None:
+            argv += [f"--{key.replace('_', '-')}", str(getattr(args, key))]
+    if args.verbose:
+        argv.append("--verbose")
+    if args.keep:
+        argv.append("--keep")
+    path = os.pathsep.join(filter(None, [REPO, os.environ.get("PYTHONPATH")]))
+    subprocess.run(argv, cwd=REPO, check=True, env={**os.environ, "PYTHONPATH": path})
+    with open(output, "r", encoding="utf-8") as f:
+        results = json.load(f)["metrics"]
+    os.remove(output)
+    return results
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "command": args.command,
+        "preset": args.preset,
+        "latency": args.latency,
+    }
+
+def _direction(metric):
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+def compare(baseline, current, threshold, min_seconds=0.1):
+    """
+    Prints the change of every metric; returns the metrics that regressed by
+    more than `threshold`. Times under `min_seconds` in both runs are too
+    noisy to flag.
+    """
+    regressions = []
+    width = max(len(m) for m in set(baseline) | set(current))
+    print(f"{'metric':<{width}}  {'baseline':>12}  {'current':>12}  {'change':>8}")
+    for metric in sorted(set(baseline) | set(current)):
+        old, new = baseline.get(metric), current.get(metric)
+        if old is None or new is None:
+            print(f"{metric:<{width}}  {_fmt(old):>12}  {_fmt(new):>12}  {'':>8}")
+            continue
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        direction = _direction(metric)
+        if metric.endswith("_seconds") and max(old, new) < min_seconds:
+            direction = 0
+        if direction and change * direction < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(metric)
+        elif direction and change * direction > threshold:
+            flag = "  improved"
+        print(f"{metric:<{width}}  {_fmt(old):>12}  {_fmt(new):>12}  {change:>+8.1%}{flag}")
+    return regressions
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ontology pipeline against a local LLM stub")
+    parser.add_argument("command", choices=["all", "pipeline", "scaling", "scale"],
+                        help="all: pipeline + scaling; scale: one ontology size (see --triples)")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small", help="Corpus size")
+    parser.add_argument("--texts", type=int, default=None, help="Text files (overrides the preset)")
+    parser.add_argument("--words-per-text", type=int, default=None)
+    parser.add_argument("--images", type=int, default=None, help="Scanned image pages")
+    parser.add_argument("--scanned-pdfs", type=int, default=None, help="Image-only PDFs (need poppler)")
+    parser.add_argument("--digital-pdfs", type=int, default=None, help="PDFs with a text layer (need poppler)")
+    parser.add_argument("--pages-per-pdf", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per stub LLM call")
+    parser.add_argument("--concurrency", type=int, default=None, help="Generation requests in flight")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="Ontology sizes (triples) for scaling")
+    parser.add_argument("--triples", type=int, default=1000, help="Ontology size for scale")
+    parser.add_argument("--visualize-max", type=int, default=10000,
+                        help="Largest size rendered with visualize_ontology (the LOD export runs at every size)")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    parser.add_argument("--save-baseline", metavar="NAME", default=None)
+    parser.add_argument("--compare", metavar="NAME", default=None, help="Compare with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.1, help="Times below this are not compared")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    parser.add_argument("--keep", action="store_true", help="Print (and keep) the temporary working directories")
+    args = parser.parse_args(argv)
+
+    if args.command == "pipeline":
+        results = bench_pipeline(args)
+    elif args.command == "scale":
+        results = bench_scale(args.triples, args)
+    else:
+        results = {}
+        if args.command == "all":
+            results.update(_run_child(["pipeline"], args))
+        for triples in (int(s) for s in args.scales.split(",") if s.strip()):
+            results.update(_run_child(["scale", "--triples", str(triples)], args))
+
+    report = {"meta": metadata(args), "metrics": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    if args.command == "scale" and args.output:
+        return 0
+
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = os.path.join(BASELINES, f"{args.save_baseline}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+        print(f"Baseline saved to {path}")
+    if args.compare:
+        with open(os.path.join(BASELINES, f"{args.compare}.json"), "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with baseline {args.compare} ({baseline['meta'].get('commit')}, {baseline['meta'].get('date')}):")
+        regressions = compare(baseline["metrics"], results, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}.")
+            return 1
+        return 0
+
+    width = max(len(m) for m in results) if results else 0
+    for metric in sorted(results):
+        print(f"{metric:<{width}}  {_fmt(results[metric])}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
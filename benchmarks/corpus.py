@@ -0,0 +1,147 @@
+"""
+Synthetic corpora for the benchmarks: text files, scanned image pages,
+scanned (image-only) PDFs and born-digital PDFs with a text layer, plus
+Turtle fragments of a given size. Everything is derived from a seed, so two
+runs with the same settings process the same bytes.
+"""
+import os
+import random
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "to", "vu", "sen", "dar", "mol", "tis", "gon", "pel", "ur", "ex", "qua"]
+PREFIXES = """@prefix ex: <http://example.com/ontology#> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+"""
+
+def vocabulary(size=2000, seed=0):
+    """`size` distinct pseudo-words."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def sentences(rng, words, count):
+    for _ in range(count):
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 18)))
+        yield sentence[0].upper() + sentence[1:] + "."
+
+def text_lines(rng, words, word_count, width=80):
+    """Paragraph text of about `word_count` words, wrapped at `width` characters."""
+    lines, line, total = [], "", 0
+    while total < word_count:
+        for sentence in sentences(rng, words, 1):
+            for word in sentence.split():
+                total += 1
+                if line and len(line) + 1 + len(word) > width:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = f"{line} {word}" if line else word
+    lines.append(line)
+    return lines
+
+def render_page(lines, size=(1240, 1754)):
+    """A scanned-looking page: the lines drawn in black on white (A4 at 150 dpi)."""
+    from PIL import Image, ImageDraw
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines[:100]):
+        draw.text((90, 90 + i * 16), line, fill=0)
+    return image
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_text_pdf(path, pages):
+    """Minimal born-digital PDF (Helvetica text, no images), one list of lines per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 50 780 Td 13 TL\n" + "\n".join(f"({_pdf_escape(line)}) '" for line in lines[:56]) + "\nET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+def make_corpus(directory, texts=10, words_per_text=2000, images=5, scanned_pdfs=2, digital_pdfs=2,
+                pages_per_pdf=4, seed=0):
+    """
+    Writes a corpus into `directory` (data/raw of a benchmark run). Returns
+    the number of files, pages and words of each kind.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    words = vocabulary(seed=seed)
+    words_per_page = 550
+
+    for i in range(texts):
+        with open(os.path.join(directory, f"text_{i:04d}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(text_lines(rng, words, words_per_text)) + "\n")
+    for i in range(images):
+        render_page(text_lines(rng, words, words_per_page)).save(os.path.join(directory, f"scan_{i:04d}.png"))
+    for i in range(scanned_pdfs):
+        pages = [render_page(text_lines(rng, words, words_per_page)) for _ in range(pages_per_pdf)]
+        pages[0].save(os.path.join(directory, f"scanned_{i:04d}.pdf"), save_all=True, append_images=pages[1:],
+                      resolution=150)
+    for i in range(digital_pdfs):
+        write_text_pdf(os.path.join(directory, f"digital_{i:04d}.pdf"),
+                       [text_lines(rng, words, words_per_page, width=95) for _ in range(pages_per_pdf)])
+
+    return {
+        "text_files": texts,
+        "text_words": texts * words_per_text,
+        "image_pages": images,
+        "scanned_pdf_pages": scanned_pdfs * pages_per_pdf,
+        "digital_pdf_pages": digital_pdfs * pages_per_pdf,
+        "pages": images + (scanned_pdfs + digital_pdfs) * pages_per_pdf,
+    }
+
+class NumberedTerms:
+    """Sequence of `size` term names ("term0", "term1", ...) that does not hold them in memory."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        return f"term{i}"
+
+def synthetic_fragment(rng, words, triples=20, namespace_words=None):
+    """
+    A Turtle fragment of about `triples` triples about classes and
+    properties named after `words`, the way generation output looks.
+    `namespace_words` (default: `words`) is where related terms are drawn
+    from, so fragments share part of their vocabulary.
+    """
+    namespace_words = namespace_words or words
+    lines = [PREFIXES]
+    count = 0
+    while count < triples:
+        name = rng.choice(words).capitalize()
+        parent = rng.choice(namespace_words).capitalize()
+        prop = "has" + rng.choice(namespace_words).capitalize()
+        target = rng.choice(namespace_words).capitalize()
+        lines.append(f'ex:{name} a owl:Class ;\n    rdfs:label "{name}" ;\n    rdfs:subClassOf ex:{parent} .')
+        lines.append(f"ex:{prop} a owl:ObjectProperty ;\n    rdfs:domain ex:{name} ;\n    rdfs:range ex:{target} .")
+        count += 6
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import random
+import re
+import time
+from src.backends import LLMResponse, LLMStream
+from benchmarks.corpus import synthetic_fragment, text_lines, vocabulary
+
+CHUNK_TEXT = re.compile(r'TEXT:\n"(.*?)"\n', re.DOTALL)
+STUB_STREAM_PIECE = 16
+
+class StubBackend:
+    """
+    Stands in for the Groq client in benchmarks (install with
+    src.backends.set_backend). Image requests get canned OCR text, every
+    other prompt a Turtle fragment built from the words of its chunk; both
+    are derived from a hash of the request, so runs are repeatable. Each call
+    takes `latency` seconds, like a network round trip.
+    """
+
+    def __init__(self, latency=0.0, triples_per_fragment=24, ocr_words=500):
+        self.latency = latency
+        self.triples_per_fragment = triples_per_fragment
+        self.ocr_words = ocr_words
+        self.words = vocabulary()
+        self.calls = 0
+
+    def _respond(self, request_key, request):
+        self.calls += 1
+        rng = random.Random(hashlib.sha256(request_key.encode("utf-8")).digest())
+        content = request["messages"][-1]["content"]
+        if not isinstance(content, str):
+            text = "\n".join(text_lines(rng, self.words, self.ocr_words))
+        else:
+            match = CHUNK_TEXT.search(content)
+            chunk_words = re.findall(r"[a-z]+", match.group(1) if match else content) or self.words
+            text = synthetic_fragment(rng, chunk_words, self.triples_per_fragment)
+        prompt_tokens = len(str(content)) // 4
+        completion_tokens = len(text) // 4
+        return LLMResponse(text, headers={}, usage={
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+
+    def _pieces(self, response):
+        text = response.content
+        for i in range(0, len(text), STUB_STREAM_PIECE):
+            last = i + STUB_STREAM_PIECE >= len(text)
+            yield text[i:i + STUB_STREAM_PIECE], response.usage if last else None
+
+    def complete(self, request_key, api_key=None, **request):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(request_key, request)
+
+    async def acomplete(self, request_key, api_key=None, **request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(request_key, request)
+
+    def open_stream(self, request_key, api_key=None, **request):
+        if self.latency:
+            time.sleep(self.latency)
+        response = self._respond(request_key, request)
+        return LLMStream(self._pieces(response), response.headers)
+
+    async def aopen_stream(self, request_key, api_key=None, **request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self._respond(request_key, request)
+
+        async def pieces():
+            for piece in self._pieces(response):
+                yield piece
+        return LLMStream(pieces(), response.headers)
@@ -1,7 +1,7 @@
 import os
 import logging
 import argparse
-from src.pipeline import run_pipeline
+from src.pipeline import run_pipeline, export_ontology, run_daemon, retract_document
 
 if __name__ == "__main__":
     # --- Parse command-line args ---
@@ -9,8 +9,26 @@ if __name__ == "__main__":
     parser.add_argument("--skip-raw", action="store_true", help="Skip processing of raw documents")
     parser.add_argument("--skip-ocr", action="store_true", help="Skip OCR on images")
     parser.add_argument("--review", action="store_true", help="Run on review files only")
+    parser.add_argument("--concurrency", type=int, default=None, help="Number of generation requests kept in flight (default: LLM_CONCURRENCY or 4)")
+    parser.add_argument("--merge-workers", type=int, default=None,
+                        help="Parse the fragments of each document in this many worker processes and merge them in the main process, in document order (default: MERGE_WORKERS, 0 = merge in-process)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the LLM response cache")
+    parser.add_argument("--refresh-cache", action="store_true", help="Ignore cached LLM responses but store the new ones")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Send near-duplicate page images and chunks to the LLM instead of reusing earlier results")
+    parser.add_argument("--backend", choices=["groq", "record", "replay"], default=None,
+                        help="LLM backend: live Groq, Groq with request recording, or offline replay of logs/llm_responses.jsonl (default: LLM_BACKEND or groq)")
+    parser.add_argument("--export-turtle", action="store_true",
+                        help="Write output/final_ontology.ttl from the saved ontology state and exit")
+    parser.add_argument("--retract", metavar="DOCUMENT", default=None,
+                        help="Remove the triples merged from one document (text file or raw document) from the saved ontology state and exit")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running: watch data/raw, data/images and data/processed and process files as they arrive")
     args = parser.parse_args()
 
+    if args.backend:
+        os.environ["LLM_BACKEND"] = args.backend
+
     # --- Ensure logs folder exists ---
     os.makedirs("logs", exist_ok=True)
 
@@ -22,7 +40,17 @@ if __name__ == "__main__":
         level=logging.INFO
     )
 
-    logging.info(f"Pipeline started (skip_raw={args.skip_raw}, skip_ocr={args.skip_ocr})")
+    if args.export_turtle:
+        export_ontology()
+    elif args.retract:
+        retract_document(args.retract)
+    elif args.watch:
+        run_daemon(concurrency=args.concurrency, use_cache=not args.no_cache, refresh_cache=args.refresh_cache,
+                   use_dedup=not args.no_dedup)
+    else:
+        logging.info(f"Pipeline started (skip_raw={args.skip_raw}, skip_ocr={args.skip_ocr})")
 
-    # --- Run pipeline with args ---
-    run_pipeline(skip_raw=args.skip_raw, skip_ocr=args.skip_ocr, review=args.review)
\ No newline at end of file
+        # --- Run pipeline with args ---
+        run_pipeline(skip_raw=args.skip_raw, skip_ocr=args.skip_ocr, review=args.review, concurrency=args.concurrency,
+                     use_cache=not args.no_cache, refresh_cache=args.refresh_cache, merge_workers=args.merge_workers,
+                     use_dedup=not args.no_dedup)
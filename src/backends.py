@@ -0,0 +1,341 @@
+import asyncio
+import hashlib
+import os
+import time
+from groq import Groq, AsyncGroq, GroqError
+from src.responseLogger import read_responses
+from src.scheduler import scheduler_from_env
+
+class LLMResponse:
+    def __init__(self, content, headers=None, usage=None, request=None):
+        self.content = content
+        self.headers = headers
+        self.usage = usage
+        # only set in record mode: the request that produced this response
+        self.request = request
+        # served from the response log by ReplayBackend, so not logged again
+        self.replayed = False
+        # set by SchedulingBackend when a fallback model served the request in place of the requested one
+        self.fallback_model = None
+        self.fallback_key = None
+
+class LLMStream:
+    """
+    A streamed completion: iterate (or async-iterate) over its text deltas.
+    `usage` is set once the stream is exhausted, if the provider reports it.
+    """
+
+    def __init__(self, deltas, headers=None, close=None):
+        # deltas: an iterator or async iterator of (text, usage or None) pairs
+        self._deltas = deltas
+        self._close = close
+        self.headers = headers
+        self.usage = None
+        self.request = None
+        self.replayed = False
+        self.fallback_model = None
+        self.fallback_key = None
+
+    def __iter__(self):
+        for text, usage in self._deltas:
+            self.usage = usage or self.usage
+            if text:
+                yield text
+
+    async def __aiter__(self):
+        async for text, usage in self._deltas:
+            self.usage = usage or self.usage
+            if text:
+                yield text
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+    async def aclose(self):
+        if self._close is not None:
+            await self._close()
+
+def _usage_dict(completion):
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+
+def _chunk_delta(chunk):
+    """Text and (on the last chunk) usage of one streamed chat completion chunk."""
+    text = chunk.choices[0].delta.content if chunk.choices else None
+    x_groq = getattr(chunk, "x_groq", None)
+    return text, _usage_dict(x_groq) if x_groq is not None else None
+
+def _groq_deltas(stream):
+    for chunk in stream:
+        yield _chunk_delta(chunk)
+
+async def _agroq_deltas(stream):
+    async for chunk in stream:
+        yield _chunk_delta(chunk)
+
+class GroqBackend:
+    """
+    Live Groq API. Clients are created on first use, one per API key, so
+    replay runs need no key. `max_retries` is passed to the SDK clients; the
+    scheduler sets it to 0 so that it sees every rate-limit response itself.
+    """
+
+    def __init__(self, max_retries=None):
+        self.max_retries = max_retries
+        self._clients = {}
+        # AsyncGroq wraps an httpx.AsyncClient, which must not be shared across event loops.
+        self._async_clients = {}
+
+    def _client_options(self, api_key):
+        options = {} if self.max_retries is None else {"max_retries": self.max_retries}
+        if api_key:
+            options["api_key"] = api_key
+        return options
+
+    def get_client(self, api_key=None):
+        if api_key not in self._clients:
+            self._clients[api_key] = Groq(**self._client_options(api_key))
+        return self._clients[api_key]
+
+    def get_async_client(self, api_key=None):
+        loop = asyncio.get_running_loop()
+        client, client_loop = self._async_clients.get(api_key, (None, None))
+        if client is None or client_loop is not loop:
+            client = AsyncGroq(**self._client_options(api_key))
+            self._async_clients[api_key] = (client, loop)
+        return client
+
+    def complete(self, request_key, api_key=None, **request):
+        raw = self.get_client(api_key).chat.completions.with_raw_response.create(**request)
+        completion = raw.parse()
+        return LLMResponse(completion.choices[0].message.content.strip(), dict(raw.headers), _usage_dict(completion))
+
+    async def acomplete(self, request_key, api_key=None, **request):
+        raw = await self.get_async_client(api_key).chat.completions.with_raw_response.create(**request)
+        completion = await raw.parse()
+        return LLMResponse(completion.choices[0].message.content.strip(), dict(raw.headers), _usage_dict(completion))
+
+    def open_stream(self, request_key, api_key=None, **request):
+        raw = self.get_client(api_key).chat.completions.with_raw_response.create(stream=True, **request)
+        stream = raw.parse()
+        return LLMStream(_groq_deltas(stream), dict(raw.headers), stream.close)
+
+    async def aopen_stream(self, request_key, api_key=None, **request):
+        raw = await self.get_async_client(api_key).chat.completions.with_raw_response.create(stream=True, **request)
+        stream = await raw.parse()
+        return LLMStream(_agroq_deltas(stream), dict(raw.headers), stream.close)
+
+def fallback_key(request_key, model):
+    """Key of a request served by the fallback `model` instead of the requested one."""
+    return hashlib.sha256(f"{request_key}\0{model}".encode("utf-8")).hexdigest()
+
+class SchedulingBackend:
+    """
+    Runs the wrapped backend's calls through a RateLimitScheduler (key/model
+    pool, budgets, retries). A response from a fallback model is marked with
+    that model and its own key, so it is logged and replayed under that key
+    and never cached as the requested model's output.
+    """
+
+    def __init__(self, inner, scheduler):
+        self.inner = inner
+        self.scheduler = scheduler
+
+    def _serve(self, call, request_key, request):
+        def attempt(api_key, **req):
+            if req["model"] == request["model"]:
+                return call(request_key, api_key=api_key, **req)
+            key = fallback_key(request_key, req["model"])
+            return _mark_fallback(call(key, api_key=api_key, **req), req["model"], key)
+        return attempt
+
+    def _aserve(self, call, request_key, request):
+        async def attempt(api_key, **req):
+            if req["model"] == request["model"]:
+                return await call(request_key, api_key=api_key, **req)
+            key = fallback_key(request_key, req["model"])
+            return _mark_fallback(await call(key, api_key=api_key, **req), req["model"], key)
+        return attempt
+
+    def complete(self, request_key, **request):
+        return self.scheduler.call(self._serve(self.inner.complete, request_key, request), request)
+
+    async def acomplete(self, request_key, **request):
+        return await self.scheduler.acall(self._aserve(self.inner.acomplete, request_key, request), request)
+
+    def open_stream(self, request_key, **request):
+        # rate limits are reported when the stream is opened
+        return self.scheduler.call(self._serve(self.inner.open_stream, request_key, request), request)
+
+    async def aopen_stream(self, request_key, **request):
+        return await self.scheduler.acall(self._aserve(self.inner.aopen_stream, request_key, request), request)
+
+def _mark_fallback(response, model, key):
+    response.fallback_model = model
+    response.fallback_key = key
+    return response
+
+def _redact_images(messages):
+    """Replaces inline image data with its hash so recorded requests stay small."""
+    redacted = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, list):
+            content = [
+                {**part, "image_url": {"url": "sha256:" + hashlib.sha256(part["image_url"]["url"].encode("utf-8")).hexdigest()}}
+                if part.get("type") == "image_url" else part
+                for part in content
+            ]
+        redacted.append({**message, "content": content})
+    return redacted
+
+class RecordingBackend:
+    """Calls the wrapped backend and attaches the request, so it is logged next to the response."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def complete(self, request_key, **request):
+        response = self.inner.complete(request_key, **request)
+        response.request = {**request, "messages": _redact_images(request["messages"])}
+        return response
+
+    async def acomplete(self, request_key, **request):
+        response = await self.inner.acomplete(request_key, **request)
+        response.request = {**request, "messages": _redact_images(request["messages"])}
+        return response
+
+    def open_stream(self, request_key, **request):
+        stream = self.inner.open_stream(request_key, **request)
+        stream.request = {**request, "messages": _redact_images(request["messages"])}
+        return stream
+
+    async def aopen_stream(self, request_key, **request):
+        stream = await self.inner.aopen_stream(request_key, **request)
+        stream.request = {**request, "messages": _redact_images(request["messages"])}
+        return stream
+
+# characters per streamed delta when replaying
+REPLAY_STREAM_PIECE = 16
+
+class ReplayMissError(KeyError):
+    pass
+
+class SimulatedRateLimitError(GroqError):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit reached (simulated by replay backend), retry after {retry_after}s")
+        self.headers = {"retry-after": str(retry_after)}
+
+class ReplayBackend:
+    """
+    Serves responses recorded in logs/llm_responses.jsonl, offline and
+    deterministically: each request key gets its most recent successful
+    output. Optional simulated latency and rate-limit errors; whether a given
+    call fails depends only on its request key and attempt number.
+    """
+
+    def __init__(self, filename="logs/llm_responses.jsonl", latency=0.0, error_rate=0.0, retry_after=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.responses = {}
+        self.attempts = {}
+        for record in read_responses(filename):
+            if record.get("status") == "success" and record.get("request_key"):
+                self.responses[record["request_key"]] = record
+        self.hits = 0
+        self.misses = 0
+
+    def _should_fail(self, request_key):
+        attempt = self.attempts.get(request_key, 0)
+        self.attempts[request_key] = attempt + 1
+        if not self.error_rate:
+            return False
+        digest = hashlib.sha256(f"{request_key}:{attempt}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 2**32 < self.error_rate
+
+    def _serve(self, request_key):
+        if self._should_fail(request_key):
+            raise SimulatedRateLimitError(self.retry_after)
+        record = self.responses.get(request_key)
+        if record is None:
+            self.misses += 1
+            raise ReplayMissError(f"No recorded response for request {request_key}")
+        self.hits += 1
+        response = LLMResponse(record["output"], record.get("headers"), record.get("usage"))
+        response.replayed = True
+        return response
+
+    def complete(self, request_key, api_key=None, **request):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._serve(request_key)
+
+    async def acomplete(self, request_key, api_key=None, **request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._serve(request_key)
+
+    def _pieces(self, response):
+        text = response.content
+        for i in range(0, len(text), REPLAY_STREAM_PIECE):
+            last = i + REPLAY_STREAM_PIECE >= len(text)
+            yield text[i:i + REPLAY_STREAM_PIECE], response.usage if last else None
+
+    def open_stream(self, request_key, api_key=None, **request):
+        if self.latency:
+            time.sleep(self.latency)
+        response = self._serve(request_key)
+        stream = LLMStream(self._pieces(response), response.headers)
+        stream.replayed = True
+        return stream
+
+    async def aopen_stream(self, request_key, api_key=None, **request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self._serve(request_key)
+
+        async def pieces():
+            for piece in self._pieces(response):
+                yield piece
+        stream = LLMStream(pieces(), response.headers)
+        stream.replayed = True
+        return stream
+
+_backend = None
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+def get_backend():
+    """
+    Backend selected by LLM_BACKEND: "groq" (default), "record" (groq, and
+    log each request next to its response) or "replay" (serve LLM_REPLAY_FILE).
+    Calls go through the rate-limit scheduler unless SCHEDULER=off.
+    """
+    global _backend
+    if _backend is None:
+        mode = os.getenv("LLM_BACKEND", "groq")
+        scheduled = os.getenv("SCHEDULER", "on") != "off"
+        if mode == "replay":
+            inner = ReplayBackend(
+                os.getenv("LLM_REPLAY_FILE", "logs/llm_responses.jsonl"),
+                latency=float(os.getenv("REPLAY_LATENCY", 0)),
+                error_rate=float(os.getenv("REPLAY_ERROR_RATE", 0)),
+            )
+        elif mode in ("groq", "record"):
+            inner = GroqBackend(max_retries=0 if scheduled else None)
+        else:
+            raise ValueError(f"Unknown LLM_BACKEND: {mode}")
+        _backend = SchedulingBackend(inner, scheduler_from_env()) if scheduled else inner
+        if mode == "record":
+            _backend = RecordingBackend(_backend)
+    return _backend
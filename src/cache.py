@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+EVICT_EVERY = 100
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of LLM outputs, stored in SQLite.
+    Entries older than `max_age` seconds are dropped, and the least recently
+    used entries are dropped once the stored outputs exceed `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes, max_age):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+        self.evict()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.max_age:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            return value
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self.conn.commit()
+            self._puts += 1
+            due = self._puts % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            expired = self.conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,)
+            ).rowcount
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                for key, size in self.conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    evicted += 1
+            self.conn.commit()
+        if expired or evicted:
+            logging.info(f"Response cache evicted {expired} expired and {evicted} least recently used entries\n")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+_cache = None
+_enabled = os.getenv("CACHE_ENABLED", "1") != "0"
+_refresh = False
+
+def configure(enabled=True, refresh=False):
+    """Set the cache mode for this process (see --no-cache / --refresh-cache)."""
+    global _enabled, _refresh
+    _enabled = enabled
+    _refresh = refresh
+
+def get_cache():
+    global _cache
+    if not _enabled:
+        return None
+    if _cache is None:
+        _cache = ResponseCache(
+            os.getenv("CACHE_PATH", "cache/responses.sqlite"),
+            max_bytes=int(float(os.getenv("CACHE_MAX_MB", 1024)) * 1024 * 1024),
+            max_age=float(os.getenv("CACHE_MAX_AGE_DAYS", 30)) * 24 * 3600,
+        )
+    return _cache
+
+def make_key(model, payload, params):
+    """Hash of the model, the prompt (or image bytes) and the sampling parameters."""
+    h = hashlib.sha256()
+    h.update(json.dumps({"model": model, "params": params}, sort_keys=True).encode("utf-8"))
+    h.update(b"\0")
+    h.update(payload if isinstance(payload, bytes) else json.dumps(payload, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+def lookup(key):
+    cache = get_cache()
+    if cache is None or _refresh:
+        return None
+    return cache.get(key)
+
+def store(key, value):
+    cache = get_cache()
+    if cache is None or not value:
+        return
+    cache.put(key, value)
@@ -0,0 +1,135 @@
+import re
+from rdflib import Graph, URIRef, RDF, RDFS, OWL
+from src.validator import local_name, is_standard, CLASS_TYPES, PROPERTY_TYPES
+
+CLASS_POSITIONS = {RDF.type, RDFS.subClassOf, RDFS.domain, RDFS.range, OWL.equivalentClass, OWL.disjointWith}
+EQUIVALENCE = {"class": OWL.equivalentClass, "property": OWL.equivalentProperty, "other": OWL.sameAs}
+
+def split_identifier(name):
+    """'hasFirstName' / 'has_first-name' / 'Has First Name' -> ['has', 'first', 'name']"""
+    name = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", name)
+    name = re.sub(r"([A-Z]+)([A-Z][a-z])", r"\1 \2", name)
+    return [w for w in re.split(r"[^A-Za-z0-9]+", name.casefold()) if w]
+
+# words the suffix rules below would get wrong
+INVARIANT = {
+    "news", "series", "species", "means", "corps", "chassis", "diabetes", "measles", "headquarters", "crossroads",
+    "physics", "mathematics", "economics", "politics", "ethics", "statistics", "logistics", "electronics",
+    "genetics", "linguistics", "athletics", "gymnastics", "lens", "gas", "bias", "atlas", "canvas", "chaos",
+    "cosmos", "ethos", "pathos", "alias", "axes", "bases",
+}
+IRREGULAR = {
+    "people": "person", "children": "child", "men": "man", "women": "woman", "mice": "mouse", "feet": "foot",
+    "teeth": "tooth", "geese": "goose", "criteria": "criterion", "phenomena": "phenomenon", "indices": "index",
+    "matrices": "matrix", "vertices": "vertex", "analyses": "analysis", "theses": "thesis", "crises": "crisis",
+    "diagnoses": "diagnosis", "hypotheses": "hypothesis", "syntheses": "synthesis",
+}
+# plurals of words ending in -ie or -che, which lose only the "s"
+PLAIN_S_PLURALS = {
+    "movies", "cookies", "calories", "zombies", "rookies", "brownies", "selfies", "smoothies", "goalies",
+    "caches", "niches", "headaches", "avalanches", "moustaches", "mustaches", "psyches", "cliches", "quiches",
+}
+
+def singularize(word):
+    if word in INVARIANT:
+        return word
+    if word in IRREGULAR:
+        return IRREGULAR[word]
+    if word in PLAIN_S_PLURALS:
+        return word[:-1]
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "ches", "shes", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def normalize(text):
+    return "".join(singularize(w) for w in split_identifier(text))
+
+class EntityIndex:
+    """
+    Maps normalized names (case-folded, singularized, namespace-agnostic local
+    names and rdfs:labels) to the first term registered under them, per kind
+    of term (class, property, other). Lookups are dict lookups, so
+    canonicalizing a fragment costs O(1) per term regardless of ontology size.
+    """
+
+    def __init__(self):
+        self.terms = {}
+
+    def _keys(self, graph, term):
+        keys = {normalize(local_name(term))}
+        for label in graph.objects(term, RDFS.label):
+            keys.add(normalize(str(label)))
+        keys.discard("")
+        return keys
+
+    def _kinds(self, graph):
+        kinds = {}
+        for s, p, o in graph:
+            if isinstance(p, URIRef) and not is_standard(p):
+                kinds[p] = "property"
+            if p in CLASS_POSITIONS and isinstance(o, URIRef) and not is_standard(o):
+                kinds.setdefault(o, "class")
+            if p == RDF.type and isinstance(s, URIRef):
+                if o in CLASS_TYPES:
+                    kinds[s] = "class"
+                elif o in PROPERTY_TYPES:
+                    kinds[s] = "property"
+        for term in graph.subjects():
+            if isinstance(term, URIRef) and not is_standard(term):
+                kinds.setdefault(term, "other")
+        return kinds
+
+    def add_graph(self, graph):
+        # sorted, so which of two duplicates becomes canonical does not depend on triple order
+        for term, kind in sorted(self._kinds(graph).items()):
+            for key in self._keys(graph, term):
+                self.terms.setdefault((kind, key), term)
+
+    def canonical_mapping(self, graph):
+        """
+        {incoming term: (canonical term, kind)} for the terms of `graph` that
+        duplicate known ones, or an earlier term (in sorted order) of `graph`
+        itself.
+        """
+        mapping = {}
+        # keys of the terms of this graph that are not duplicates themselves
+        own = {}
+        for term, kind in sorted(self._kinds(graph).items()):
+            keys = sorted(self._keys(graph, term))
+            for key in keys:
+                canonical = self.terms.get((kind, key)) or own.get((kind, key))
+                if canonical is not None and canonical != term:
+                    mapping[term] = (canonical, kind)
+                    break
+            else:
+                for key in keys:
+                    own.setdefault((kind, key), term)
+        return mapping
+
+    def canonicalize(self, graph, mode="rewrite"):
+        """
+        Returns (graph, number of duplicate terms). In "rewrite" mode duplicate
+        terms are replaced by their canonical term; in "link" mode they are kept
+        and linked to it with owl:equivalentClass / equivalentProperty / sameAs.
+        """
+        mapping = self.canonical_mapping(graph)
+        if not mapping:
+            return graph, 0
+        result = Graph()
+        for prefix, namespace in graph.namespaces():
+            result.bind(prefix, namespace)
+        if mode == "link":
+            result += graph
+            for term, (canonical, kind) in mapping.items():
+                result.add((term, EQUIVALENCE[kind], canonical))
+        else:
+            rewrite = {term: canonical for term, (canonical, _) in mapping.items()}
+            for s, p, o in graph:
+                result.add((rewrite.get(s, s), rewrite.get(p, p), rewrite.get(o, o)))
+        return result, len(mapping)
@@ -0,0 +1,273 @@
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import Counter
+from PIL import Image
+from src.metrics import metrics
+
+MERSENNE_PRIME = (1 << 61) - 1
+WORD = re.compile(r"\w+")
+
+def _content(image):
+    """The greyscale image cropped to the box around its dark pixels, so page margins do not dominate the hash."""
+    grey = image.convert("L")
+    box = grey.point(lambda p: 255 if p < 128 else 0).getbbox()
+    return grey.crop(box) if box else grey
+
+def dhash(image, size=16):
+    """
+    Difference hash (size x size bits) of an image, path or PIL image: the
+    content box, in greyscale, shrunk to (size+1) x size, one bit per
+    horizontally adjacent pair. Rescans, recompressions and small edits
+    change only a few bits; without the crop, text pages with the same
+    layout differ in only a few bits too.
+    """
+    if isinstance(image, Image.Image):
+        small = _content(image).resize((size + 1, size), Image.LANCZOS)
+    else:
+        with Image.open(image) as img:
+            small = _content(img).resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def shingles(text, k=5):
+    """Word k-grams of the lower-cased text; a text shorter than k words is one shingle."""
+    words = WORD.findall(text.lower())
+    if len(words) <= k:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+_permutations = {}
+
+def _permutation_params(num_perm):
+    if num_perm not in _permutations:
+        rng = random.Random(num_perm)
+        _permutations[num_perm] = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                                   for _ in range(num_perm)]
+    return _permutations[num_perm]
+
+def minhash(text, num_perm=128):
+    """MinHash signature (num_perm 32-bit values) of the text's word shingles."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+              for s in shingles(text)]
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) & 0xFFFFFFFF
+                 for a, b in _permutation_params(num_perm))
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+def lsh_bands(signature, bands):
+    """The signature cut into `bands` band keys; similar signatures share at least one with high probability."""
+    rows = len(signature) // bands
+    return [struct.pack(f">{rows}I", *signature[i * rows:(i + 1) * rows]) for i in range(bands)]
+
+def image_bands(value, distance, bits):
+    """The `bits`-bit hash cut into distance+1 bands: hashes within `distance` bits share at least one."""
+    bands = distance + 1
+    width = bits // bands
+    return [(value >> (i * width)) & ((1 << width) - 1) if i < bands - 1 else value >> (i * width)
+            for i in range(bands)]
+
+def result_hash(text):
+    # newlines as a text-mode read gives them back
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class DedupIndex:
+    """
+    Persistent index (SQLite) of page images and text chunks already
+    processed, with the file holding their result (the OCR text of an image,
+    the ontology fragment of a chunk) and the hash of that result. Files are
+    rewritten when their item is processed again, so a result is only reused
+    while its file still holds what was indexed. Images are found by
+    difference hash (`image_hash_size` squared bits) within `image_distance`
+    bits, chunks by MinHash with locality-sensitive hashing over `bands`
+    bands and an estimated Jaccard similarity of at least `chunk_threshold`.
+
+    The default `image_distance` of 24 bits comes from pages re-rendered as
+    rescans (rotated up to 0.5 degrees, scaled to 50-100%, blurred, JPEG
+    quality 40-90). They stayed within 4-35 bits of the original, with a
+    median of 17, and 86% of them were within 24. Distinct text pages with
+    the same layout were at least 63 bits apart.
+    """
+
+    def __init__(self, path, chunk_threshold=0.9, image_distance=24, image_hash_size=16, num_perm=128, bands=16):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.chunk_threshold = chunk_threshold
+        self.image_distance = image_distance
+        self.image_hash_size = image_hash_size
+        self.image_bits = image_hash_size * image_hash_size
+        self.num_perm = num_perm
+        self.bands = bands
+        # LLM calls avoided in this process, by stage
+        self.avoided = Counter()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                result TEXT NOT NULL,
+                result_hash TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                UNIQUE (kind, key)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS bands (
+                kind TEXT NOT NULL,
+                band INTEGER NOT NULL,
+                value BLOB NOT NULL,
+                item_id INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (kind, band, value)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS bands_item ON bands (item_id)")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(items)")]
+        if "result_hash" not in columns:
+            # indexes written before results were hashed: their entries never verify, so they are not reused
+            self.conn.execute("ALTER TABLE items ADD COLUMN result_hash TEXT NOT NULL DEFAULT ''")
+        self.conn.commit()
+
+    def chunk_signature(self, text):
+        return minhash(text, self.num_perm)
+
+    def image_hash(self, image):
+        return dhash(image, self.image_hash_size)
+
+    def _candidates(self, kind, band_values, exclude_key):
+        rows = {}
+        for band, value in enumerate(band_values):
+            for item_id, key, signature, result, digest in self.conn.execute(
+                "SELECT items.id, items.key, items.signature, items.result, items.result_hash FROM bands "
+                "JOIN items ON items.id = bands.item_id "
+                "WHERE bands.kind = ? AND bands.band = ? AND bands.value = ?", (kind, band, value)
+            ):
+                if key != exclude_key:
+                    rows[item_id] = (key, signature, result, digest)
+        return rows.values()
+
+    @staticmethod
+    def _read_result(result, digest):
+        """The text in the result file, if it is still the indexed result; else None."""
+        try:
+            with open(result, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        return text if result_hash(text) == digest else None
+
+    def _add(self, kind, key, signature, band_values, result, text):
+        with self._lock:
+            old = self.conn.execute("SELECT id FROM items WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            if old:
+                self.conn.execute("DELETE FROM bands WHERE item_id = ?", old)
+                self.conn.execute("DELETE FROM items WHERE id = ?", old)
+            item_id = self.conn.execute(
+                "INSERT INTO items (kind, key, signature, result, result_hash, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, signature, result, result_hash(text), time.time()),
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT INTO bands (kind, band, value, item_id) VALUES (?, ?, ?, ?)",
+                [(kind, band, value, item_id) for band, value in enumerate(band_values)],
+            )
+            self.conn.commit()
+
+    def _best(self, matches):
+        """The first (key, result text, score) of `matches` (best first) whose result file is unchanged."""
+        for key, result, digest, score in matches:
+            text = self._read_result(result, digest)
+            if text is not None:
+                return key, text, score
+        return None
+
+    def find_chunk(self, signature, exclude_key=None):
+        """(key, fragment, similarity) of the most similar indexed chunk whose fragment is unchanged, or None."""
+        with self._lock:
+            candidates = self._candidates("chunk", lsh_bands(signature, self.bands), exclude_key)
+        matches = []
+        for key, blob, result, digest in candidates:
+            score = similarity(signature, struct.unpack(f">{len(blob) // 4}I", blob))
+            if score >= self.chunk_threshold:
+                matches.append((key, result, digest, score))
+        return self._best(sorted(matches, key=lambda m: -m[3]))
+
+    def add_chunk(self, key, signature, result, fragment):
+        """Indexes a chunk whose `fragment` was saved to the file `result`."""
+        self._add("chunk", key, struct.pack(f">{len(signature)}I", *signature),
+                  lsh_bands(signature, self.bands), result, fragment)
+
+    def find_image(self, value, exclude_key=None):
+        """(key, OCR text, distance in bits) of the closest indexed image whose text file is unchanged, or None."""
+        with self._lock:
+            band_values = image_bands(value, self.image_distance, self.image_bits)
+            candidates = self._candidates("image", band_values, exclude_key)
+        matches = []
+        for key, blob, result, digest in candidates:
+            distance = hamming(value, int.from_bytes(blob, "big"))
+            if distance <= self.image_distance:
+                matches.append((key, result, digest, distance))
+        return self._best(sorted(matches, key=lambda m: m[3]))
+
+    def add_image(self, key, value, result, text):
+        """Indexes a page image whose OCR `text` was saved to the file `result`."""
+        self._add("image", key, value.to_bytes(self.image_bits // 8, "big"),
+                  image_bands(value, self.image_distance, self.image_bits), result, text)
+
+    def report(self):
+        """One line on the calls avoided, or None if there were none."""
+        if not self.avoided:
+            return None
+        return "Near-duplicates skipped: " + ", ".join(
+            f"{count} {stage} calls" for stage, count in sorted(self.avoided.items()))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+_index = None
+_enabled = os.getenv("DEDUP", "1") != "0"
+
+def configure(enabled=True):
+    """Turn near-duplicate detection on or off for this process (see --no-dedup)."""
+    global _enabled
+    _enabled = enabled
+
+def get_index():
+    global _index
+    if not _enabled:
+        return None
+    if _index is None:
+        _index = DedupIndex(
+            os.getenv("DEDUP_PATH", "cache/dedup.sqlite"),
+            chunk_threshold=float(os.getenv("DEDUP_CHUNK_THRESHOLD", 0.9)),
+            image_distance=int(os.getenv("DEDUP_IMAGE_DISTANCE", 24)),
+        )
+    return _index
+
+def record_avoided(stage):
+    """Counts an LLM call of `stage` ("ocr" or "generation") that a near-duplicate made unnecessary."""
+    index = get_index()
+    if index is not None:
+        index.avoided[stage] += 1
+    metrics.inc("llm_calls_avoided", 1, stage)
@@ -1,9 +1,61 @@
+import hashlib
 import os
 
-def load_documents(folder_path):
+# leading bytes of the binary formats the pipeline reads
+MAGIC = [
+    (b"%PDF-", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+]
+
+# text files are only taken as documents with one of these extensions (or none):
+# Turtle, JSON, CSV and the like are UTF-8 text too, but not documents to generate from
+TEXT_EXTENSIONS = ("", ".txt", ".text")
+
+def detect_type(path):
+    """
+    "pdf", "png" or "jpeg" by magic bytes whatever the extension, "text" for
+    UTF-8 text without NUL bytes and an extension in TEXT_EXTENSIONS, or None.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(4096)
+    except OSError:
+        return None
+    for magic, kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    if b"\x00" in head or os.path.splitext(path)[1].lower() not in TEXT_EXTENSIONS:
+        return None
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # the 4 KiB cut may split a multi-byte character
+        if e.start < len(head) - 3:
+            return None
+    return "text"
+
+def output_name(path, root):
+    """
+    Name of what is derived from `path`, a file under `root`, in the flat
+    output folders (data/processed, data/images, data/ontology_fragments):
+    its base name, plus a short hash of its subfolder if it is in one, so
+    that files of the same name in different subfolders stay apart.
+    """
+    folder = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(root))
+    name = os.path.basename(path)
+    if folder == os.curdir:
+        return name
+    stem, extension = os.path.splitext(name)
+    digest = hashlib.sha1(folder.replace(os.sep, "/").encode("utf-8")).hexdigest()[:8]
+    return f"{stem}_{digest}{extension}"
+
+def load_documents(folder_path, recursive=False):
+    """Files in `folder_path` (and, if `recursive`, its subfolders), in sorted order; hidden files are skipped."""
     files = []
-    for filename in os.listdir(folder_path):
-        path = os.path.join(folder_path, filename)
-        if os.path.isfile(path):
-            files.append(path)
-    return files
\ No newline at end of file
+    for root, dirs, filenames in os.walk(folder_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".")) if recursive else []
+        for filename in sorted(filenames):
+            if not filename.startswith("."):
+                files.append(os.path.join(root, filename))
+    return files
@@ -0,0 +1,127 @@
+import os
+import re
+from rdflib import Graph
+
+SNAPSHOT_PREFIX = re.compile(r"^#\s*@prefix\s+([\w.-]*):\s*<([^>]*)>")
+
+class KeepLabels(dict):
+    """
+    bnode_context for the N-Triples parser that keeps blank node labels as
+    they are, so journal lines written after a load still refer to the same
+    blank nodes.
+    """
+
+    def get(self, key, default=None):
+        return key
+
+def _nt_lines(triples):
+    graph = Graph()
+    for triple in triples:
+        graph.add(triple)
+    return [line for line in graph.serialize(format="nt").splitlines() if line]
+
+class OntologyJournal:
+    """
+    Durable state of an in-memory ontology in `directory`: an N-Triples
+    snapshot (`snapshot.nt`, prefix bindings in its leading comment lines)
+    and an append-only journal (`journal.log`) of the changes made since.
+    Each journal line is one operation:
+
+        A <N-Triples statement>    triple added
+        D <N-Triples statement>    triple removed
+        P <prefix> <namespace>     prefix bound
+        C                          graph cleared
+
+    Replaying the journal onto the snapshot it was written against, or onto
+    a newer snapshot, gives the same graph: every operation is idempotent and
+    the last one on a triple wins.
+    """
+
+    def __init__(self, directory, snapshot_lines=100000):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "snapshot.nt")
+        self.journal_path = os.path.join(directory, "journal.log")
+        self.snapshot_lines = snapshot_lines
+        self.lines = 0
+        self.prefixes = {}
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path)
+
+    def load(self, graph):
+        """Loads the snapshot into `graph` and replays the journal. Returns the number of journal lines replayed."""
+        labels = KeepLabels()
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            for line in f:
+                match = SNAPSHOT_PREFIX.match(line)
+                if not match:
+                    break
+                self.prefixes[match.group(1)] = match.group(2)
+        graph.parse(self.snapshot_path, format="nt", bnode_context=labels)
+
+        self.lines = 0
+        if os.path.exists(self.journal_path):
+            batch_op, batch = None, []
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    op, _, arg = line.rstrip("\n").partition(" ")
+                    if not op:
+                        continue
+                    self.lines += 1
+                    if op != batch_op:
+                        self._apply(graph, batch_op, batch, labels)
+                        batch_op, batch = op, []
+                    batch.append(arg)
+            self._apply(graph, batch_op, batch, labels)
+
+        for prefix, namespace in self.prefixes.items():
+            graph.bind(prefix, namespace, override=True)
+        return self.lines
+
+    def _apply(self, graph, op, args, labels):
+        if op == "P":
+            for arg in args:
+                prefix, _, namespace = arg.partition(" ")
+                self.prefixes[prefix] = namespace.strip("<>")
+        elif op == "C":
+            graph.remove((None, None, None))
+        elif op in ("A", "D"):
+            batch = Graph()
+            batch.parse(data="\n".join(args), format="nt", bnode_context=labels)
+            if op == "A":
+                graph.addN((s, p, o, graph) for s, p, o in batch)
+            else:
+                for triple in batch:
+                    graph.remove(triple)
+
+    def append(self, added=(), removed=(), cleared=False, prefixes=None):
+        """Journals one change: an optional clear, then removals, then additions, plus any new prefix bindings."""
+        lines = ["C"] if cleared else []
+        for prefix, namespace in (prefixes or {}).items():
+            if self.prefixes.get(prefix) != str(namespace):
+                self.prefixes[prefix] = str(namespace)
+                lines.append(f"P {prefix} <{namespace}>")
+        lines += ["D " + line for line in _nt_lines(removed)]
+        lines += ["A " + line for line in _nt_lines(added)]
+        if not lines:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self.lines += len(lines)
+
+    def needs_snapshot(self):
+        return self.lines >= self.snapshot_lines
+
+    def snapshot(self, graph):
+        """Writes `graph` as the new snapshot (atomically) and starts an empty journal."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.prefixes = {prefix: str(namespace) for prefix, namespace in graph.namespaces()}
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for prefix, namespace in self.prefixes.items():
+                f.write(f"# @prefix {prefix}: <{namespace}> .\n")
+            f.write(graph.serialize(format="nt"))
+        os.replace(tmp, self.snapshot_path)
+        open(self.journal_path, "w", encoding="utf-8").close()
+        self.lines = 0
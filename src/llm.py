@@ -1,56 +1,232 @@
-from groq import Groq, GroqError
+from groq import GroqError
 import os
 from dotenv import load_dotenv
 import logging
 from src.responseLogger import logResponse
+from src.backends import get_backend, LLMResponse
+from src.scheduler import QuotaExhaustedError, error_headers
+from src import cache
+from src.metrics import metrics
+from src.turtle_stream import TurtleStreamGuard, StreamAbort
+import time
 
 load_dotenv()
-client = Groq()
 
-def run_llm(prompt):
+SAMPLING_PARAMS = dict(
+    max_tokens=5000,
+    temperature=0.5,
+    top_p=0.9,
+    frequency_penalty=0,
+    presence_penalty=0
+)
 
-    try:
-        response = client.chat.completions.create(
-            model=os.getenv("GROQ_MODEL"),
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=5000,
-            temperature=0.5,
-            top_p=0.9,
-            frequency_penalty=0,
-            presence_penalty=0
-        )
-        logResponse({
-            "status": "success",
-            "headers": dict(response.headers) if hasattr(response, "headers") else None,
-            "output": response.choices[0].message.content.strip()
-        })
-        return response.choices[0].message.content.strip()
+def _request(prompt):
+    return dict(
+        model=os.getenv("GROQ_MODEL"),
+        messages=[{"role": "user", "content": prompt}],
+        **SAMPLING_PARAMS
+    )
+
+def request_key(request, params):
+    """Identifies a request by model, messages and sampling parameters (cache and replay key)."""
+    return cache.make_key(request["model"], request["messages"], params)
+
+def streaming_enabled():
+    """LLM_STREAM=1: generation and repair stream their output through a TurtleStreamGuard."""
+    return os.getenv("LLM_STREAM", "0") == "1"
+
+def _stream_guard():
+    return TurtleStreamGuard(
+        max_repeats=int(os.getenv("STREAM_MAX_REPEATS", 3)),
+        max_statement_chars=int(os.getenv("STREAM_MAX_STATEMENT_CHARS", 4000)),
+        max_bad_statements=int(os.getenv("STREAM_MAX_BAD_STATEMENTS", 3)),
+    )
+
+def log_success(response, key, **extra):
+    if response.replayed:
+        # replay reads the response log: appending to it would duplicate its own source
+        return
+    record = {
+        "status": "success",
+        "request_key": response.fallback_key or key,
+        "headers": response.headers,
+        "usage": response.usage,
+        "output": response.content,
+        **extra
+    }
+    if response.fallback_model is not None:
+        record["model"] = response.fallback_model
+    if response.request is not None:
+        record["request"] = response.request
+    logResponse(record)
+
+def store_response(key, response):
+    """Caches the output under the request's key, unless a fallback model produced it."""
+    if response.fallback_model is None:
+        cache.store(key, response.content)
 
-    except GroqError as e:
-        error_info = str(e)
-        headers = getattr(e, "headers", None)
+def _handle_error(e, stage="llm"):
+    """
+    Logs a request that failed after the scheduler's retries and returns "",
+    so the caller leaves the item pending for the next run.
+    """
+    metrics.inc("errors", 1, stage)
+    error_info = str(e)
+    headers = error_headers(e)
+
+    if isinstance(e, GroqError):
         logResponse({
             "status": "groq_error",
             "error": error_info,
-            "headers": dict(headers) if headers else None,
+            "headers": headers or None,
         })
 
-        if "quota" in str(e).lower() or "exceeded" in str(e).lower() or "limit" in str(e).lower():
+        if isinstance(e, QuotaExhaustedError) or "quota" in error_info.lower():
             print("⚠️ Quota exhausted")
             logging.error("⚠️ Quota exhausted\n")
-            return ""
-        
+        else:
+            print(f"LLM request failed: {e}")
+            logging.error(f"LLM request failed: {e}\n")
+        return ""
+
+    logResponse({
+        "status": "exception",
+        "error": error_info,
+        "headers": headers or None,
+    })
+
+    print(f"Error generating ontology fragment: {e}")
+    logging.error(f"Error generating ontology fragment: {e}\n")
+    return ""
+
+def _lookup_cache(key, stage):
+    cached = cache.lookup(key)
+    metrics.inc("cache_hits" if cached is not None else "cache_misses", 1, stage)
+    return cached
+
+def run_llm(prompt, stage="llm"):
+    """`stage` labels the call in the run metrics (e.g. generation, repair, validation)."""
+    request = _request(prompt)
+    key = request_key(request, SAMPLING_PARAMS)
+    cached = _lookup_cache(key, stage)
+    if cached is not None:
+        return cached
+
+    try:
+        metrics.inc("bytes_uploaded", len(prompt.encode("utf-8")), stage)
+        start = time.perf_counter()
+        response = get_backend().complete(key, **request)
+        metrics.record_response(stage, time.perf_counter() - start, response)
+        log_success(response, key)
+        store_response(key, response)
+        return response.content
 
     except Exception as e:
-        error_info = str(e)
-        headers = getattr(e, "headers", None)
-        logResponse({
-            "status": "exception",
-            "error": error_info,
-            "headers": dict(headers) if headers else None,
-        })
+        return _handle_error(e, stage)
 
-        print(f"Error generating ontology fragment: {e}")
-        logging.error(f"Error generating ontology fragment: {e}\n")
-        return ""
+async def run_llm_async(prompt, stage="generation"):
+    request = _request(prompt)
+    key = request_key(request, SAMPLING_PARAMS)
+    cached = _lookup_cache(key, stage)
+    if cached is not None:
+        return cached
+
+    try:
+        metrics.inc("bytes_uploaded", len(prompt.encode("utf-8")), stage)
+        start = time.perf_counter()
+        response = await get_backend().acomplete(key, **request)
+        metrics.record_response(stage, time.perf_counter() - start, response)
+        log_success(response, key)
+        store_response(key, response)
+        return response.content
+
+    except Exception as e:
+        return _handle_error(e, stage)
+
+def _log_abort(key, stage, attempt, guard, abort):
+    metrics.inc("stream_aborts", 1, stage)
+    metrics.inc("stream_aborted_chars", len(guard.text), stage)
+    logResponse({
+        "status": "aborted",
+        "request_key": key,
+        "reason": abort.reason,
+        "attempt": attempt,
+        "output": guard.text,
+    })
+    print(f"Aborted streamed output ({abort.reason}), attempt {attempt + 1}")
+    logging.warning(f"Aborted streamed {stage} output ({abort.reason}), attempt {attempt + 1}\n")
+
+def _finish_stream(stream, guard, key, stage, start):
+    graph = guard.finish()
+    response = LLMResponse(guard.text.strip(), stream.headers, stream.usage, stream.request)
+    response.replayed = stream.replayed
+    response.fallback_model = stream.fallback_model
+    response.fallback_key = stream.fallback_key
+    metrics.record_response(stage, time.perf_counter() - start, response)
+    log_success(response, key, streamed=True)
+    store_response(key, response)
+    return response.content, graph
+
+def run_llm_stream(prompt, stage="llm"):
+    """
+    Streams a Turtle completion through a TurtleStreamGuard, aborting and
+    retrying (up to STREAM_RETRIES times) as soon as the output degenerates.
+    Returns (text, graph): `graph` holds the statements parsed while the
+    output streamed in, or is None if the text must be parsed as a whole.
+    If every attempt is aborted, returns ("", None) like a failed request, so
+    the caller leaves the chunk pending instead of keeping a partial fragment.
+    """
+    request = _request(prompt)
+    key = request_key(request, SAMPLING_PARAMS)
+    cached = _lookup_cache(key, stage)
+    if cached is not None:
+        return cached, None
+
+    metrics.inc("bytes_uploaded", len(prompt.encode("utf-8")), stage)
+    for attempt in range(int(os.getenv("STREAM_RETRIES", 2)) + 1):
+        guard = _stream_guard()
+        try:
+            start = time.perf_counter()
+            stream = get_backend().open_stream(key, **request)
+            try:
+                for delta in stream:
+                    if not guard.text:
+                        metrics.observe("llm_first_token_seconds", time.perf_counter() - start, stage)
+                    guard.feed(delta)
+            finally:
+                stream.close()
+            return _finish_stream(stream, guard, key, stage, start)
+        except StreamAbort as abort:
+            _log_abort(key, stage, attempt, guard, abort)
+        except Exception as e:
+            return _handle_error(e, stage), None
+    metrics.inc("errors", 1, stage)
+    return "", None
+
+async def run_llm_stream_async(prompt, stage="generation"):
+    request = _request(prompt)
+    key = request_key(request, SAMPLING_PARAMS)
+    cached = _lookup_cache(key, stage)
+    if cached is not None:
+        return cached, None
 
+    metrics.inc("bytes_uploaded", len(prompt.encode("utf-8")), stage)
+    for attempt in range(int(os.getenv("STREAM_RETRIES", 2)) + 1):
+        guard = _stream_guard()
+        try:
+            start = time.perf_counter()
+            stream = await get_backend().aopen_stream(key, **request)
+            try:
+                async for delta in stream:
+                    if not guard.text:
+                        metrics.observe("llm_first_token_seconds", time.perf_counter() - start, stage)
+                    guard.feed(delta)
+            finally:
+                await stream.aclose()
+            return _finish_stream(stream, guard, key, stage, start)
+        except StreamAbort as abort:
+            _log_abort(key, stage, attempt, guard, abort)
+        except Exception as e:
+            return _handle_error(e, stage), None
+    metrics.inc("errors", 1, stage)
+    return "", None
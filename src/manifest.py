@@ -0,0 +1,77 @@
+import atexit
+import hashlib
+import json
+import os
+import time
+
+class Manifest:
+    """
+    Records a content hash and a completion status for every item the pipeline
+    produces (raw files, page images, OCR text, chunk fragments), so that an
+    interrupted run can resume without redoing finished work.
+
+    Marks are written out every `save_every` marks (MANIFEST_SAVE_EVERY) and
+    on flush(), which the pipeline calls at stage boundaries and at exit, so
+    a run does not rewrite the whole file per item. A crash loses at most
+    the last unsaved marks; their outputs are on disk and their LLM
+    responses in the cache, so redoing them is cheap.
+    """
+
+    def __init__(self, path="data/manifest.json", save_every=None):
+        # absolute, so the flush at exit still finds it after a chdir
+        self.path = os.path.abspath(path)
+        self.items = {}
+        self.save_every = save_every or int(os.getenv("MANIFEST_SAVE_EVERY", 100))
+        self._unsaved = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.items = json.load(f).get("items", {})
+        atexit.register(self.flush)
+
+    def get(self, kind, key):
+        return self.items.get(kind, {}).get(key)
+
+    def is_done(self, kind, key, content_hash):
+        entry = self.get(kind, key)
+        return entry is not None and entry["status"] == "done" and entry["hash"] == content_hash
+
+    def mark(self, kind, key, content_hash, status="done", **info):
+        self.items.setdefault(kind, {})[key] = {
+            "hash": content_hash,
+            "status": status,
+            "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+            **info
+        }
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def update(self, kind, key, **info):
+        """Changes the info recorded with an entry, keeping its hash and status."""
+        entry = self.get(kind, key)
+        info = {**{k: v for k, v in entry.items() if k not in ("hash", "status", "updated")}, **info}
+        self.mark(kind, key, entry["hash"], entry["status"], **info)
+
+    def flush(self):
+        """Writes the marks made since the last save, if any."""
+        if self._unsaved:
+            self.save()
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"items": self.items}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
@@ -0,0 +1,189 @@
+import contextvars
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+PREFIX = "ontology_"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+class Metrics:
+    """
+    Process-wide run metrics: time per pipeline stage, per-call latency
+    histograms, counters (tokens, bytes uploaded, retries, cache hits) and
+    gauges (last seen rate-limit headers). Stages listed in PROFILE_STAGES
+    (comma separated) are also profiled with cProfile.
+
+    Stages nest (merge inside generation, say). A stage's `seconds` is its
+    exclusive time, without the stages nested in it, so stage times add up
+    instead of double-counting; `inclusive_seconds` includes them. Nesting
+    follows the context, so a stage run through asyncio.to_thread() still
+    counts as nested in the stage that awaits it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stage_seconds = defaultdict(float)
+        self.stage_inclusive_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        # per context: time spent in the stages nested in each open stage
+        self._nesting = contextvars.ContextVar("metrics_nesting", default=None)
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.histograms = {}
+        self.profile_stages = {s.strip() for s in os.getenv("PROFILE_STAGES", "").split(",") if s.strip()}
+        self.profiles = {}
+        self._profiling = False
+
+    @contextmanager
+    def stage(self, name):
+        profiler = None
+        if name in self.profile_stages and not self._profiling:
+            profiler = self.profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profiler.enable()
+        nested = self._nesting.get()
+        if nested is None:
+            nested = []
+            self._nesting.set(nested)
+        nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            inner = nested.pop()
+            if nested:
+                nested[-1] += elapsed
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            with self._lock:
+                self.stage_seconds[name] += elapsed - inner
+                self.stage_inclusive_seconds[name] += elapsed
+                self.stage_calls[name] += 1
+
+    def inc(self, name, value=1, stage="", **labels):
+        """Adds to a counter; `labels` (e.g. fix="add_final_period") split it further."""
+        with self._lock:
+            self.counters[(name, stage, tuple(sorted(labels.items())))] += value
+
+    def set(self, name, value, stage=""):
+        with self._lock:
+            self.gauges[(name, stage)] = value
+
+    def observe(self, name, value, stage=""):
+        with self._lock:
+            self.histograms.setdefault((name, stage), Histogram()).observe(value)
+
+    def record_response(self, stage, latency, response):
+        """Latency, token usage and rate-limit headers of one LLM response."""
+        self.observe("llm_latency_seconds", latency, stage)
+        self.inc("llm_calls", 1, stage)
+        usage = response.usage or {}
+        self.inc("prompt_tokens", usage.get("prompt_tokens") or 0, stage)
+        self.inc("completion_tokens", usage.get("completion_tokens") or 0, stage)
+        for header, value in (response.headers or {}).items():
+            if header.lower().startswith("x-ratelimit-remaining"):
+                try:
+                    self.set(header.lower().replace("-", "_"), float(value))
+                except ValueError:
+                    pass
+
+    def summary(self):
+        with self._lock:
+            return {
+                "wall_seconds": time.time() - self.started,
+                "stages": {name: {"seconds": self.stage_seconds[name],
+                                  "inclusive_seconds": self.stage_inclusive_seconds[name],
+                                  "calls": self.stage_calls[name]}
+                           for name in sorted(self.stage_seconds)},
+                "counters": {_key(name, stage, labels): value
+                             for (name, stage, labels), value in sorted(self.counters.items())},
+                "gauges": {_key(name, stage): value
+                           for (name, stage), value in sorted(self.gauges.items())},
+                "histograms": {_key(name, stage): {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "mean": h.sum / h.count if h.count else 0.0,
+                    "buckets": {("+Inf" if b == float("inf") else str(b)): c for b, c in h.cumulative()},
+                } for (name, stage), h in sorted(self.histograms.items())},
+            }
+
+    def prometheus(self):
+        lines = []
+
+        def labels(stage, **extra):
+            pairs = ([f'stage="{stage}"'] if stage else []) + [f'{k}="{v}"' for k, v in extra.items()]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        with self._lock:
+            lines.append(f"# TYPE {PREFIX}stage_seconds_total counter")
+            for name in sorted(self.stage_seconds):
+                lines.append(f"{PREFIX}stage_seconds_total{labels(name)} {self.stage_seconds[name]}")
+            lines.append(f"# TYPE {PREFIX}stage_inclusive_seconds_total counter")
+            for name in sorted(self.stage_inclusive_seconds):
+                lines.append(f"{PREFIX}stage_inclusive_seconds_total{labels(name)} {self.stage_inclusive_seconds[name]}")
+            for counter in sorted({name for name, _, _ in self.counters}):
+                lines.append(f"# TYPE {PREFIX}{counter}_total counter")
+                for (name, stage, extra), value in sorted(self.counters.items()):
+                    if name == counter:
+                        lines.append(f"{PREFIX}{counter}_total{labels(stage, **dict(extra))} {value}")
+            for gauge in sorted({name for name, _ in self.gauges}):
+                lines.append(f"# TYPE {PREFIX}{gauge} gauge")
+                for (name, stage), value in sorted(self.gauges.items()):
+                    if name == gauge:
+                        lines.append(f"{PREFIX}{gauge}{labels(stage)} {value}")
+            for histogram in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}{histogram} histogram")
+                for (name, stage), h in sorted(self.histograms.items()):
+                    if name != histogram:
+                        continue
+                    for bound, count in h.cumulative():
+                        le = "+Inf" if bound == float("inf") else str(bound)
+                        lines.append(f"{PREFIX}{name}_bucket{labels(stage, le=le)} {count}")
+                    lines.append(f"{PREFIX}{name}_sum{labels(stage)} {h.sum}")
+                    lines.append(f"{PREFIX}{name}_count{labels(stage)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path="logs/metrics.json", prometheus_path="logs/metrics.prom"):
+        for path in (json_path, prometheus_path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(prometheus_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        for name, profiler in self.profiles.items():
+            profiler.dump_stats(os.path.join(os.path.dirname(json_path) or ".", f"profile_{name}.prof"))
+
+def _key(name, stage, labels=()):
+    """Summary key of a metric: name{stage,label=value,...}, or just the name."""
+    parts = ([stage] if stage else []) + [f"{k}={v}" for k, v in labels]
+    return f"{name}{{{','.join(parts)}}}" if parts else name
+
+metrics = Metrics()
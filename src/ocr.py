@@ -3,23 +3,106 @@ import io
 import os
 from PIL import Image
 from dotenv import load_dotenv
-from groq import Groq, GroqError
+from groq import GroqError
 import logging
 from src.responseLogger import logResponse
+from src.backends import get_backend
+from src.scheduler import QuotaExhaustedError, error_headers
+from src.llm import log_success, store_response
+from src import cache
+from src.metrics import metrics
+import time
 
 
 load_dotenv()
-client = Groq()
 
-def encode_image_to_base64(image_path):
-    with Image.open(image_path) as img:
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+PASS_THROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png"}
 
-def extract_text_from_image(image_path):
-    encoded_image = encode_image_to_base64(image_path)
+def _base64_size(n):
+    return 4 * ((n + 2) // 3)
 
+def _encode(img, fmt, quality):
+    buffered = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buffered, format="JPEG", quality=quality, optimize=True)
+    else:
+        img.save(buffered, format="PNG", optimize=True)
+    return buffered.getvalue()
+
+def _fit_to_budget(img, max_bytes, max_pixels, min_quality):
+    """Downscale to the pixel budget, then trade JPEG quality and resolution for size."""
+    if img.width * img.height > max_pixels:
+        scale = (max_pixels / (img.width * img.height)) ** 0.5
+        img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
+
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("L" if img.mode in ("1", "LA", "I", "I;16") else "RGB")
+
+    # few colours (line art, screenshots, bilevel scans) compress better and stay sharper as PNG
+    if img.getcolors(maxcolors=256) is not None:
+        data = _encode(img, "PNG", None)
+        if _base64_size(len(data)) <= max_bytes:
+            return data, "PNG", img.size
+
+    quality = int(os.getenv("OCR_JPEG_QUALITY", 85))
+    while True:
+        data = _encode(img, "JPEG", quality)
+        if _base64_size(len(data)) <= max_bytes or (quality <= min_quality and min(img.size) <= 256):
+            return data, "JPEG", img.size
+        if quality > min_quality:
+            quality = max(min_quality, quality - 10)
+        else:
+            img = img.resize((max(1, int(img.width * 0.75)), max(1, int(img.height * 0.75))), Image.LANCZOS)
+
+def encode_image_payload(image):
+    """
+    Encodes an image for the vision model within a byte and pixel budget.
+    `image` is either a path or an already-loaded PIL image (e.g. a page from
+    iter_pdf_pages). JPEG/PNG files that already fit are sent unchanged.
+    Returns (base64 string, mime type, stats).
+    """
+    max_bytes = int(os.getenv("OCR_MAX_BYTES", 3_500_000))
+    max_pixels = int(os.getenv("OCR_MAX_PIXELS", 4_000_000))
+    min_quality = int(os.getenv("OCR_MIN_JPEG_QUALITY", 55))
+
+    if isinstance(image, Image.Image):
+        source_bytes = image.width * image.height * len(image.getbands())
+        data, fmt, size = _fit_to_budget(image, max_bytes, max_pixels, min_quality)
+    else:
+        source_bytes = os.path.getsize(image)
+        with Image.open(image) as img:
+            if (img.format in PASS_THROUGH_FORMATS
+                    and _base64_size(source_bytes) <= max_bytes
+                    and img.width * img.height <= max_pixels):
+                fmt, size = img.format, img.size
+                with open(image, "rb") as f:
+                    data = f.read()
+            else:
+                img.load()
+                data, fmt, size = _fit_to_budget(img, max_bytes, max_pixels, min_quality)
+
+    stats = {
+        "source_bytes": source_bytes,
+        "payload_bytes": len(data),
+        "bytes_saved": source_bytes - len(data),
+        "size": f"{size[0]}x{size[1]}",
+        "mime": PASS_THROUGH_FORMATS[fmt],
+    }
+    return base64.b64encode(data).decode("utf-8"), PASS_THROUGH_FORMATS[fmt], stats
+
+OCR_PARAMS = dict(
+    max_tokens=5000,
+    temperature=0.5,
+    top_p=0.9,
+    frequency_penalty=0,
+    presence_penalty=0
+)
+
+def extract_text_from_image(image, image_path=None):
+    image_path = image_path or (image if isinstance(image, str) else None)
+    encoded_image, mime_type, stats = encode_image_payload(image)
+    logging.info(f"Encoded {image_path} as {stats['mime']} {stats['size']}: "
+                 f"{stats['source_bytes']} -> {stats['payload_bytes']} bytes ({stats['bytes_saved']} saved)\n")
 
     prompt = [
             {
@@ -41,7 +124,7 @@ def extract_text_from_image(image_path):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{encoded_image}"
+                            "url": f"data:{mime_type};base64,{encoded_image}"
                         }
                     },
                     {
@@ -53,43 +136,51 @@ def extract_text_from_image(image_path):
         ]
     
     messages = prompt
+    key = cache.make_key(os.getenv("GROQ_MODEL"), messages, OCR_PARAMS)
+    cached = cache.lookup(key)
+    metrics.inc("cache_hits" if cached is not None else "cache_misses", 1, "ocr")
+    if cached is not None:
+        return cached
+
     try:
-        completion = client.chat.completions.create(
+        metrics.inc("bytes_uploaded", len(encoded_image), "ocr")
+        metrics.inc("bytes_saved", stats["bytes_saved"], "ocr")
+        start = time.perf_counter()
+        response = get_backend().complete(
+            key,
             model=os.getenv("GROQ_MODEL"),
             messages=messages,
-            max_tokens=5000,
-            temperature=0.5,
-            top_p=0.9,
-            frequency_penalty=0,
-            presence_penalty=0,
+            **OCR_PARAMS,
             stop=None,
             stream=False)
         
-        logResponse({
-            "status": "success",
-            "headers": dict(completion.headers) if hasattr(completion, "headers") else None,
-            "output": completion.choices[0].message.content.strip(),
-            "image_path": image_path
-        })
+        metrics.record_response("ocr", time.perf_counter() - start, response)
+        log_success(response, key, image_path=image_path, image_bytes=stats["payload_bytes"])
         
-        return completion.choices[0].message.content.strip()
+        store_response(key, response)
+        return response.content
         
     except GroqError as e:
+        metrics.inc("errors", 1, "ocr")
         error_info = str(e)
-        headers = getattr(e, "headers", None)
+        headers = error_headers(e)
         logResponse({
             "status": "groq_error",
             "error": error_info,
-            "headers": dict(headers) if headers else None,
+            "headers": headers or None,
             "image_path": image_path
         })
 
-        if any(word in error_info.lower() for word in ["quota", "exceeded", "limit"]):
+        if isinstance(e, QuotaExhaustedError) or "quota" in error_info.lower():
             print("⚠️ Quota exhausted")
             logging.error("⚠️ Quota exhausted\n")
-            return ""
+        else:
+            print(f"OCR request failed: {error_info}")
+            logging.error(f"OCR request failed: {error_info}\n")
+        return ""
 
     except Exception as e:
+        metrics.inc("errors", 1, "ocr")
         error_info = str(e)
         logResponse({
             "status": "exception",
@@ -1,36 +1,105 @@
-from rdflib import Graph
+from rdflib import Graph, URIRef
 from src.prompt_builder import build_validation_prompt, build_repair_fragment_prompt
-from src.llm import run_llm
+from src.llm import run_llm, run_llm_stream, streaming_enabled
+from src.validator import OntologyValidator, violation_subgraph
+from src.turtle_repair import repair_turtle
+from src.canonicalizer import EntityIndex
+from src.vocabulary_index import VocabularyIndex
+from src.metrics import metrics
+from src.journal import OntologyJournal
+from src.provenance import ProvenanceStore
+from collections import Counter
 import logging
+import os
+import shutil
 
 class OntologyBuilder:
-    def __init__(self, base_uri):
-        self.graph = Graph()
+    def __init__(self, base_uri, store=None, store_path=None, state_dir=None):
+        """
+        `store` names an rdflib store plugin (GRAPH_STORE, default "Memory").
+        With a persistent store such as "BerkeleyDB" or "Oxigraph" and a
+        `store_path` (GRAPH_STORE_PATH), the ontology lives in an indexed
+        on-disk store and an existing one is opened without re-parsing Turtle.
+        Otherwise every change is journaled to `state_dir`
+        (ONTOLOGY_STATE_DIR, default "output/state"; empty to disable), see
+        load_state() and checkpoint(); a persistent store keeps no journal. With a `state_dir`, the triples of
+        each chunk are also kept as a named graph in
+        `state_dir`/provenance (PROVENANCE=0 to disable), see
+        retract_document().
+        """
         self.base_uri = base_uri
+        self.store = store or os.getenv("GRAPH_STORE", "Memory")
+        self.store_path = store_path or os.getenv("GRAPH_STORE_PATH") or None
+        if self.store_path:
+            self.graph = self._open_store(self.store_path)
+        else:
+            self.graph = Graph(store=self.store, identifier=URIRef(base_uri))
+        # set between begin_rebuild() and finish_rebuild()
+        self.rebuilding = False
+        state_dir = state_dir if state_dir is not None else os.getenv("ONTOLOGY_STATE_DIR", "output/state")
+        self.journal = None
+        if state_dir and not self.store_path:
+            self.journal = OntologyJournal(state_dir, int(os.getenv("SNAPSHOT_JOURNAL_LINES", 100000)))
+        self.provenance = None
+        if state_dir and os.getenv("PROVENANCE", "1") != "0":
+            self.provenance = ProvenanceStore(os.path.join(state_dir, "provenance"))
+        self.validator = OntologyValidator()
+        # triples merged since the last validate_ontology() call
+        self.unvalidated = Graph()
+        # how parse failures were resolved: local fix name, "llm" or "failed"
+        self.repair_stats = Counter()
+        self.canonicalize_mode = os.getenv("CANONICALIZE", "link")
+        self._reindex()
 
-    def merge_fragment(self, turtle_str):
-        new_graph = Graph()
+    def merge_fragment(self, turtle_str, graph=None, source=None):
+        """
+        `graph` is the fragment already parsed while it streamed in, if any;
+        then parsing is skipped. `source` describes the chunk the fragment
+        was generated from, for provenance (see merge_graph()).
+        """
+        new_graph = graph if graph is not None else Graph()
         try:
             
-            new_graph.parse(data=turtle_str, format='turtle')
+            if graph is None:
+                with metrics.stage("parse"):
+                    new_graph.parse(data=turtle_str, format='turtle')
             
         
         except Exception as e:
             print(f"Syntax error in fragment, attempting repair: {e}")
             logging.error(f"Syntax error in fragment, attempting repair\n")
-            prompt = build_repair_fragment_prompt(turtle_str)
-            repaired = run_llm(prompt)
-            try:
-                new_graph.parse(data=repaired, format='turtle')
-                
-                print("Fragment repaired and merged successfully.")
-                logging.info("Fragment repaired and merged successfully.\n")
-               
-            except Exception as e2:
-                print(f"Repair failed: {e2}")
-                logging.error(f"Failed to repair fragment, skipping")
 
-                return False
+            with metrics.stage("repair_local"):
+                new_graph, fixes = repair_turtle(turtle_str)
+            if new_graph is not None:
+                self.repair_stats[fixes[-1]] += 1
+                metrics.inc("local_repairs", 1, "repair_local", fix=fixes[-1])
+                print(f"Fragment repaired locally ({', '.join(fixes)}).")
+                logging.info(f"Fragment repaired locally ({', '.join(fixes)})\n")
+            else:
+                prompt = build_repair_fragment_prompt(turtle_str)
+                with metrics.stage("repair_llm"):
+                    if streaming_enabled():
+                        repaired, new_graph = run_llm_stream(prompt, stage="repair")
+                    else:
+                        repaired, new_graph = run_llm(prompt, stage="repair"), None
+                try:
+                    if not repaired:
+                        raise ValueError("no repaired fragment returned")
+                    if new_graph is None:
+                        new_graph = Graph()
+                        new_graph.parse(data=repaired, format='turtle')
+                    
+                    self.repair_stats["llm"] += 1
+                    print("Fragment repaired and merged successfully.")
+                    logging.info("Fragment repaired and merged successfully.\n")
+                   
+                except Exception as e2:
+                    self.repair_stats["failed"] += 1
+                    print(f"Repair failed: {e2}")
+                    logging.error(f"Failed to repair fragment, skipping")
+
+                    return False
             
         # conflicts = []
         # triples_to_add = []
@@ -50,30 +119,260 @@ class OntologyBuilder:
         # # Add non-conflicting triples
         # for triple in triples_to_add:
         #     self.graph.add(triple)
-        self.graph += new_graph
+        with metrics.stage("merge"):
+            self.merge_graph(new_graph, source=source)
         print("Fragment merged successfully.")
         return True
 
+    def merge_graph(self, new_graph, prefixes=None, source=None):
+        """
+        Merges an already parsed graph: canonicalizes its terms, binds its
+        prefixes (`prefixes`, or the graph's own) and bulk-inserts it, and
+        queues it for the next validate_ontology() call. With a `source` ({"document", "fragment", optional "source" and
+        "page"}) the canonicalized triples are recorded as that chunk's
+        named graph.
+        """
+        if self.canonicalize_mode != "off":
+            new_graph, duplicates = self.entities.canonicalize(new_graph, self.canonicalize_mode)
+            if duplicates:
+                logging.info(f"Mapped {duplicates} duplicate terms to existing ones ({self.canonicalize_mode})\n")
+        if source is not None and self.provenance is not None:
+            self.provenance.record(new_graph, **source)
+        for prefix, namespace in (prefixes or dict(new_graph.namespaces())).items():
+            self.graph.bind(prefix, namespace, override=False)
+        self._add_graph(new_graph)
+        self._index(new_graph)
+        self.unvalidated += new_graph
+
+    def _add_graph(self, new_graph, removed=None):
+        """
+        Bulk-inserts `new_graph`, after removing the triples (or patterns) in
+        `removed`, in one store transaction, and journals the triples that
+        actually changed. Nothing is journaled during a rebuild: the journal
+        belongs to the saved snapshot until finish_rebuild() replaces it.
+        """
+        journal = self.journal if not self.rebuilding else None
+        cleared = False
+        dropped = []
+        try:
+            if removed is not None:
+                for triple in removed:
+                    if journal is not None:
+                        if triple == (None, None, None):
+                            cleared = True
+                        else:
+                            dropped.extend(self.graph.triples(triple))
+                    self.graph.remove(triple)
+            added = [t for t in new_graph if t not in self.graph] if journal is not None else None
+            self.graph.addN((s, p, o, self.graph) for s, p, o in new_graph)
+            self.graph.commit()
+        except Exception:
+            self.graph.rollback()
+            raise
+        if journal is not None:
+            journal.append(added, dropped, cleared, dict(self.graph.namespaces()))
+
+    def retract_document(self, document):
+        """
+        Removes what `document` (a processed text file, or the raw document
+        it was extracted from) contributed: the triples of its chunk graphs
+        that no other chunk asserts. Costs time in proportion to the
+        document. Triples added by validation fixes are not attributed to a
+        chunk and stay. Returns the number of triples removed, or None if no
+        provenance is recorded for `document` (or PROVENANCE=0).
+        """
+        if self.provenance is None or not self.provenance.covers(document):
+            return None
+        with metrics.stage("retract"):
+            orphaned = self.provenance.retract(document)
+            if orphaned:
+                # the entity and vocabulary indexes keep the retracted terms: rebuilding
+                # them would cost time in proportion to the whole ontology
+                self._add_graph(Graph(), removed=orphaned)
+        logging.info(f"Retracted {len(orphaned)} triples of {document}\n")
+        return len(orphaned)
+
+    def _replace_graph(self, new_graph):
+        # done in place, so a persistent store keeps its identity and location
+        self._add_graph(new_graph, removed=[(None, None, None)])
+        self._reindex()
+
+    def is_persistent(self):
+        return self.store_path is not None
+
+    def _open_store(self, path):
+        graph = Graph(store=self.store, identifier=URIRef(self.base_uri))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        graph.open(path, create=True)
+        return graph
+
+    @staticmethod
+    def _remove_store(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def begin_rebuild(self):
+        """
+        Starts building the ontology from scratch, as a normal run does from
+        the chunk fragments. The saved ontology is left as it is until
+        finish_rebuild(), so a run that fails part-way leaves it usable: a
+        persistent store is rebuilt in a new store next to it, and the
+        in-memory graph is neither journaled nor snapshotted until then. The
+        same goes for the provenance files.
+        """
+        self.rebuilding = True
+        if self.provenance is not None:
+            self.provenance.reset()
+        if self.is_persistent():
+            self.graph.close(commit_pending_transaction=True)
+            self._remove_store(f"{self.store_path}.rebuild")
+            self.graph = self._open_store(f"{self.store_path}.rebuild")
+        self.unvalidated = Graph()
+        self._reindex()
+
+    def finish_rebuild(self):
+        """Replaces the saved ontology with the rebuilt one: swaps the store in, or writes it as the new snapshot."""
+        if not self.rebuilding:
+            return
+        self.rebuilding = False
+        if self.is_persistent():
+            self.graph.close(commit_pending_transaction=True)
+            self._remove_store(self.store_path)
+            os.replace(f"{self.store_path}.rebuild", self.store_path)
+            self.graph = self._open_store(self.store_path)
+        if self.provenance is not None:
+            self.provenance.save()
+        if self.journal is not None:
+            with metrics.stage("snapshot"):
+                self.journal.snapshot(self.graph)
+
+    def load_state(self):
+        """
+        Opens the ontology kept from earlier runs: a non-empty persistent
+        store, or the journal snapshot with the journal replayed onto it.
+        Returns False if there is none.
+        """
+        if self.provenance is not None:
+            self.provenance.load()
+        if self.is_persistent():
+            return not self.is_empty()
+        if self.journal is None or not self.journal.exists():
+            return False
+        with metrics.stage("load_state"):
+            replayed = self.journal.load(self.graph)
+        self._reindex()
+        logging.info(f"Loaded ontology snapshot and replayed {replayed} journal lines from {self.journal.directory}\n")
+        return True
+
+    def checkpoint(self, force=False):
+        """
+        Saves the chunk graphs of changed documents, and writes a new
+        N-Triples snapshot and empties the journal once it is long enough
+        (or if `force`). During a rebuild both wait for finish_rebuild().
+        """
+        if self.provenance is not None and not self.rebuilding:
+            self.provenance.save()
+        if self.journal is not None and not self.rebuilding and (force or self.journal.needs_snapshot()):
+            with metrics.stage("snapshot"):
+                self.journal.snapshot(self.graph)
+
+    def is_empty(self):
+        return next(iter(self.graph.triples((None, None, None))), None) is None
+
+    def close(self):
+        if self.is_persistent():
+            self.graph.close(commit_pending_transaction=True)
+
+    def _index(self, graph):
+        self.entities.add_graph(graph)
+        self.vocabulary.add_graph(graph)
+
+    def _reindex(self):
+        self.entities = EntityIndex()
+        self.vocabulary = VocabularyIndex()
+        self._index(self.graph)
+
+    def relevant_vocabulary(self, text, k=None, max_tokens=None):
+        """Compact listing of the existing classes and properties that best match `text`."""
+        k = k or int(os.getenv("VOCAB_TOP_K", 30))
+        max_tokens = max_tokens or int(os.getenv("VOCAB_MAX_TOKENS", 300))
+        return self.vocabulary.format(self.vocabulary.search(text, k), self.graph.namespace_manager, max_tokens)
+
+    def load_file(self, filepath, format='turtle'):
+        self.graph.parse(filepath, format=format)
+        self._index(self.graph)
+        self.checkpoint(force=True)
+
     def get_current_ontology_ttl(self):
         return self.graph.serialize(format='turtle')
 
-    def save_to_file(self, filepath):
-        self.graph.serialize(destination=filepath, format='turtle')
+    def export_turtle(self, filepath):
+        """Pretty Turtle export of the whole ontology; a separate step, since the journal already keeps every change."""
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        with metrics.stage("export"):
+            self.graph.serialize(destination=filepath, format='turtle')
         print(f"Ontology saved to {filepath}")
 
     def clear_current_ontology(self):
-        self.graph = Graph()
+        self._replace_graph(Graph())
+        self.unvalidated = Graph()
+        if self.provenance is not None:
+            self.provenance.reset()
+
+    def validate_ontology(self):
+        """
+        Checks the triples merged since the last call with the local rule
+        engine, and sends only the subgraph around actual violations to the
+        LLM (unless VALIDATION_ESCALATE=0). The rest of the graph is untouched.
+        """
+        with metrics.stage("validation_local"):
+            violations = self.validator.check(self.graph, self.unvalidated)
+        self.unvalidated = Graph()
+        metrics.inc("violations", len(violations), "validation")
+        return self.resolve_violations(violations)
+
+    def resolve_violations(self, violations):
+        if not violations:
+            return True
+
+        for v in violations:
+            logging.warning(f"Validation: {v.rule}: {v.message} ({v.term})")
+        print(f"Found {len(violations)} validation issues.")
+        if os.getenv("VALIDATION_ESCALATE", "1") == "0":
+            return False
+
+        subgraph, context = violation_subgraph(self.graph, violations,
+                                               int(os.getenv("VALIDATION_MAX_REFERENCES", 25)))
+        prompt = build_validation_prompt(subgraph.serialize(format='turtle'), violations,
+                                         context.serialize(format='turtle'))
+        with metrics.stage("validation_llm"):
+            ontology = run_llm(prompt, stage="validation")
+        if not ontology:
+            return False
+        new_graph = Graph()
+        try:
+            new_graph.parse(data=ontology, format='turtle')
+        except Exception as e:
+            print(f"Error parsing ontology: {e}")
+            return False
+        self._add_graph(new_graph, removed=subgraph)
+        self._index(new_graph)
+        logging.info(f"Replaced {len(subgraph)} triples around validation issues with {len(new_graph)} corrected triples\n")
+        return True
 
     def validate_ontology_llm(self):
         c = self.get_current_ontology_ttl()
         prompt = build_validation_prompt(c)
         
-        ontology = run_llm(prompt)
+        with metrics.stage("validation_llm"):
+            ontology = run_llm(prompt, stage="validation")
         if ontology:
             new_graph = Graph()
             try:
                 new_graph.parse(data=ontology, format='turtle')
-                self.graph = new_graph
+                self._replace_graph(new_graph)
                 return True
             except Exception as e:
                 print(f"Error parsing ontology: {e}")
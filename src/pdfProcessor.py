@@ -1,9 +1,167 @@
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from concurrent.futures import ProcessPoolExecutor
+import logging
 import os
+import subprocess
+import unicodedata
 
-def convert_pdf_to_images( pdf_path: str) -> str:
-        
-        images = convert_from_path(pdf_path, dpi=500)
+IMAGE_EXTENSIONS = {"jpeg": "jpg", "png": "png"}
 
-        for i, image in enumerate(images):   
-            image.save(f'./data/images/{os.path.basename(pdf_path)}page_{i+1}.jpg', 'JPEG')
\ No newline at end of file
+def _dpi(dpi):
+    return dpi or int(os.getenv("PDF_DPI", 500))
+
+def _fmt(fmt):
+    return (fmt or os.getenv("PDF_IMAGE_FORMAT", "jpeg")).lower()
+
+def _window(window):
+    return window or int(os.getenv("PDF_PAGE_WINDOW", 4))
+
+def page_image_name(pdf_path, page_number, fmt=None, name=None):
+    """`name` stands in for the PDF's base name (see document_loader.output_name())."""
+    return f"{name or os.path.basename(pdf_path)}page_{page_number}.{IMAGE_EXTENSIONS[_fmt(fmt)]}"
+
+def get_page_count(pdf_path):
+    return pdfinfo_from_path(pdf_path)["Pages"]
+
+def page_windows(pdf_path, window=None, page_count=None):
+    """Splits a PDF into (first_page, last_page) ranges of at most `window` pages."""
+    page_count = page_count or get_page_count(pdf_path)
+    return list(contiguous_runs(range(1, page_count + 1), window))
+
+def rasterize_pages(pdf_path, first_page, last_page, output_dir="./data/images", dpi=None, fmt=None, name=None):
+    """
+    Renders pages first_page..last_page straight to image files, one page per
+    pdftoppm call, so no page is ever held in memory as a PIL image.
+    """
+    fmt = _fmt(fmt)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for page_number in range(first_page, last_page + 1):
+        output_file = os.path.splitext(page_image_name(pdf_path, page_number, fmt, name))[0]
+        paths += convert_from_path(
+            pdf_path,
+            dpi=_dpi(dpi),
+            first_page=page_number,
+            last_page=page_number,
+            fmt=fmt,
+            output_folder=output_dir,
+            output_file=output_file,
+            single_file=True,
+            paths_only=True,
+        )
+    return paths
+
+def _rasterize_task(task):
+    return rasterize_pages(*task)
+
+def convert_pdfs_to_images(pdf_paths, output_dir="./data/images", dpi=None, fmt=None, window=None, workers=None,
+                           pages=None, names=None):
+    """
+    Rasterizes several PDFs across a process pool. Each PDF is cut into page
+    windows, so a single large scan is also spread over the workers. `pages`
+    optionally maps a PDF to the page numbers to render (default: all),
+    `names` to the name its page images are given (default: its base name).
+    Returns {pdf_path: [image paths in page order]}.
+    """
+    pages = pages or {}
+    names = names or {}
+    tasks = []
+    for pdf_path in pdf_paths:
+        if pages.get(pdf_path) is not None:
+            windows = contiguous_runs(pages[pdf_path], window)
+        else:
+            windows = page_windows(pdf_path, window)
+        for first_page, last_page in windows:
+            tasks.append((pdf_path, first_page, last_page, output_dir, _dpi(dpi), _fmt(fmt), names.get(pdf_path)))
+
+    results = {pdf_path: [] for pdf_path in pdf_paths}
+    if not tasks:
+        return results
+    workers = workers or int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        for task, paths in zip(tasks, executor.map(_rasterize_task, tasks)):
+            results[task[0]] += paths
+    return results
+
+def convert_pdf_to_images(pdf_path: str, dpi=None, fmt=None, window=None, workers=None) -> list:
+    return convert_pdfs_to_images([pdf_path], dpi=dpi, fmt=fmt, window=window, workers=workers)[pdf_path]
+
+def contiguous_runs(page_numbers, window=None):
+    """Groups page numbers into (first_page, last_page) runs of at most `window` consecutive pages."""
+    window = _window(window)
+    run = []
+    for page_number in sorted(page_numbers):
+        if run and (page_number != run[-1] + 1 or len(run) == window):
+            yield run[0], run[-1]
+            run = []
+        run.append(page_number)
+    if run:
+        yield run[0], run[-1]
+
+def iter_pdf_pages(pdf_path, dpi=None, window=None, page_numbers=None):
+    """
+    Yields (page_number, PIL image) for the requested pages (default: all),
+    rendering at most `window` pages at a time. Lets the OCR stage consume
+    pages directly instead of going through image files in data/images.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, get_page_count(pdf_path) + 1)
+    for first_page, last_page in contiguous_runs(page_numbers, window):
+        images = convert_from_path(pdf_path, dpi=_dpi(dpi), first_page=first_page, last_page=last_page)
+        for offset, image in enumerate(images):
+            yield first_page + offset, image
+        del images
+
+def _min_chars(min_chars):
+    return min_chars if min_chars is not None else int(os.getenv("PDF_TEXT_MIN_CHARS", 100))
+
+def extract_text_layer(pdf_path, first_page=None, last_page=None):
+    """
+    Text of each page from the PDF's embedded text layer, with poppler's
+    pdftotext (which ends every page with a form feed). Returns
+    {page_number: text}, or {} if pdftotext is not available or fails.
+    """
+    command = ["pdftotext", "-enc", "UTF-8"]
+    if first_page:
+        command += ["-f", str(first_page)]
+    if last_page:
+        command += ["-l", str(last_page)]
+    try:
+        result = subprocess.run(command + [pdf_path, "-"], capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning(f"No text layer read from {pdf_path} ({e}); all pages go to OCR\n")
+        return {}
+    texts = result.stdout.decode("utf-8", errors="replace").split("\f")
+    if texts and texts[-1] == "":
+        texts.pop()
+    return {(first_page or 1) + i: text for i, text in enumerate(texts)}
+
+def usable_text(text, min_chars=None):
+    """
+    True if a page's text layer can stand in for OCR: at least `min_chars`
+    (PDF_TEXT_MIN_CHARS) visible characters, and hardly any replacement,
+    private-use or control characters, which is what glyphs from fonts
+    without a Unicode mapping come out as.
+    """
+    chars = [c for c in text if not c.isspace()]
+    if not chars or len(chars) < _min_chars(min_chars):
+        return False
+    garbled = sum(1 for c in chars if c == "\ufffd" or unicodedata.category(c) in ("Co", "Cc", "Cn"))
+    return garbled <= 0.05 * len(chars)
+
+def route_pdf_pages(pdf_path, page_count=None, min_chars=None):
+    """
+    Splits a PDF's pages into those with a usable text layer and those that
+    need OCR (scanned or image-only pages). Returns ({page_number: text},
+    [page numbers to OCR]).
+    """
+    page_count = page_count or get_page_count(pdf_path)
+    layer = extract_text_layer(pdf_path, 1, page_count)
+    text_pages, ocr_pages = {}, []
+    for page_number in range(1, page_count + 1):
+        text = layer.get(page_number, "")
+        if usable_text(text, min_chars):
+            text_pages[page_number] = text
+        else:
+            ocr_pages.append(page_number)
+    return text_pages, ocr_pages
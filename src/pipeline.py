@@ -1,34 +1,593 @@
-from src.document_loader import load_documents
+from src.document_loader import load_documents, detect_type, output_name
+from src.watcher import make_watcher, WorkQueue, watch_into
+import threading
 from src.ocr import extract_text_from_image
-from src.splitter import split_text
+from src.splitter import iter_chunks, chunk_token_budget
 from src.prompt_builder import *
-from src.llm import run_llm
+from src.llm import run_llm, run_llm_async, run_llm_stream_async, streaming_enabled
 from src.ontology_builder import OntologyBuilder
 import os
 import logging
-from src.pdfProcessor import convert_pdf_to_images
+from src.pdfProcessor import convert_pdfs_to_images, iter_pdf_pages, get_page_count, route_pdf_pages
 import shutil
+from src import cache, dedup
+from src.manifest import Manifest, hash_file, hash_text
+import asyncio
+from collections import deque
+from rdflib import Graph
+from src.sharding import parse_sharded
+from src.metrics import metrics
+import json
 
-def run_pipeline(skip_raw=False, skip_ocr=False, review=False  ):
+async def _read_fragment(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read(), None
+
+async def _generate_fragment(prompt):
+    """(fragment text, graph parsed while streaming or None)."""
+    if streaming_enabled():
+        return await run_llm_stream_async(prompt)
+    return await run_llm_async(prompt), None
+
+async def _duplicate_fragment(fragment):
+    """The fragment of a near-duplicate chunk from an earlier run, as read and checked by the dedup index."""
+    return fragment, None
+
+async def _reuse_fragment(earlier):
+    """The fragment of an earlier chunk of the same run, once it is generated."""
+    fragment, _ = await earlier
+    return fragment, None
+
+async def generate_fragments(jobs, concurrency):
+    """
+    `jobs` yields (info, awaitable) pairs. Yields (info, result) in job order,
+    while keeping up to `concurrency` awaitables in flight.
+    """
+    in_flight = deque()
+    for info, job in jobs:
+        in_flight.append((info, asyncio.ensure_future(job)))
+        if len(in_flight) >= concurrency:
+            info, future = in_flight.popleft()
+            yield info, await future
+    while in_flight:
+        info, future = in_flight.popleft()
+        yield info, await future
+
+def chunk_source(doc_path, fragment_filename, manifest):
+    """Provenance of a chunk of `doc_path`: its fragment and the raw document and page the text was extracted from."""
+    source = {"document": doc_path, "fragment": fragment_filename}
+    entry = manifest.get("ocr", doc_path)
+    if entry and entry.get("source"):
+        origin = entry["source"]
+        # OCR of a rasterized page image: back to the PDF page it was rendered from
+        rasterized = manifest.get("rasterized", os.path.normpath(origin))
+        if rasterized:
+            origin = rasterized["source"]
+        origin, _, page = origin.partition("#page_")
+        source["source"] = origin
+        if page.isdigit():
+            source["page"] = int(page)
+    return source
+
+def merge_saved_fragments(ob, fragment_filenames, doc_path=None, manifest=None):
+    for fragment_filename in fragment_filenames:
+        with open(fragment_filename, 'r', encoding='utf-8') as f:
+            source = chunk_source(doc_path, fragment_filename, manifest) if doc_path else None
+            ob.merge_fragment(f.read(), source=source)
+
+def reviewed_chunk(review_path, manifest):
+    """The (chunk key, manifest entry) of the chunk a fragment in data/review was generated from, or (None, None)."""
+    fragment_filename = f"data/ontology_fragments/{os.path.basename(review_path)}"
+    for chunk_key, entry in manifest.items.get("chunk", {}).items():
+        if entry.get("fragment") == fragment_filename:
+            return chunk_key, entry
+    return None, None
+
+def accept_reviewed_fragment(chunk_key, entry, fragment, manifest):
+    """
+    Writes a fragment merged from data/review over the saved fragment of its
+    chunk and marks the chunk merged, so the next normal run, which rebuilds
+    the ontology from the saved fragments, keeps it.
+    """
+    fragment_filename = entry["fragment"]
+    with open(fragment_filename, "w", encoding="utf-8") as frag_file:
+        frag_file.write(fragment)
+    manifest.update("chunk", chunk_key, merged=True)
+    doc_path = chunk_key.rpartition("#")[0]
+    text = manifest.get("text", doc_path)
+    if text is not None and fragment_filename not in text["fragments"]:
+        # keep the document's fragments in chunk order
+        order = {e.get("fragment"): int(key.rpartition("#")[2]) for key, e in manifest.items["chunk"].items()
+                 if key.rpartition("#")[0] == doc_path}
+        manifest.update("text", doc_path, fragments=sorted(text["fragments"] + [fragment_filename],
+                                                            key=lambda f: order.get(f, 0)))
+
+async def merge_off_loop(ob, fragment, graph=None, source=None):
+    """
+    merge_fragment() from async code: an LLM repair blocks on its request and
+    on rate-limit waits, so it runs in a worker thread while the requests in
+    flight on the event loop go on. Merges still happen one at a time.
+    """
+    return await asyncio.to_thread(ob.merge_fragment, fragment, graph, source)
+
+async def generate_ontology(doc_paths, ob, chunk_tokens, overlap_tokens, concurrency, manifest, sharded=False,
+                            skip_done=False):
+    """
+    Generates and merges the fragments of every text document. With
+    `sharded`, fragments are only generated and saved; the returned
+    {doc_path: [fragment filenames]} is merged by merge_sharded(). With
+    `skip_done`, documents that are done are left alone instead of having
+    their saved fragments merged again (`ob` already holds them).
+    """
+    documents = {}
+    for doc_path in doc_paths:
+        if detect_type(doc_path) == "text":
+            text_hash = hash_file(doc_path)
+            entry = manifest.get("text", doc_path)
+            if manifest.is_done("text", doc_path, text_hash) and all(os.path.exists(p) for p in entry["fragments"]):
+                if skip_done:
+                    logging.info(f"{doc_path} unchanged since it was merged. Skipping.\n")
+                    continue
+                print(f"All chunks of {doc_path} already generated. Merging saved fragments.")
+                logging.info(f"All chunks of {doc_path} already generated. Merging saved fragments.\n")
+                if sharded:
+                    documents[doc_path] = entry["fragments"]
+                else:
+                    merge_saved_fragments(ob, entry["fragments"], doc_path, manifest)
+                continue
+
+            if ob.provenance is not None and ob.provenance.has_document(doc_path):
+                # the text changed since it was merged: take back what it contributed first
+                removed = ob.retract_document(doc_path)
+                print(f"{doc_path} changed; retracted {removed} triples merged from its previous version.")
+
+            print(f"Processing chunks from {doc_path}.")
+            logging.info(f"Processing chunks from {doc_path}.\n")
+
+            index = dedup.get_index()
+            # LSH band -> (signature, generation, chunk key) of the chunks of this document sent to the LLM so far
+            in_flight = {}
+
+            def jobs():
+                # read lazily as jobs are taken; closed with the generator, also when generation raises
+                with open(doc_path, 'r', encoding='utf-8') as text_file:
+                    yield from document_jobs(text_file)
+
+            def document_jobs(text_file):
+                for i, chunk in enumerate(iter_chunks(text_file, chunk_tokens, overlap_tokens)):
+                    chunk_key = f"{doc_path}#{i}"
+                    chunk_hash = hash_text(chunk)
+                    fragment_filename = f"data/ontology_fragments/{output_name(doc_path, 'data/processed')}_{i}.ttl"
+                    saved = manifest.is_done("chunk", chunk_key, chunk_hash) and os.path.exists(fragment_filename)
+                    signature = duplicate_of = None
+                    if saved:
+                        job = _read_fragment(fragment_filename)
+                    elif index is None:
+                        job = _generate_fragment(build_generation_prompt(chunk, ob.relevant_vocabulary(chunk)))
+                    else:
+                        with metrics.stage("dedup"):
+                            signature = index.chunk_signature(chunk)
+                            duplicate = index.find_chunk(signature, exclude_key=chunk_key)
+                            bands = dedup.lsh_bands(signature, index.bands)
+                            earlier = next((in_flight[band] for band in bands if band in in_flight and
+                                            dedup.similarity(signature, in_flight[band][0]) >= index.chunk_threshold), None)
+                        if duplicate:
+                            duplicate_of = duplicate[0]
+                            job = _duplicate_fragment(duplicate[1])
+                        elif earlier:
+                            duplicate_of = earlier[2]
+                            job = _reuse_fragment(earlier[1])
+                        else:
+                            job = asyncio.ensure_future(
+                                _generate_fragment(build_generation_prompt(chunk, ob.relevant_vocabulary(chunk))))
+                            for band in bands:
+                                in_flight.setdefault(band, (signature, job, chunk_key))
+                        if duplicate_of:
+                            dedup.record_avoided("generation")
+                            logging.info(f"Chunk {chunk_key} is a near-duplicate of {duplicate_of}; reusing its fragment.\n")
+                    yield (i, chunk_key, chunk_hash, fragment_filename, saved, signature, duplicate_of), job
+
+            merged_fragments = []
+            generated = 0
+            failed = 0
+            chunk_count = 0
+            async for (i, chunk_key, chunk_hash, fragment_filename, saved, signature, duplicate_of), (fragment, parsed) \
+                    in generate_fragments(jobs(), concurrency):
+                chunk_count += 1
+                metrics.inc("chunks", 1, "generation")
+                if saved:
+                    # merged in chunk order, so the ontology does not depend on response timing
+                    if manifest.get("chunk", chunk_key).get("merged", True):
+                        if not sharded:
+                            await merge_off_loop(ob, fragment, source=chunk_source(doc_path, fragment_filename, manifest))
+                        merged_fragments.append(fragment_filename)
+                    continue
+
+                if not fragment:
+                    # quota exhausted or request failed: leave the chunk pending for the next run
+                    failed += 1
+                    manifest.mark("chunk", chunk_key, chunk_hash, status="failed")
+                    print(f"No fragment generated for chunk: {i}. It will be retried on the next run.")
+                    logging.error(f"No fragment generated for chunk: {i} of {doc_path}\n")
+                    continue
+
+                generated += 1
+                if duplicate_of:
+                    print(f"Reused the fragment of {duplicate_of} for chunk: {i}")
+                    logging.info(f"Reused the fragment of {duplicate_of} for chunk: {i}\n")
+                else:
+                    print(f"Generated fragment for chunk: {i}")
+                    logging.info(f"Generated fragment for chunk: {i}\n")
+
+                with open(fragment_filename, "w", encoding="utf-8") as frag_file:
+                    frag_file.write(fragment)
+                print(f"Fragment saved to {fragment_filename}")
+
+                if sharded:
+                    merged_fragments.append(fragment_filename)
+                    manifest.mark("chunk", chunk_key, chunk_hash, fragment=fragment_filename, duplicate_of=duplicate_of)
+                    if signature is not None:
+                        index.add_chunk(chunk_key, signature, fragment_filename, fragment)
+                    continue
+
+                mergeSuccess = await merge_off_loop(ob, fragment, parsed, chunk_source(doc_path, fragment_filename, manifest))
+
+                #if unsuccessful, save ttl to review folder
+                if not mergeSuccess:
+                    print(f"fragment {fragment_filename} did not merge due to error")
+                    logging.error(f"fragment {fragment_filename} did not merge due to error\n")
+                    review_filename = f"data/review/{os.path.basename(fragment_filename)}"
+                    with open(review_filename, "w", encoding="utf-8") as frag_file:
+                        frag_file.write(fragment)
+                else:
+                    merged_fragments.append(fragment_filename)
+                    if signature is not None:
+                        index.add_chunk(chunk_key, signature, fragment_filename, fragment)
+                manifest.mark("chunk", chunk_key, chunk_hash, fragment=fragment_filename, merged=mergeSuccess,
+                              duplicate_of=duplicate_of)
+
+            print(f"Processed {chunk_count} chunks from {doc_path}.")
+            logging.info(f"Processed {chunk_count} chunks from {doc_path}.\n")
+            if sharded:
+                documents[doc_path] = merged_fragments
+            elif generated:
+                logging.info(f"Validating ontology for {doc_path}...\n")
+                isValid = ob.validate_ontology()
+                if not isValid:
+                    print(f"Ontology validation failed for {doc_path}.")
+                    logging.error(f"Ontology validation failed for {doc_path}.\n")
+                else:
+                    print(f"Ontology validation successful for {doc_path}.")
+                    logging.info(f"Ontology validation successful for {doc_path}.\n")
+
+            if not failed:
+                manifest.mark("text", doc_path, text_hash, fragments=merged_fragments)
+            manifest.flush()
+
+        else:
+            print(f"Unsupported file type for processing: {doc_path}. Skipping.")
+            logging.info(f"Unsupported file type for processing: {doc_path}. Skipping.\n")
+            continue
+    return documents
+
+def merge_sharded(ob, documents, workers, manifest):
+    """
+    Parses the fragments of every document in worker processes (with local
+    repair), and merges them here, in document order: canonicalized against
+    the whole ontology, recorded for provenance and validated against the
+    merged graph after each document, as in an in-process run. Fragments
+    that need an LLM repair go through merge_fragment().
+    """
+    print(f"Parsing {len(documents)} documents across {workers} worker processes.")
+    logging.info(f"Parsing {len(documents)} documents across {workers} worker processes.\n")
+    merged = 0
+    for doc_path, parsed in parse_sharded(documents, workers):
+        for fragment_filename, triples, prefixes, fixes in parsed:
+            source = chunk_source(doc_path, fragment_filename, manifest)
+            if triples is None:
+                with open(fragment_filename, 'r', encoding='utf-8') as f:
+                    fragment = f.read()
+                if not ob.merge_fragment(fragment, source=source):
+                    print(f"fragment {fragment_filename} did not merge due to error")
+                    logging.error(f"fragment {fragment_filename} did not merge due to error\n")
+                    with open(f"data/review/{os.path.basename(fragment_filename)}", "w", encoding="utf-8") as frag_file:
+                        frag_file.write(fragment)
+                continue
+            if fixes:
+                ob.repair_stats[fixes[-1]] += 1
+                metrics.inc("local_repairs", 1, "repair_local", fix=fixes[-1])
+            graph = Graph()
+            graph.addN((s, p, o, graph) for s, p, o in triples)
+            with metrics.stage("merge"):
+                ob.merge_graph(graph, prefixes=prefixes, source=source)
+            merged += len(triples)
+        if not ob.validate_ontology():
+            print(f"Ontology validation failed for {doc_path}.")
+            logging.error(f"Ontology validation failed for {doc_path}.\n")
+    print(f"Merged {merged} triples from {len(documents)} documents.")
+    logging.info(f"Merged {merged} triples from {len(documents)} documents.\n")
+
+def save_ocr_text(text, text_filename):
+    os.makedirs("data/processed", exist_ok=True)
+    with open(text_filename, "w", encoding="utf-8") as text_file:
+        text_file.write(text)
+        print(f"Text saved to {text_filename}")     
+        logging.info(f"Text saved to {text_filename}\n")
+
+def extract_text_layer_pages(pdf_path, pdf_hash, manifest):
+    """
+    Writes the pages of a PDF that have a usable embedded text layer to
+    data/processed, under the names OCR would give them. Returns the page
+    numbers that still need OCR (scanned or image-only pages).
+    """
+    page_count = get_page_count(pdf_path)
+    if os.getenv("PDF_TEXT_LAYER", "1") != "1":
+        return list(range(1, page_count + 1))
+    with metrics.stage("text_layer"):
+        text_pages, ocr_pages = route_pdf_pages(pdf_path, page_count)
+    for page_number, text in text_pages.items():
+        page_key = f"{pdf_path}#page_{page_number}"
+        text_filename = f"data/processed/{output_name(pdf_path, 'data/raw')}page_{page_number}.txt"
+        if manifest.is_done("page", page_key, pdf_hash) and os.path.exists(text_filename):
+            continue
+        save_ocr_text(text, text_filename)
+        manifest.mark("page", page_key, pdf_hash, output=text_filename, source="text_layer")
+        manifest.mark("ocr", text_filename, hash_text(text), source=page_key)
+    metrics.inc("pages", len(text_pages), "text_layer")
+    metrics.inc("pages_to_ocr", len(ocr_pages), "text_layer")
+    print(f"{len(text_pages)} of {page_count} pages of {pdf_path} have a text layer; {len(ocr_pages)} go to OCR.")
+    logging.info(f"{len(text_pages)} of {page_count} pages of {pdf_path} have a text layer; {len(ocr_pages)} go to OCR.\n")
+    return ocr_pages
+
+def _duplicate_ocr(image, image_key):
+    """
+    Looks a page image up in the near-duplicate index. Returns (perceptual
+    hash, OCR text of an already processed near-duplicate or None), or
+    (None, None) with dedup off.
+    """
+    index = dedup.get_index()
+    if index is None:
+        return None, None
+    with metrics.stage("dedup"):
+        perceptual_hash = index.image_hash(image)
+        duplicate = index.find_image(perceptual_hash, exclude_key=image_key)
+    if duplicate is None:
+        return perceptual_hash, None
+    text = duplicate[1]
+    dedup.record_avoided("ocr")
+    print(f"{image_key} is a near-duplicate of {duplicate[0]}; reusing its OCR text.")
+    logging.info(f"{image_key} is a near-duplicate of {duplicate[0]}; reusing its OCR text.\n")
+    return perceptual_hash, text
+
+def ocr_pdf_pages(pdf_path, pdf_hash, manifest, page_numbers=None):
+    """
+    Streams the pages of a PDF (default: all, else `page_numbers`) straight
+    into OCR without writing page images to data/images. Returns True once
+    every page has been extracted.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, get_page_count(pdf_path) + 1)
+    pending = [n for n in page_numbers if not manifest.is_done("page", f"{pdf_path}#page_{n}", pdf_hash)]
+    complete = True
+    pages = iter_pdf_pages(pdf_path, page_numbers=pending)
+    while True:
+        with metrics.stage("rasterize"):
+            page_number, image = next(pages, (None, None))
+        if image is None:
+            break
+        metrics.inc("pages", 1, "rasterize")
+        page_key = f"{pdf_path}#page_{page_number}"
+        perceptual_hash, text = _duplicate_ocr(image, page_key)
+        if text is None:
+            with metrics.stage("ocr"):
+                text = extract_text_from_image(image, image_path=page_key)
+        image.close()
+        if not text:
+            complete = False
+            manifest.mark("page", page_key, pdf_hash, status="failed")
+            print(f"No text extracted from page {page_number} of {pdf_path}. Skipping.")
+            logging.info(f"No text extracted from page {page_number} of {pdf_path}. Skipping.\n")
+            continue
+        text_filename = f"data/processed/{output_name(pdf_path, 'data/raw')}page_{page_number}.txt"
+        save_ocr_text(text, text_filename)
+        manifest.mark("page", page_key, pdf_hash, output=text_filename)
+        manifest.mark("ocr", text_filename, hash_text(text), source=page_key)
+        if perceptual_hash is not None:
+            dedup.get_index().add_image(page_key, perceptual_hash, text_filename, text)
+    return complete
+
+FINAL_ONTOLOGY = "output/final_ontology.ttl"
+
+def finish_ontology(ob, export_turtle=None):
+    """
+    Saves the run's ontology: a snapshot once the journal is long enough, and
+    the pretty Turtle export only if asked for (`export_turtle`, or
+    EXPORT_TURTLE=1) or if nothing else keeps the ontology.
+    """
+    if export_turtle is None:
+        export_turtle = os.getenv("EXPORT_TURTLE", "0") == "1"
+    ob.checkpoint()
+    if export_turtle or (ob.journal is None and not ob.is_persistent()):
+        ob.export_turtle(FINAL_ONTOLOGY)
+    elif ob.journal is not None:
+        print(f"Ontology state saved to {ob.journal.directory} (run with --export-turtle to write {FINAL_ONTOLOGY})")
+    ob.close()
+
+def export_ontology(filepath=FINAL_ONTOLOGY):
+    """The explicit export step: loads the saved ontology state and writes it as Turtle."""
+    ob = OntologyBuilder(os.getenv("BASE_URI", "http://example.com/ontology"))
+    if not ob.load_state():
+        print("No saved ontology state to export.")
+        ob.close()
+        return False
+    ob.export_turtle(filepath)
+    ob.close()
+    return True
+
+def retract_document(document):
+    """
+    Removes what one document (a text file in data/processed, or the raw
+    document it came from) contributed to the saved ontology state. Returns
+    the number of triples removed, or None if nothing is known about it.
+    """
+    ob = OntologyBuilder(os.getenv("BASE_URI", "http://example.com/ontology"))
+    if not ob.load_state():
+        print("No saved ontology state.")
+        ob.close()
+        return None
+    if ob.provenance is None:
+        print("Provenance is disabled (PROVENANCE=0): documents cannot be retracted.")
+        ob.close()
+        return None
+    removed = ob.retract_document(os.path.normpath(document))
+    if removed is None:
+        print(f"⚠️ No provenance recorded for {document}; nothing retracted.")
+        logging.warning(f"No provenance recorded for {document}; nothing retracted\n")
+        ob.close()
+        return None
+    ob.checkpoint()
+    ob.close()
+    print(f"Retracted {removed} triples of {document}.")
+    return removed
+
+def ingest_raw(doc_path, manifest, images_dir="data/images", direct_ocr=False, pending_pdfs=None):
+    """
+    Raw stage for one document, by its detected type: PDF pages with a text
+    layer are extracted to data/processed, the others go to OCR directly
+    (`direct_ocr`) or are rasterized into `images_dir`; images are copied
+    there, text files are copied to data/processed. PDFs to rasterize are
+    collected in `pending_pdfs` for rasterize_pdfs(), or rasterized right
+    away if it is None.
+    """
+    raw_hash = hash_file(doc_path)
+    if manifest.is_done("raw", doc_path, raw_hash):
+        logging.info(f"Raw document {doc_path} unchanged since last run. Skipping.\n")
+        return
+
+    kind = detect_type(doc_path)
+    if kind == "pdf":
+        print(f"Processing PDF document: {doc_path}")
+        logging.info(f"Processing PDF document: {doc_path}\n")
+        ocr_pages = extract_text_layer_pages(doc_path, raw_hash, manifest)
+        if ocr_pages and not direct_ocr:
+            # rasterized together, across a process pool
+            if pending_pdfs is None:
+                rasterize_pdfs({doc_path: (raw_hash, ocr_pages)}, manifest)
+            else:
+                pending_pdfs[doc_path] = (raw_hash, ocr_pages)
+            return
+        if ocr_pages and not ocr_pdf_pages(doc_path, raw_hash, manifest, ocr_pages):
+            return
+        print(f"Extracted text from all pages of {doc_path}.")
+
+    elif kind in ("png", "jpeg"):
+        
+        os.makedirs(images_dir, exist_ok=True)
+        dest_path = os.path.join(images_dir, output_name(doc_path, "data/raw"))
+        shutil.copy(doc_path, dest_path)
+        print(f"Copied {doc_path} to {dest_path}")
+        logging.info(f"Copied {doc_path} to {dest_path}\n")
+
+    elif kind == "text":
+        #move to processed folder
+        processed_dir = "data/processed"
+        os.makedirs(processed_dir, exist_ok=True)
+        dest_path = os.path.join(processed_dir, output_name(doc_path, "data/raw"))
+        shutil.copy(doc_path, dest_path)
+        print(f"Copied {doc_path} to {dest_path}")
+        logging.info(f"Copied {doc_path} to {dest_path}\n")
+    else:
+        print(f"Unsupported file type: {doc_path}. Skipping.")
+        logging.info(f"Unsupported file type: {doc_path}. Skipping.\n")
+        return
+    manifest.mark("raw", doc_path, raw_hash)
+
+def rasterize_pdfs(pending_pdfs, manifest):
+    """Rasterizes {pdf path: (raw hash, page numbers)} into data/images, across a process pool."""
+    if not pending_pdfs:
+        return
+    with metrics.stage("rasterize"):
+        rasterized = convert_pdfs_to_images(list(pending_pdfs),
+                                            pages={path: pages for path, (_, pages) in pending_pdfs.items()},
+                                            names={path: output_name(path, "data/raw") for path in pending_pdfs})
+    for doc_path, image_paths in rasterized.items():
+        raw_hash, pages = pending_pdfs[doc_path]
+        for image_path, page_number in zip(image_paths, pages):
+            manifest.mark("rasterized", os.path.normpath(image_path), raw_hash, source=f"{doc_path}#page_{page_number}")
+        metrics.inc("pages", len(image_paths), "rasterize")
+        print(f"Converted {doc_path} to {len(image_paths)} images.")
+        logging.info(f"Converted {doc_path} to {len(image_paths)} images.\n")
+        manifest.mark("raw", doc_path, raw_hash)
+
+def ocr_image(doc_path, manifest, images_dir="data/images"):
+    """OCR stage for one image in `images_dir`; the text goes to data/processed. Returns the text file, or None."""
+    if detect_type(doc_path) not in ("png", "jpeg"):
+        print(f"Unsupported file type for OCR: {doc_path}. Skipping.")
+        logging.info(f"Unsupported file type for OCR: {doc_path}. Skipping.\n")
+        return None
+
+    text_filename = f"data/processed/{os.path.splitext(output_name(doc_path, images_dir))[0]}.txt"
+    image_hash = hash_file(doc_path)
+    if manifest.is_done("image", doc_path, image_hash) and os.path.exists(text_filename):
+        logging.info(f"OCR text for {doc_path} already extracted. Skipping.\n")
+        return None
+
+    perceptual_hash, text = _duplicate_ocr(doc_path, doc_path)
+    if text is None:
+        with metrics.stage("ocr"):
+            text = extract_text_from_image(doc_path)
+    if not text:
+        manifest.mark("image", doc_path, image_hash, status="failed")
+        print(f"No text extracted from {doc_path}. Skipping.")
+        logging.info(f"No text extracted from {doc_path}. Skipping.\n")
+        return None
+    print(f"Extracted text from {doc_path}.")
+    logging.info(f"Extracted text from {doc_path}.\n")
+    
+    save_ocr_text(text, text_filename)
+    manifest.mark("image", doc_path, image_hash, output=text_filename)
+    manifest.mark("ocr", text_filename, hash_text(text), source=doc_path)
+    if perceptual_hash is not None:
+        dedup.get_index().add_image(doc_path, perceptual_hash, text_filename, text)
+    return text_filename
+
+def report_duplicates():
+    index = dedup.get_index()
+    report = index.report() if index is not None else None
+    if report:
+        print(report)
+        logging.info(f"{report}\n")
+
+def run_pipeline(skip_raw=False, skip_ocr=False, review=False, concurrency=None, use_cache=True, refresh_cache=False, merge_workers=None,
+                 export_turtle=None, use_dedup=True):
 
     logging.info("Starting ontology generation pipeline")
+    cache.configure(enabled=use_cache, refresh=refresh_cache)
+    dedup.configure(enabled=use_dedup and os.getenv("DEDUP", "1") != "0")
     doc_paths_raw = load_documents("data/raw") if not skip_raw else []
     images_dir = "data/images" 
     os.makedirs("data/ontology_fragments", exist_ok=True)
     os.makedirs("data/review", exist_ok=True)
-    doc_paths_processed = load_documents("data/processed")
     BASE_URI = os.getenv("BASE_URI", "http://example.com/ontology")
-    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
+    CHUNK_TOKENS = chunk_token_budget()
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 0))
+    if concurrency is None:
+        concurrency = int(os.getenv("LLM_CONCURRENCY", 4))
+    if merge_workers is None:
+        merge_workers = int(os.getenv("MERGE_WORKERS", 0))
     ob = OntologyBuilder(BASE_URI)
+    manifest = Manifest()
 
     
     if (review):
-        #load output/final_ontology.ttl
-        if os.path.exists("output/final_ontology.ttl"):
-            with open("output/final_ontology.ttl", "r", encoding="utf-8") as f:
-                ob.graph.parse(data=f.read(), format='turtle')
-            print("Loaded existing ontology from output/final_ontology.ttl")
-            logging.info("Loaded existing ontology from output/final_ontology.ttl\n")
+        # the saved state (persistent store, or snapshot + journal); output/final_ontology.ttl only if there is none
+        if ob.load_state():
+            print(f"Loaded existing ontology state ({len(ob.graph)} triples)")
+            logging.info(f"Loaded existing ontology state ({len(ob.graph)} triples)\n")
+        elif os.path.exists(FINAL_ONTOLOGY):
+            ob.load_file(FINAL_ONTOLOGY)
+            print(f"Loaded existing ontology from {FINAL_ONTOLOGY}")
+            logging.info(f"Loaded existing ontology from {FINAL_ONTOLOGY}\n")
         
     
         doc_paths = load_documents("data/review")
@@ -39,15 +598,22 @@ def run_pipeline(skip_raw=False, skip_ocr=False, review=False  ):
                     turtle_str = f.read()
                 print(f"Merging fragment from {doc_path}")
                 logging.info(f"Merging fragment from {doc_path}\n")
-                res = ob.merge_fragment(turtle_str)
+                chunk_key, entry = reviewed_chunk(doc_path, manifest)
+                source = chunk_source(chunk_key.rpartition("#")[0], entry["fragment"], manifest) if chunk_key else None
+                res = ob.merge_fragment(turtle_str, source=source)
                 if (res):
+                    # the next normal run rebuilds from the saved fragments: keep the reviewed one there
+                    if chunk_key:
+                        accept_reviewed_fragment(chunk_key, entry, turtle_str, manifest)
                     os.remove(doc_path)
                     print(f"Fragment {doc_path} merged successfully and removed from review folder.")
             else:
                 print(f"Unsupported file type in review: {doc_path}. Skipping.")
                 logging.info(f"Unsupported file type in review: {doc_path}. Skipping.\n")
                 continue
-        ob.save_to_file("output/final_ontology.ttl")
+        manifest.flush()
+        finish_ontology(ob, export_turtle)
+        metrics.write()
         return
         
 
@@ -55,108 +621,117 @@ def run_pipeline(skip_raw=False, skip_ocr=False, review=False  ):
 
 
 
+    # a normal run rebuilds the ontology (and its provenance) from the chunk fragments;
+    # the saved state is replaced only once the rebuild has finished
+    ob.begin_rebuild()
+
     #converting pdf to images and copying images to data/images
+    direct_ocr = os.getenv("PDF_DIRECT_OCR", "0") == "1" and not skip_ocr
+    pending_pdfs = {}
     for doc_path in doc_paths_raw:
-        if doc_path.endswith('.pdf'):
-            print(f"Processing PDF document: {doc_path}")
-            logging.info(f"Processing PDF document: {doc_path}\n")
-            convert_pdf_to_images(doc_path)
-            print(f"Converted {doc_path} to images.")
-        
-        elif doc_path.endswith(('.png', '.jpg', '.jpeg')):
-            
-            os.makedirs(images_dir, exist_ok=True)
-            dest_path = os.path.join(images_dir, os.path.basename(doc_path))
-            shutil.copy(doc_path, dest_path)
-            print(f"Copied {doc_path} to {dest_path}")
-            logging.info(f"Copied {doc_path} to {dest_path}\n")
-
-        elif doc_path.endswith('.txt'):
-            #move to processed folder
-            processed_dir = "data/processed"
-            os.makedirs(processed_dir, exist_ok=True)
-            dest_path = os.path.join(processed_dir, os.path.basename(doc_path))
-            shutil.copy(doc_path, dest_path)
-            print(f"Copied {doc_path} to {dest_path}")
-            logging.info(f"Copied {doc_path} to {dest_path}\n")
-        else:
-            print(f"Unsupported file type: {doc_path}. Skipping.")
-            logging.info(f"Unsupported file type: {doc_path}. Skipping.\n")
-            continue
+        ingest_raw(doc_path, manifest, images_dir, direct_ocr, pending_pdfs)
+    rasterize_pdfs(pending_pdfs, manifest)
+    manifest.flush()
 
     #running OCR on images
     for doc_path in load_documents(images_dir) if not skip_ocr else []:
-        if doc_path.endswith(('.png', '.jpg', '.jpeg')):
-            text = extract_text_from_image(doc_path)
-            if not text:
-                print(f"No text extracted from {doc_path}. Skipping.")
-                logging.info(f"No text extracted from {doc_path}. Skipping.\n")
-                continue
-            print(f"Extracted text from {doc_path}.")
-            logging.info(f"Extracted text from {doc_path}.\n")
-            
-            text_filename = f"data/processed/{os.path.splitext(os.path.basename(doc_path))[0]}.txt"
-            
-            with open(text_filename, "w", encoding="utf-8") as text_file:
-                text_file.write(text)
-                print(f"Text saved to {text_filename}")     
-                logging.info(f"Text saved to {text_filename}\n")
-        else:
-            print(f"Unsupported file type for OCR: {doc_path}. Skipping.")
-            logging.info(f"Unsupported file type for OCR: {doc_path}. Skipping.\n")
-            continue
+        ocr_image(doc_path, manifest, images_dir)
+    manifest.flush()
 
     #processing text files and generating ontology fragments
-    for doc_path in doc_paths_processed: 
-        if doc_path.endswith('.txt'):
-            with open(doc_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-
-            chunks = split_text(text, CHUNK_SIZE)
-            print(f"Processing {len(chunks)} chunks from {doc_path}.")
-            logging.info(f"Processing {len(chunks)} chunks from {doc_path}.\n")
-
-            for i, chunk in enumerate(chunks):
-                prompt = build_generation_prompt(chunk)
-                fragment = run_llm(prompt)
-                print(f"Generated fragment for chunk: {i}")  
-                logging.info(f"Generated fragment for chunk: {i}\n")
-                
-                # print("waiting for 60 seconds before processing the next chunk...")
-                
-
-                fragment_filename = f"data/ontology_fragments/{os.path.basename(doc_path)}_{chunks.index(chunk)}.ttl"
-                with open(fragment_filename, "w", encoding="utf-8") as frag_file:
-                    frag_file.write(fragment)
-                print(f"Fragment saved to {fragment_filename}")
+    # listed after OCR so that text extracted in this run is picked up
+    doc_paths_processed = load_documents("data/processed")
+    sharded = merge_workers > 1
+    with metrics.stage("generation"):
+        documents = asyncio.run(generate_ontology(doc_paths_processed, ob, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS,
+                                                  concurrency, manifest, sharded=sharded))
+    if sharded:
+        with metrics.stage("sharded_merge"):
+            merge_sharded(ob, documents, merge_workers, manifest)
 
+    ob.finish_rebuild()
+    finish_ontology(ob, export_turtle)
+    if ob.repair_stats:
+        logging.info(f"Fragment repairs: {dict(ob.repair_stats)}\n")
+    report_duplicates()
+    metrics.write()
+    logging.info(f"Run metrics: {json.dumps(metrics.summary()['stages'])}\n")
+    print("Run metrics written to logs/metrics.json and logs/metrics.prom")
+    logging.info("Ontology generation pipeline completed.\n")
 
-                mergeSuccess = ob.merge_fragment(fragment)
+WATCH_DIRS = ("data/raw", "data/images", "data/processed")
 
-                #if unsuccessful, save ttl to review folder
-                if not mergeSuccess:
-                    print(f"fragment {fragment_filename} did not merge due to error")
-                    logging.error(f"fragment {fragment_filename} did not merge due to error\n")
-                    fragment_filename = f"data/review/{os.path.basename(doc_path)}_{chunks.index(chunk)}.ttl"
-                    with open(fragment_filename, "w", encoding="utf-8") as frag_file:
-                        frag_file.write(fragment)
+def _within(path, folder):
+    path, folder = os.path.abspath(path), os.path.abspath(folder)
+    return os.path.commonpath([path, folder]) == folder
 
+def run_daemon(concurrency=None, use_cache=True, refresh_cache=False, folders=WATCH_DIRS, use_dedup=True):
+    """
+    Long-running ingestion: watches `folders` (inotify, or polling) and feeds
+    new and changed files, smallest first, through a bounded priority queue
+    into the stage of the folder they are in: raw documents, page images
+    (OCR) or text (generation). Each stage writes into the next stage's
+    folder, so a dropped document flows through all of them. Finished work is
+    skipped through the manifest. Runs until interrupted.
+    """
+    logging.info("Starting ingestion daemon")
+    cache.configure(enabled=use_cache, refresh=refresh_cache)
+    dedup.configure(enabled=use_dedup and os.getenv("DEDUP", "1") != "0")
+    for folder in folders + ("data/ontology_fragments", "data/review"):
+        os.makedirs(folder, exist_ok=True)
+    BASE_URI = os.getenv("BASE_URI", "http://example.com/ontology")
+    CHUNK_TOKENS = chunk_token_budget()
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 0))
+    if concurrency is None:
+        concurrency = int(os.getenv("LLM_CONCURRENCY", 4))
+    direct_ocr = os.getenv("PDF_DIRECT_OCR", "0") == "1"
+    images_dir = "data/images"
 
-                if (i == len(chunks) -1 ):
-                    logging.info(f"Validating ontology for {doc_path}...\n")
-                    isValid = ob.validate_ontology_llm()
-                    if not isValid:
-                        print(f"Ontology validation failed for {doc_path}.")
-                        logging.error(f"Ontology validation failed for {doc_path}.\n")
-                    else:
-                        print(f"Ontology validation successful for {doc_path}.")
-                        logging.info(f"Ontology validation successful for {doc_path}.\n")
-                    
+    ob = OntologyBuilder(BASE_URI)
+    # the daemon keeps adding to the saved ontology instead of rebuilding it
+    loaded = ob.load_state()
+    if loaded:
+        print(f"Loaded existing ontology state ({len(ob.graph)} triples)")
+    manifest = Manifest()
 
-        else:
-            print(f"Unsupported file type for processing: {doc_path}. Skipping.")
-            logging.info(f"Unsupported file type for processing: {doc_path}. Skipping.\n")
-            continue
+    work = WorkQueue(int(os.getenv("WATCH_QUEUE_SIZE", 1000)))
+    watcher = make_watcher(list(folders), float(os.getenv("WATCH_INTERVAL", 2)))
+    stop = threading.Event()
+    # files already in the folders; finished ones are skipped by the manifest
+    backlog = [path for folder in folders for path in load_documents(folder, recursive=True)]
+    thread = threading.Thread(target=watch_into, args=(watcher, work, stop, backlog), daemon=True)
+    thread.start()
+    print(f"Watching {', '.join(folders)} ({type(watcher).__name__}). Press Ctrl+C to stop.")
 
-    ob.save_to_file("output/final_ontology.ttl")
-    logging.info("Ontology generation pipeline completed.\n")
\ No newline at end of file
+    try:
+        while True:
+            path = work.get(timeout=1.0)
+            if path is None or not os.path.isfile(path):
+                continue
+            metrics.set("watch_queue_length", len(work))
+            try:
+                if _within(path, images_dir):
+                    ocr_image(path, manifest, images_dir)
+                elif _within(path, "data/processed"):
+                    with metrics.stage("generation"):
+                        # documents merged into the loaded state are skipped, not merged again
+                        asyncio.run(generate_ontology([path], ob, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, concurrency, manifest,
+                                                      skip_done=loaded))
+                    ob.checkpoint()
+                else:
+                    ingest_raw(path, manifest, images_dir, direct_ocr)
+            except Exception as e:
+                print(f"Error processing {path}: {e}")
+                logging.exception(f"Error processing {path}\n")
+            manifest.flush()
+            metrics.inc("watch_files", 1)
+    except KeyboardInterrupt:
+        print("Stopping ingestion daemon.")
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+        watcher.close()
+        finish_ontology(ob)
+        report_duplicates()
+        metrics.write()
+        logging.info("Ingestion daemon stopped.\n")
@@ -1,10 +1,15 @@
-def build_generation_prompt(text_chunk):
+def build_generation_prompt(text_chunk, vocabulary=""):
+    if vocabulary:
+        vocabulary = f"""
+CURRENT ONTOLOGY (existing terms related to the text; reuse these exact URIs and prefixes instead of creating new ones for the same concepts):
+{vocabulary}
+"""
     return f"""
 You are an ontology engineer. Convert the following text into an OWL ontology fragment using Turtle syntax.
 
 TEXT:
 "{text_chunk}"
-
+{vocabulary}
 TASK:
 Your task is to generate a turtle fragment that represents the concepts, relationships, and properties described in the text. Ensure that the fragment is consistent with the current ontology.
 Make sure to use appropriate prefixes and URIs for the ontology elements. The fragment should be valid Turtle syntax and should not include any extraneous information.
@@ -54,7 +59,16 @@ IMPORTANT  Common Mistakes to Avoid:
 
 """
 
-def build_validation_prompt(ontology):
+def build_validation_prompt(ontology, violations=None, context=None):
+    if violations:
+        problems = "\n".join(f"        - <{v.term}>: {v.message}" for v in violations)
+        ontology = f"""{ontology}
+
+        KNOWN PROBLEMS (found by a local checker, fix these first):
+{problems}
+
+        CONTEXT (existing declarations referenced above; they are valid, do not return them):
+        {context or ""}"""
     return f"""
         You are an ontology validator. Review the following OWL ontology in Turtle format.
 
@@ -0,0 +1,148 @@
+import hashlib
+import os
+from urllib.parse import quote
+from rdflib import Dataset, Literal, Namespace, URIRef
+from src.journal import KeepLabels
+
+SRC = Namespace("urn:ontology-generator:source#")
+METADATA = URIRef("urn:ontology-generator:provenance")
+
+class ProvenanceStore:
+    """
+    Where every merged triple came from: an rdflib Dataset with one named
+    graph per chunk fragment (the triples it contributed, after
+    canonicalization) and, in the METADATA graph, the processed text file
+    (`SRC.document`), the raw document (`SRC.source`), the page and the
+    fragment file of each chunk graph. Kept on disk as one N-Quads file per
+    document in `directory`, so saving after a change rewrites only the
+    documents that changed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._clear()
+
+    def _clear(self):
+        self.dataset = Dataset()
+        self.metadata = self.dataset.graph(METADATA)
+        # document -> identifiers of its chunk graphs
+        self.by_document = {}
+        self.dirty = set()
+        # set by reset(): the next save() replaces every saved file
+        self.replace_all = False
+
+    def _path(self, document):
+        name = hashlib.sha1(document.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{name}.nq")
+
+    def load(self):
+        """Reads the saved chunk graphs. Returns the number of documents."""
+        self._clear()
+        if not os.path.isdir(self.directory):
+            return 0
+        labels = KeepLabels()
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".nq"):
+                self.dataset.parse(os.path.join(self.directory, name), format="nquads", bnode_context=labels)
+        self.metadata = self.dataset.graph(METADATA)
+        for chunk_graph, document in self.metadata.subject_objects(SRC.document):
+            self.by_document.setdefault(str(document), set()).add(chunk_graph)
+        return len(self.by_document)
+
+    def has_document(self, document):
+        return document in self.by_document
+
+    def covers(self, document):
+        """Whether chunk graphs are recorded for `document`, a processed text file or a raw document."""
+        return self.has_document(document) or \
+            next(iter(self.metadata.subjects(SRC.source, Literal(document))), None) is not None
+
+    def record(self, graph, document, fragment, source=None, page=None):
+        """Stores `graph` as the chunk graph of `fragment`, replacing what that chunk contributed before."""
+        identifier = URIRef("urn:fragment:" + quote(fragment, safe=""))
+        chunk_graph = self.dataset.graph(identifier)
+        chunk_graph.remove((None, None, None))
+        chunk_graph += graph
+        previous = self.metadata.value(identifier, SRC.document)
+        if previous is not None and str(previous) != document:
+            self.by_document.get(str(previous), set()).discard(identifier)
+            self.dirty.add(str(previous))
+        self.metadata.remove((identifier, None, None))
+        self.metadata.add((identifier, SRC.document, Literal(document)))
+        self.metadata.add((identifier, SRC.fragment, Literal(fragment)))
+        if source:
+            self.metadata.add((identifier, SRC.source, Literal(source)))
+        if page is not None:
+            self.metadata.add((identifier, SRC.page, Literal(page)))
+        self.by_document.setdefault(document, set()).add(identifier)
+        self.dirty.add(document)
+
+    def retract(self, document):
+        """
+        Forgets the chunk graphs of `document` (a processed text file, or the
+        raw document it was extracted from). Returns the triples they
+        contributed that no other chunk graph asserts.
+        """
+        identifiers = set(self.by_document.get(document, ()))
+        identifiers.update(self.metadata.subjects(SRC.source, Literal(document)))
+        if not identifiers:
+            return []
+        retracted = set()
+        for identifier in identifiers:
+            retracted.update(self.dataset.graph(identifier))
+        # the store's own index of the graphs holding a triple (Dataset.contexts() adds the default graph)
+        orphaned = [triple for triple in retracted
+                    if all(c.identifier in identifiers for c in self.dataset.store.contexts(triple))]
+        for identifier in identifiers:
+            owner = str(self.metadata.value(identifier, SRC.document))
+            self.by_document.get(owner, set()).discard(identifier)
+            if not self.by_document.get(owner):
+                self.by_document.pop(owner, None)
+            self.dirty.add(owner)
+            self.dataset.remove_graph(identifier)
+            self.metadata.remove((identifier, None, None))
+        return orphaned
+
+    def documents(self):
+        return sorted(self.by_document)
+
+    def save(self):
+        """Rewrites the files of the documents changed since the last save (after reset(), of all of them)."""
+        if self.replace_all:
+            if os.path.isdir(self.directory):
+                keep = {os.path.basename(self._path(document)) for document in self.by_document}
+                for name in os.listdir(self.directory):
+                    if name.endswith(".nq") and name not in keep:
+                        os.remove(os.path.join(self.directory, name))
+            self.dirty = set(self.by_document)
+            self.replace_all = False
+        if not self.dirty:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for document in self.dirty:
+            path = self._path(document)
+            identifiers = self.by_document.get(document)
+            if not identifiers:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            out = Dataset()
+            out_metadata = out.graph(METADATA)
+            for identifier in identifiers:
+                chunk_graph = out.graph(identifier)
+                chunk_graph += self.dataset.graph(identifier)
+                for triple in self.metadata.triples((identifier, None, None)):
+                    out_metadata.add(triple)
+            tmp = path + ".tmp"
+            out.serialize(destination=tmp, format="nquads")
+            os.replace(tmp, path)
+        self.dirty = set()
+
+    def reset(self):
+        """
+        Drops every chunk graph, e.g. before the ontology is rebuilt from its
+        fragments. The saved files are left alone until the next save(),
+        which replaces them all.
+        """
+        self._clear()
+        self.replace_all = True
@@ -1,9 +1,201 @@
+import argparse
+import atexit
+import glob
+import gzip
+import hashlib
 import json
+import logging
 import os
+import queue
+import shutil
+import sys
+import threading
 import time
 
+class ResponseLogWriter:
+    """
+    Background writer for a JSONL log. Records are queued by the caller and
+    written in batches by a daemon thread, every `flush_interval` seconds or
+    when `batch_size` records are waiting, and at interpreter exit. The
+    current file is rotated once it exceeds `max_bytes` or has been written
+    to for `rotate_seconds`; rotated segments are gzipped. Outputs of at
+    least `blob_threshold` characters are stored once per content hash under
+    `<log dir>/blobs/` and referenced by `output_ref`.
+    """
+
+    def __init__(self, filename, flush_interval=2.0, batch_size=200, max_bytes=100 * 1024 * 1024,
+                 rotate_seconds=24 * 3600, blob_threshold=4096):
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.blob_threshold = blob_threshold
+        self.blob_dir = os.path.join(os.path.dirname(filename) or ".", "blobs")
+        self.queue = queue.Queue()
+        self.segment_started = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"ResponseLogWriter({filename})", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        self.queue.put(record)
+
+    def flush(self):
+        """Blocks until every queued record has been written."""
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            stop = None in batch
+            records = [r for r in batch if r is not None]
+            try:
+                if records:
+                    self._write_batch(records)
+            except Exception as e:
+                # keep draining the queue: a dead writer would block flush() and the exit handler forever
+                logging.error(f"Could not write {len(records)} records to {self.filename}: {e}\n")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def _store_blob(self, output):
+        digest = hashlib.sha256(output.encode("utf-8")).hexdigest()
+        path = os.path.join(self.blob_dir, digest[:2], f"{digest}.txt.gz")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as f:
+                f.write(output)
+            os.replace(f"{path}.tmp", path)
+        return digest
+
+    def _write_batch(self, records):
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        lines = []
+        for record in records:
+            output = record.get("output")
+            if self.blob_threshold and isinstance(output, str) and len(output) >= self.blob_threshold:
+                record = {**record, "output_ref": self._store_blob(output)}
+                del record["output"]
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+            except (TypeError, ValueError) as e:
+                logging.error(f"Dropped a response log record that is not JSON-serializable: {e}\n")
+        with open(self.filename, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+        self._maybe_rotate()
+
+    def _maybe_rotate(self):
+        too_big = self.max_bytes and os.path.getsize(self.filename) >= self.max_bytes
+        too_old = self.rotate_seconds and time.time() - self.segment_started >= self.rotate_seconds
+        if not (too_big or too_old):
+            return
+        base, ext = os.path.splitext(self.filename)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        n = 0
+        rotated = f"{base}.{stamp}-{n:03d}{ext}"
+        while os.path.exists(rotated) or os.path.exists(f"{rotated}.gz"):
+            n += 1
+            rotated = f"{base}.{stamp}-{n:03d}{ext}"
+        os.replace(self.filename, rotated)
+        with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        self.segment_started = time.time()
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(filename="logs/llm_responses.jsonl"):
+    with _writers_lock:
+        if filename not in _writers:
+            _writers[filename] = ResponseLogWriter(
+                filename,
+                flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", 2)),
+                max_bytes=int(float(os.getenv("LOG_MAX_MB", 100)) * 1024 * 1024),
+                rotate_seconds=float(os.getenv("LOG_ROTATE_HOURS", 24)) * 3600,
+                blob_threshold=int(os.getenv("LOG_BLOB_THRESHOLD", 4096)),
+            )
+        return _writers[filename]
+
+@atexit.register
+def close_writers():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
 def logResponse(data, filename="logs/llm_responses.jsonl"):
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
     data["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
-    with open(filename, "a", encoding="utf-8") as f:
-        f.write(json.dumps(data, ensure_ascii=False) + "\n")
+    get_writer(filename).write(data)
+
+def log_segments(filename="logs/llm_responses.jsonl"):
+    """Rotated segments (oldest first), then the current file."""
+    base, ext = os.path.splitext(filename)
+    segments = sorted(glob.glob(f"{glob.escape(base)}.*{ext}.gz") + glob.glob(f"{glob.escape(base)}.*{ext}"))
+    if os.path.exists(filename):
+        segments.append(filename)
+    return segments
+
+def _read_blob(blob_dir, digest):
+    with gzip.open(os.path.join(blob_dir, digest[:2], f"{digest}.txt.gz"), "rt", encoding="utf-8") as f:
+        return f.read()
+
+def read_responses(filename="logs/llm_responses.jsonl", status=None, since=None, resolve_outputs=True):
+    """
+    Streams records from all segments of the log, oldest first. Optionally
+    keeps only a given `status` and records at or after `since`
+    ("YYYY-MM-DD HH:MM:SS"), and loads deduplicated outputs back in.
+    """
+    writer = _writers.get(filename)
+    if writer is not None:
+        writer.flush()
+    blob_dir = os.path.join(os.path.dirname(filename) or ".", "blobs")
+    for segment in log_segments(filename):
+        opener = gzip.open if segment.endswith(".gz") else open
+        with opener(segment, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if status is not None and record.get("status") != status:
+                    continue
+                if since is not None and record.get("timestamp", "") < since:
+                    continue
+                if resolve_outputs and "output_ref" in record:
+                    record["output"] = _read_blob(blob_dir, record["output_ref"])
+                yield record
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream records from the LLM response log, across rotated segments")
+    parser.add_argument("--file", default="logs/llm_responses.jsonl")
+    parser.add_argument("--status", default=None, help="e.g. success, groq_error, exception")
+    parser.add_argument("--since", default=None, help="only records at or after this timestamp (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--image", default=None, help="only OCR records whose image_path contains this text")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--no-outputs", action="store_true", help="do not load deduplicated outputs")
+    args = parser.parse_args()
+
+    count = 0
+    for record in read_responses(args.file, args.status, args.since, resolve_outputs=not args.no_outputs):
+        if args.image is not None and args.image not in (record.get("image_path") or ""):
+            continue
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+        if args.limit is not None and count >= args.limit:
+            break
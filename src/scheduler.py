@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from groq import GroqError, APIConnectionError, APIStatusError, RateLimitError
+from src.metrics import metrics
+from src.splitter import count_tokens
+
+class QuotaExhaustedError(GroqError):
+    """Every key/model lane is rate limited for longer than the scheduler is willing to wait."""
+
+def error_headers(e):
+    headers = getattr(e, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(e, "response", None), "headers", None)
+    return dict(headers) if headers else {}
+
+def is_rate_limit(e):
+    return isinstance(e, RateLimitError) or getattr(e, "status_code", None) == 429 \
+        or "retry-after" in error_headers(e)
+
+def is_transient(e):
+    if isinstance(e, APIConnectionError):
+        return True
+    return isinstance(e, APIStatusError) and (e.status_code >= 500 or e.status_code in (408, 409))
+
+_DURATION = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+def parse_duration(value):
+    """Seconds in a Groq reset header ("7.66s", "2m59.56s", "120ms") or a plain number."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = _DURATION.findall(str(value))
+    return sum(float(n) * units[u] for n, u in parts) if parts else None
+
+def estimate_tokens(request):
+    text = []
+    for message in request.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            text.append(content)
+        else:
+            text.extend(part["text"] for part in content if part.get("type") == "text")
+    return count_tokens("\n".join(text))
+
+class Lane:
+    """
+    One API key / model pair and what is known about its budget: the
+    remaining requests and tokens reported by the last response headers, a
+    cool-down after rate-limit errors, and optionally local requests- and
+    tokens-per-minute ceilings (GROQ_RPM / GROQ_TPM) tracked over a sliding
+    minute.
+    """
+
+    def __init__(self, api_key=None, model=None, rpm=0, tpm=0):
+        self.api_key = api_key
+        # None: keep the model of the request
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.remaining_requests = None
+        self.requests_reset_at = 0.0
+        self.remaining_tokens = None
+        self.tokens_reset_at = 0.0
+        self.cooldown_until = 0.0
+        self.failures = 0
+        self.window = deque()
+
+    def __repr__(self):
+        key = f"...{self.api_key[-4:]}" if self.api_key else "default key"
+        return f"Lane({key}, {self.model or 'primary model'})"
+
+    def wait_time(self, tokens, now):
+        while self.window and self.window[0][0] <= now - 60:
+            self.window.popleft()
+        wait = self.cooldown_until - now
+        if self.remaining_requests is not None and self.remaining_requests <= 0:
+            wait = max(wait, self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+            wait = max(wait, self.tokens_reset_at - now)
+        if self.window:
+            if self.rpm and len(self.window) >= self.rpm:
+                wait = max(wait, self.window[0][0] + 60 - now)
+            if self.tpm and sum(t for _, t in self.window) + tokens > self.tpm:
+                wait = max(wait, self.window[0][0] + 60 - now)
+        return max(wait, 0.0)
+
+    def reserve(self, tokens, now):
+        self.window.append([now, tokens])
+        if self.remaining_requests is not None and now < self.requests_reset_at:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None and now < self.tokens_reset_at:
+            self.remaining_tokens -= tokens
+        return self.window[-1]
+
+    def update(self, headers, now):
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if "x-ratelimit-remaining-requests" in headers:
+            self.remaining_requests = float(headers["x-ratelimit-remaining-requests"])
+            self.requests_reset_at = now + (parse_duration(headers.get("x-ratelimit-reset-requests")) or 60)
+        if "x-ratelimit-remaining-tokens" in headers:
+            self.remaining_tokens = float(headers["x-ratelimit-remaining-tokens"])
+            self.tokens_reset_at = now + (parse_duration(headers.get("x-ratelimit-reset-tokens")) or 60)
+        self.failures = 0
+
+class RateLimitScheduler:
+    """
+    Spreads requests over a pool of lanes (API keys x models). Before each
+    call it picks the ready lane of the most preferred model with the most
+    token budget left, or sleeps until the earliest lane frees up. Rate-limit
+    errors cool the lane down for `retry-after` (or an exponential backoff)
+    plus jitter and the request is retried on another lane; connection and
+    5xx errors are retried with backoff. Gives up with QuotaExhaustedError
+    when no lane frees up within `max_wait` seconds.
+    """
+
+    def __init__(self, lanes, max_retries=8, base_delay=1.0, max_delay=60.0, max_wait=300.0):
+        self.lanes = lanes
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def _backoff(self, attempt):
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _acquire(self, tokens):
+        """Reserves budget on the best lane; returns (lane, reservation, wait in seconds)."""
+        with self._lock:
+            now = time.monotonic()
+            waits = [(lane.wait_time(tokens, now), i, lane) for i, lane in enumerate(self.lanes)]
+            ready = [(i, lane) for wait, i, lane in waits if wait == 0]
+            if ready:
+                models = [lane.model for lane in self.lanes]
+                _, lane = min(ready, key=lambda item: (
+                    models.index(item[1].model),
+                    -(item[1].remaining_tokens if item[1].remaining_tokens is not None else float("inf")),
+                    len(item[1].window),
+                    item[0]))
+                return lane, lane.reserve(tokens, now), 0.0
+            wait, _, lane = min(waits, key=lambda w: (w[0], w[1]))
+            if wait > self.max_wait:
+                raise QuotaExhaustedError(f"All {len(self.lanes)} API key/model lanes are rate limited for at least {wait:.0f}s")
+            return lane, None, wait
+
+    def _on_success(self, lane, reservation, response):
+        with self._lock:
+            now = time.monotonic()
+            lane.update(response.headers, now)
+            usage = response.usage or {}
+            if usage.get("total_tokens"):
+                reservation[1] = usage["total_tokens"]
+
+    def _on_error(self, lane, e, attempt):
+        """Returns True if the request should be retried."""
+        with self._lock:
+            now = time.monotonic()
+            if is_rate_limit(e):
+                headers = error_headers(e)
+                lane.update(headers, now)
+                lane.failures += 1
+                retry_after = parse_duration(headers.get("retry-after"))
+                delay = retry_after if retry_after is not None else self._backoff(lane.failures)
+                lane.cooldown_until = now + delay + self._random.uniform(0, self.base_delay)
+                metrics.inc("rate_limited", 1)
+            elif not is_transient(e):
+                return False
+            else:
+                lane.cooldown_until = now + self._backoff(attempt)
+        if attempt + 1 >= self.max_retries:
+            return False
+        metrics.inc("retries", 1)
+        logging.warning(f"{lane} failed ({e}); retrying (attempt {attempt + 2}/{self.max_retries})\n")
+        return True
+
+    def _request_for(self, lane, request):
+        return {**request, "model": lane.model} if lane.model else request
+
+    def call(self, fn, request):
+        """
+        Runs fn(api_key, **request) under the scheduler. Blocks the calling
+        thread while it waits for a lane: from async code, use acall() or
+        call this from a worker thread.
+        """
+        tokens = estimate_tokens(request)
+        attempt = 0
+        while True:
+            lane, reservation, wait = self._acquire(tokens)
+            if reservation is None:
+                metrics.observe("scheduler_wait_seconds", wait)
+                time.sleep(wait)
+                continue
+            try:
+                response = fn(lane.api_key, **self._request_for(lane, request))
+            except Exception as e:
+                if not self._on_error(lane, e, attempt):
+                    raise
+                attempt += 1
+                continue
+            self._on_success(lane, reservation, response)
+            return response
+
+    async def acall(self, fn, request):
+        tokens = estimate_tokens(request)
+        attempt = 0
+        while True:
+            lane, reservation, wait = self._acquire(tokens)
+            if reservation is None:
+                metrics.observe("scheduler_wait_seconds", wait)
+                await asyncio.sleep(wait)
+                continue
+            try:
+                response = await fn(lane.api_key, **self._request_for(lane, request))
+            except Exception as e:
+                if not self._on_error(lane, e, attempt):
+                    raise
+                attempt += 1
+                continue
+            self._on_success(lane, reservation, response)
+            return response
+
+def _split_env(name):
+    return [v.strip() for v in os.getenv(name, "").split(",") if v.strip()]
+
+def lanes_from_env():
+    """
+    GROQ_API_KEYS (comma separated, default GROQ_API_KEY) x the request's
+    model followed by GROQ_FALLBACK_MODELS, in order of preference.
+    """
+    keys = _split_env("GROQ_API_KEYS") or [os.getenv("GROQ_API_KEY")]
+    models = [None] + _split_env("GROQ_FALLBACK_MODELS")
+    rpm = int(os.getenv("GROQ_RPM", 0))
+    tpm = int(os.getenv("GROQ_TPM", 0))
+    return [Lane(key, model, rpm, tpm) for model in models for key in keys]
+
+def scheduler_from_env():
+    return RateLimitScheduler(
+        lanes_from_env(),
+        max_retries=int(os.getenv("SCHEDULER_MAX_RETRIES", 8)),
+        base_delay=float(os.getenv("SCHEDULER_BASE_DELAY", 1)),
+        max_delay=float(os.getenv("SCHEDULER_MAX_DELAY", 60)),
+        max_wait=float(os.getenv("SCHEDULER_MAX_WAIT", 300)),
+    )
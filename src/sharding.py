@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor
+from rdflib import Graph
+from src.turtle_repair import repair_turtle
+
+def parse_document(fragment_filenames):
+    """
+    Worker: parses the fragments of one document, with local repair.
+    Returns one (fragment filename, triples, prefixes, local fixes) tuple per
+    fragment; triples is None for a fragment that could not be repaired
+    locally. The triples are rdflib terms, which are sent back pickled, so
+    the parent does not parse anything again.
+    """
+    parsed = []
+    for fragment_filename in fragment_filenames:
+        with open(fragment_filename, 'r', encoding='utf-8') as f:
+            fragment = f.read()
+        graph = Graph()
+        fixes = []
+        try:
+            graph.parse(data=fragment, format='turtle')
+        except Exception:
+            graph, fixes = repair_turtle(fragment)
+            if graph is None:
+                parsed.append((fragment_filename, None, {}, []))
+                continue
+        prefixes = {prefix: str(namespace) for prefix, namespace in graph.namespaces()}
+        parsed.append((fragment_filename, list(graph), prefixes, fixes))
+    return parsed
+
+def parse_sharded(documents, workers):
+    """
+    Parses the fragments of {doc_path: [fragment filenames]} across `workers`
+    processes. Yields (doc_path, parsed fragments) in document order, each
+    as soon as it and the documents before it are done, so the caller can
+    merge one document while the workers parse the next ones.
+    """
+    doc_paths = list(documents)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for doc_path, parsed in zip(doc_paths, executor.map(parse_document, [documents[d] for d in doc_paths])):
+            yield doc_path, parsed
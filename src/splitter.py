@@ -1,7 +1,168 @@
-def split_text(text, max_length):
+import math
+import os
+import re
+
+# Approximate characters per token for the tokenizer families behind Groq-hosted
+# models, measured on English prose. TOKEN_CHARS_RATIO overrides the lookup.
+CHARS_PER_TOKEN = {
+    "llama": 3.8,
+    "gemma": 3.9,
+    "mixtral": 3.5,
+    "mistral": 3.5,
+    "qwen": 3.6,
+    "deepseek": 3.6,
+    "gpt-oss": 4.0,
+    "kimi": 3.7,
+}
+
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+def chars_per_token(model=None):
+    if os.getenv("TOKEN_CHARS_RATIO"):
+        return float(os.getenv("TOKEN_CHARS_RATIO"))
+    model = (model or os.getenv("GROQ_MODEL") or "").lower()
+    for family, ratio in CHARS_PER_TOKEN.items():
+        if family in model:
+            return ratio
+    return 4.0
+
+def chunk_token_budget(model=None):
     """
-    Splits input text into chunks of `max_length` characters.
+    Token budget per chunk: CHUNK_TOKENS, or else the older CHUNK_SIZE (a
+    budget in characters) converted to tokens.
+    """
+    if os.getenv("CHUNK_TOKENS"):
+        return int(os.getenv("CHUNK_TOKENS"))
+    if os.getenv("CHUNK_SIZE"):
+        return max(1, int(int(os.getenv("CHUNK_SIZE")) / chars_per_token(model)))
+    return 1000
+
+def count_tokens(text, model=None):
+    return math.ceil(len(text) / chars_per_token(model))
+
+def _is_table(lines):
+    return sum(1 for line in lines if "|" in line or "\t" in line) * 2 > len(lines)
+
+def _paragraphs(lines, max_chars):
+    """
+    Groups an iterable of lines into paragraphs (lists of lines) separated by
+    blank lines. Yields (lines, continued): a paragraph longer than
+    `max_chars` is yielded in parts as it is read, with continued=True for
+    every part after the first, so text without blank lines is not held whole.
+    """
+    paragraph, size, continued = [], 0, False
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.strip():
+            paragraph.append(line)
+            size += len(line) + 1
+            if size >= max_chars:
+                yield paragraph, continued
+                paragraph, size, continued = [], 0, True
+        elif paragraph:
+            yield paragraph, continued
+            paragraph, size, continued = [], 0, False
+        else:
+            continued = False
+    if paragraph:
+        yield paragraph, continued
+
+def _hard_split(unit, max_tokens, model):
+    """Last resort for a single sentence or row longer than the budget: split between words."""
+    piece = ""
+    for word in unit.split(" "):
+        while count_tokens(word, model) > max_tokens:
+            cut = int(max_tokens * chars_per_token(model))
+            if piece:
+                yield piece
+                piece = ""
+            yield word[:cut]
+            word = word[cut:]
+        candidate = f"{piece} {word}" if piece else word
+        if piece and count_tokens(candidate, model) > max_tokens:
+            yield piece
+            piece = word
+        else:
+            piece = candidate
+    if piece:
+        yield piece
+
+def _units(lines, max_tokens, model):
+    """
+    Yields (separator, unit) pairs: sentences of prose paragraphs, or whole
+    rows of tables. `separator` is what joins the unit to the previous one.
+    """
+    def pieces(unit):
+        return _hard_split(unit, max_tokens, model) if count_tokens(unit, model) > max_tokens else [unit]
+
+    separator = "\n\n"
+    # last sentence of a prose part, which the next part of its paragraph may finish
+    carry = ""
+    for paragraph, continued in _paragraphs(lines, int(max_tokens * chars_per_token(model))):
+        table = _is_table(paragraph)
+        if carry and (table or not continued):
+            for piece in pieces(carry):
+                yield separator, piece
+                separator = " "
+            carry = ""
+        if not continued:
+            separator = "\n\n"
+        elif table:
+            separator = "\n"
+        if table:
+            units, joiner = paragraph, "\n"
+        else:
+            text = " ".join(line.strip() for line in paragraph)
+            units, joiner = SENTENCE_END.split(f"{carry} {text}" if carry else text), " "
+            carry = units.pop()
+            if count_tokens(carry, model) > max_tokens:
+                # no sentence end in sight (e.g. OCR text without punctuation): cut between words
+                *done, carry = _hard_split(carry, max_tokens, model)
+                units += done
+        for unit in units:
+            for piece in pieces(unit):
+                yield separator, piece
+                separator = joiner
+    for piece in pieces(carry) if carry else []:
+        yield separator, piece
+        separator = " "
+
+def iter_chunks(lines, max_tokens, overlap_tokens=0, model=None):
+    """
+    Packs whole sentences, table rows and paragraphs into chunks of at most
+    `max_tokens` tokens of the configured model. `lines` can be an open file,
+    so large documents are streamed rather than loaded whole. Each chunk
+    starts with up to `overlap_tokens` tokens from the end of the previous one.
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    current = []
+    current_tokens = 0
+    for separator, unit in _units(lines, max_tokens, model):
+        tokens = count_tokens(unit, model)
+        if current and current_tokens + tokens > max_tokens:
+            yield _join(current)
+            tail = []
+            tail_tokens = 0
+            for item in reversed(current):
+                if tail_tokens + item[2] > overlap_tokens:
+                    break
+                tail.insert(0, item)
+                tail_tokens += item[2]
+            if tail_tokens + tokens > max_tokens:
+                tail, tail_tokens = [], 0
+            current, current_tokens = tail, tail_tokens
+        current.append((separator, unit, tokens))
+        current_tokens += tokens
+    if current:
+        yield _join(current)
+
+def _join(units):
+    return "".join((separator if i else "") + unit for i, (separator, unit, _) in enumerate(units))
+
+def split_text(text, max_tokens, overlap_tokens=0):
+    """
+    Splits input text into chunks of at most `max_tokens` tokens.
     This is necessary because LLMs have input token limits and perform better
     with smaller, focused prompts.
     """
-    return [text[i:i + max_length] for i in range(0, len(text), max_length)]
\ No newline at end of file
+    return list(iter_chunks(text.splitlines(), max_tokens, overlap_tokens))
@@ -0,0 +1,73 @@
+import re
+from rdflib import Graph
+
+STANDARD_PREFIXES = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+}
+
+CODE_FENCE = re.compile(r"^\s*```[\w-]*\s*$", re.MULTILINE)
+DIRECTIVE = re.compile(r"^\s*(@prefix|@base|PREFIX|BASE)\b", re.MULTILINE | re.IGNORECASE)
+DECLARED_PREFIX = re.compile(r"(?:@prefix|PREFIX)\s+([A-Za-z][\w.-]*)?:", re.IGNORECASE)
+# strings and IRIs are removed before looking for prefixed names, so "http:" inside them does not count
+STRING_OR_IRI = re.compile(r'"""[\s\S]*?"""|"(?:[^"\\\n]|\\.)*"|<[^<>\n]*>')
+PREFIXED_NAME = re.compile(r"(?<![\w:])([A-Za-z][\w-]*):(?=[\w])")
+IRI_WITH_SPACES = re.compile(r"<([^<>\n]*\s[^<>\n]*)>")
+
+def strip_code_fences(text):
+    return CODE_FENCE.sub("", text)
+
+def strip_leading_prose(text):
+    match = DIRECTIVE.search(text)
+    return text[match.start():] if match else text
+
+def add_standard_prefixes(text):
+    declared = set(DECLARED_PREFIX.findall(text))
+    used = set(PREFIXED_NAME.findall(STRING_OR_IRI.sub(" ", text)))
+    missing = [p for p in STANDARD_PREFIXES if p in used and p not in declared]
+    header = "".join(f"@prefix {p}: <{STANDARD_PREFIXES[p]}> .\n" for p in missing)
+    return header + text
+
+def add_final_period(text):
+    stripped = text.rstrip()
+    return stripped if stripped.endswith(".") else stripped + " ."
+
+def fix_iri_spaces(text):
+    return IRI_WITH_SPACES.sub(lambda m: "<" + re.sub(r"\s+", "_", m.group(1).strip()) + ">", text)
+
+# applied cumulatively, in this order
+FIXES = [
+    ("code_fences", strip_code_fences),
+    ("leading_prose", strip_leading_prose),
+    ("standard_prefixes", add_standard_prefixes),
+    ("final_period", add_final_period),
+    ("iri_spaces", fix_iri_spaces),
+]
+
+def _parse(text):
+    graph = Graph()
+    graph.parse(data=text, format="turtle")
+    return graph
+
+def repair_turtle(turtle_str):
+    """
+    Tries the mechanical fixes in FIXES one after another, re-parsing after
+    each one that changes the text. Returns (graph, names of the fixes
+    applied) on success, or (None, names of the fixes tried) if the
+    fragment still does not parse.
+    """
+    text = turtle_str or ""
+    applied = []
+    for name, fix in FIXES:
+        fixed = fix(text)
+        if fixed == text:
+            continue
+        text = fixed
+        applied.append(name)
+        try:
+            return _parse(text), applied
+        except Exception:
+            continue
+    return None, applied
@@ -0,0 +1,181 @@
+import re
+from collections import Counter
+from rdflib import Graph
+from src.turtle_repair import strip_code_fences, strip_leading_prose
+
+# @prefix/@base end with ".", SPARQL-style PREFIX/BASE end with the line
+DIRECTIVE_LINE = re.compile(r"^[ \t]*(?:@prefix|@base)\b[^\n]*?\.[ \t]*$|^[ \t]*(?:PREFIX|BASE)\b[^\n]*$",
+                            re.MULTILINE | re.IGNORECASE)
+
+class StreamAbort(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+class TurtleStreamGuard:
+    """
+    Incremental checks on a Turtle completion while it streams in. The text
+    is split into top-level statements (at a "." followed by whitespace,
+    outside strings, IRIs, comments and brackets; code fence lines are
+    skipped), and each completed statement is parsed into `graph` with the
+    directives seen so far. Raises StreamAbort as soon as the output goes off
+    the rails:
+
+    - the same statement is produced `max_repeats` times,
+    - the text ends in a short unit repeated over and over (a sampling loop),
+    - one statement grows past `max_statement_chars` (a runaway literal or
+      object list),
+    - `max_bad_statements` statements in a row do not parse (prose).
+    """
+
+    def __init__(self, max_repeats=3, max_statement_chars=4000, max_bad_statements=3, max_loop_unit=120):
+        self.max_repeats = max_repeats
+        self.max_statement_chars = max_statement_chars
+        self.max_bad_statements = max_bad_statements
+        self.max_loop_unit = max_loop_unit
+        self.text = ""
+        self.graph = Graph()
+        self.directives = []
+        self.statements = []
+        self.seen = Counter()
+        self.bad_in_row = 0
+        # False once a statement failed to parse or used a blank node label, which
+        # is only meaningful within one parse: `graph` then does not stand for the text
+        self.exact = True
+        self._pos = 0
+        self._start = 0
+        self._quote = None
+        self._escape = False
+        self._in_iri = False
+        self._in_comment = False
+        self._depth = 0
+        self._loop_checked = 0
+
+    def feed(self, delta):
+        """Adds streamed text; returns the statements it completed."""
+        self.text += delta
+        completed = self._scan(final=False)
+        if len(self.text) - self._start > self.max_statement_chars:
+            raise StreamAbort(f"statement longer than {self.max_statement_chars} characters")
+        if len(self.text) - self._loop_checked >= 64:
+            self._loop_checked = len(self.text)
+            self._check_loop()
+        return completed
+
+    def finish(self):
+        """
+        Handles the trailing statement. Returns the parsed graph, or None if
+        the text has to be parsed (and possibly repaired) as a whole.
+        """
+        self._scan(final=True)
+        rest = self.text[self._start:]
+        self._start = len(self.text)
+        rest = strip_code_fences(rest)
+        if rest.strip() and not self._parse(rest):
+            self.exact = False
+        return self.graph if self.exact else None
+
+    def _scan(self, final):
+        t = self.text
+        n = len(t)
+        i = self._pos
+        completed = []
+        while i < n:
+            c = t[i]
+            if self._in_comment:
+                if c == "\n":
+                    self._in_comment = False
+            elif self._quote:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == "\n" and len(self._quote) == 1:
+                    # single-quoted strings cannot span lines: an apostrophe in prose
+                    self._quote = None
+                elif c == self._quote[0]:
+                    if len(self._quote) == 3 and n - i < 3 and not final:
+                        break
+                    if t.startswith(self._quote, i):
+                        i += len(self._quote)
+                        self._quote = None
+                        continue
+            elif self._in_iri:
+                if c == ">" or c == "\n":
+                    self._in_iri = False
+            elif c == "#" or (c == "`" and t.startswith("```", i)):
+                self._in_comment = True
+            elif c == "<":
+                self._in_iri = True
+            elif c in "\"'":
+                if n - i < 3 and not final:
+                    break
+                self._quote = c * 3 if t.startswith(c * 3, i) else c
+                i += len(self._quote)
+                continue
+            elif c in "[(":
+                self._depth += 1
+            elif c in "])":
+                self._depth = max(self._depth - 1, 0)
+            elif c == "." and self._depth == 0:
+                if i + 1 == n and not final:
+                    break
+                if i + 1 == n or t[i + 1].isspace():
+                    statement = t[self._start:i + 1]
+                    self._start = i + 1
+                    self._statement(statement)
+                    completed.append(statement)
+            i += 1
+        self._pos = i
+        return completed
+
+    def _statement(self, statement):
+        statement = strip_code_fences(statement)
+        body = " ".join(statement.split())
+        if not DIRECTIVE_LINE.match(statement.strip()):
+            self.seen[body] += 1
+            if self.seen[body] >= self.max_repeats:
+                raise StreamAbort(f"statement repeated {self.seen[body]} times: {body[:80]}")
+        if self._parse(statement):
+            self.bad_in_row = 0
+            return
+        # prose before the first statement is dropped, like the leading_prose repair does
+        prose_dropped = not (self.statements or self.directives)
+        without_prose = strip_leading_prose(statement)
+        if without_prose != statement and self._parse(without_prose):
+            self.bad_in_row = 0
+            self.exact = self.exact and prose_dropped
+            return
+        self.bad_in_row += 1
+        if not prose_dropped:
+            self.exact = False
+        if self.bad_in_row >= self.max_bad_statements:
+            raise StreamAbort(f"{self.bad_in_row} statements in a row are not Turtle")
+
+    def _parse(self, statement):
+        directives = [m.group(0).strip() for m in DIRECTIVE_LINE.finditer(statement)]
+        graph = Graph()
+        try:
+            graph.parse(data="\n".join(self.directives) + "\n" + statement, format="turtle")
+        except Exception:
+            return False
+        self.directives.extend(directives)
+        body = DIRECTIVE_LINE.sub("", statement).strip()
+        if body:
+            self.statements.append(body)
+            if "_:" in body:
+                self.exact = False
+        for prefix, namespace in graph.namespaces():
+            self.graph.bind(prefix, namespace, override=False)
+        self.graph += graph
+        return True
+
+    def _check_loop(self):
+        t = self.text
+        for size in range(2, self.max_loop_unit + 1):
+            repeats = max(4, -(-200 // size))
+            if len(t) < size * repeats:
+                break
+            unit = t[-size:]
+            if unit.strip() and t.endswith(unit * repeats):
+                raise StreamAbort(f"output loops on {unit.strip()[:40]!r}")
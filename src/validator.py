@@ -0,0 +1,124 @@
+import os
+import re
+from collections import namedtuple
+from itertools import islice
+from rdflib import Graph, Literal, URIRef, RDF, RDFS, OWL, XSD
+from rdflib.namespace import DC, DCAT, DCTERMS, FOAF, ORG, PROV, SKOS, TIME, VANN, VOID, WGS
+
+Violation = namedtuple("Violation", ["rule", "term", "message"])
+
+# well-known vocabularies, defined elsewhere: their terms are never checked or reported as undefined
+EXTERNAL_NAMESPACES = tuple(str(ns) for ns in (FOAF, SKOS, DC, DCTERMS, PROV, DCAT, TIME, ORG, VOID, VANN, WGS)) + (
+    "http://schema.org/", "https://schema.org/", "http://www.opengis.net/ont/geosparql#",
+) + tuple(ns.strip() for ns in os.getenv("VALIDATION_EXTERNAL_NAMESPACES", "").split(",") if ns.strip())
+STANDARD_NAMESPACES = (str(RDF), str(RDFS), str(OWL), str(XSD)) + EXTERNAL_NAMESPACES
+CLASS_TYPES = {RDFS.Class, OWL.Class}
+PROPERTY_TYPES = {RDF.Property, OWL.ObjectProperty, OWL.DatatypeProperty, OWL.AnnotationProperty,
+                  OWL.FunctionalProperty, OWL.TransitiveProperty, OWL.SymmetricProperty, OWL.InverseFunctionalProperty}
+META_TYPES = CLASS_TYPES | PROPERTY_TYPES | {OWL.Ontology, OWL.NamedIndividual, OWL.Restriction, RDFS.Datatype}
+
+PASCAL_CASE = re.compile(r"^[A-Z][A-Za-z0-9]*$")
+CAMEL_CASE = re.compile(r"^[a-z][A-Za-z0-9]*$")
+
+def local_name(term):
+    s = str(term)
+    return re.split(r"[#/:]", s)[-1]
+
+def is_standard(term):
+    return str(term).startswith(STANDARD_NAMESPACES)
+
+def is_datatype(term):
+    return str(term).startswith(str(XSD)) or term == RDFS.Literal
+
+class OntologyValidator:
+    """
+    Deterministic local versions of the checks in build_validation_prompt:
+    naming conventions, undefined references, domain/range sanity and
+    class/individual confusion. `check` only looks at the triples in `delta`
+    (those added since the last run) and uses `graph` for lookups, so the
+    cost of a run is proportional to what changed, not to the ontology size.
+    """
+
+    def check(self, graph, delta):
+        violations = []
+        terms = set()
+        for s, p, o in delta:
+            for term in (s, p, o):
+                if isinstance(term, URIRef) and not is_standard(term):
+                    terms.add(term)
+            violations += self._check_triple(graph, s, p, o)
+        for term in sorted(terms):
+            violations += self._check_term(graph, term)
+        return violations
+
+    def _types(self, graph, term):
+        return set(graph.objects(term, RDF.type))
+
+    def _check_term(self, graph, term):
+        violations = []
+        types = self._types(graph, term)
+        name = local_name(term)
+
+        if types & CLASS_TYPES and not PASCAL_CASE.match(name):
+            violations.append(Violation("naming", term, f"class {name} is not PascalCase"))
+        if types & PROPERTY_TYPES and not CAMEL_CASE.match(name):
+            violations.append(Violation("naming", term, f"property {name} is not camelCase"))
+
+        if (term, None, None) not in graph:
+            violations.append(Violation("undefined_reference", term, f"{name} is used but never defined"))
+
+        instance_of = {t for t in types if t not in META_TYPES}
+        if types & CLASS_TYPES and instance_of:
+            violations.append(Violation("class_individual", term,
+                                        f"{name} is declared as a class and as an instance of {', '.join(local_name(t) for t in sorted(instance_of))}"))
+        return violations
+
+    def _check_triple(self, graph, s, p, o):
+        violations = []
+        if p in (RDFS.domain, RDFS.range):
+            which = "domain" if p == RDFS.domain else "range"
+            if isinstance(o, Literal):
+                violations.append(Violation("domain_range", s, f"{which} of {local_name(s)} is a literal"))
+            elif not (is_datatype(o) and p == RDFS.range) and not self._types(graph, o) & CLASS_TYPES and not is_standard(o):
+                violations.append(Violation("domain_range", s, f"{which} of {local_name(s)} is {local_name(o)}, which is not a class"))
+            if p == RDFS.domain and is_datatype(o):
+                violations.append(Violation("domain_range", s, f"domain of {local_name(s)} is the datatype {local_name(o)}"))
+
+            prop_types = self._types(graph, s)
+            if p == RDFS.range and OWL.ObjectProperty in prop_types and is_datatype(o):
+                violations.append(Violation("domain_range", s, f"object property {local_name(s)} has datatype range {local_name(o)}"))
+            if p == RDFS.range and OWL.DatatypeProperty in prop_types and not is_datatype(o):
+                violations.append(Violation("domain_range", s, f"datatype property {local_name(s)} has non-datatype range {local_name(o)}"))
+
+        elif not is_standard(p):
+            prop_types = self._types(graph, p)
+            if OWL.ObjectProperty in prop_types and isinstance(o, Literal):
+                violations.append(Violation("domain_range", s, f"object property {local_name(p)} is used with a literal value"))
+            if OWL.DatatypeProperty in prop_types and isinstance(o, URIRef):
+                violations.append(Violation("domain_range", s, f"datatype property {local_name(p)} is used with a resource value"))
+        return violations
+
+def violation_subgraph(graph, violations, max_references=25):
+    """
+    The triples describing the terms involved in `violations`, plus the
+    declarations they reference. Of the triples pointing at a term, only the
+    first `max_references` are included, so a hub class does not pull in
+    most of the ontology; the others are left as they are.
+    """
+    focus = {v.term for v in violations}
+    subgraph = Graph()
+    context = Graph()
+    for prefix, namespace in graph.namespaces():
+        subgraph.bind(prefix, namespace)
+        context.bind(prefix, namespace)
+    for term in focus:
+        for triple in graph.triples((term, None, None)):
+            subgraph.add(triple)
+        for triple in islice(graph.triples((None, None, term)), max_references):
+            subgraph.add(triple)
+    for s, p, o in list(subgraph):
+        for term in (p, o):
+            if isinstance(term, URIRef) and term not in focus and not is_standard(term):
+                for triple in graph.triples((term, RDF.type, None)):
+                    context.add(triple)
+    return subgraph, context
@@ -0,0 +1,73 @@
+import math
+from collections import defaultdict
+from rdflib import URIRef, RDF, RDFS
+from src.canonicalizer import split_identifier, singularize
+from src.splitter import count_tokens
+from src.validator import local_name, is_standard, CLASS_TYPES, PROPERTY_TYPES
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "which", "with",
+}
+
+def _tokens(text):
+    return {singularize(w) for w in split_identifier(text) if w not in STOPWORDS and len(w) > 1}
+
+class VocabularyIndex:
+    """
+    Inverted index from words to the classes and properties whose local name
+    or rdfs:label contains them. Used to show the generation prompt the part
+    of the existing ontology that is relevant to a chunk.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.kinds = {}
+
+    def add_graph(self, graph):
+        for kind, types in (("class", CLASS_TYPES), ("property", PROPERTY_TYPES)):
+            for t in types:
+                for term in graph.subjects(RDF.type, t):
+                    if not isinstance(term, URIRef) or is_standard(term) or term in self.kinds:
+                        continue
+                    self.kinds[term] = kind
+                    words = _tokens(local_name(term))
+                    for label in graph.objects(term, RDFS.label):
+                        words |= _tokens(str(label))
+                    for word in words:
+                        self.postings[word].add(term)
+
+    def search(self, text, k):
+        """Top-k terms by summed idf of the words they share with `text` (ties broken by IRI)."""
+        scores = defaultdict(float)
+        total = max(len(self.kinds), 1)
+        for word in _tokens(text):
+            terms = self.postings.get(word)
+            if not terms:
+                continue
+            idf = math.log(1 + total / len(terms))
+            for term in terms:
+                scores[term] += idf
+        return sorted(scores, key=lambda term: (-scores[term], str(term)))[:k]
+
+    def format(self, terms, namespace_manager, max_tokens):
+        """A compact prefix/term listing of `terms`, cut off at `max_tokens` tokens."""
+        prefixes = {}
+        lines = []
+        used = 0
+        for term in terms:
+            try:
+                prefix, namespace, name = namespace_manager.compute_qname(term, generate=False)
+                shown = f"{prefix}:{name}"
+                new_prefix = {prefix: namespace} if prefix not in prefixes else {}
+            except Exception:
+                shown, new_prefix = f"<{term}>", {}
+            line = f"{shown} ({self.kinds[term]})"
+            cost = count_tokens(line) + sum(count_tokens(f"@prefix {p}: <{n}> .") for p, n in new_prefix.items())
+            if used + cost > max_tokens:
+                break
+            used += cost
+            prefixes.update(new_prefix)
+            lines.append(line)
+        header = [f"@prefix {p}: <{n}> ." for p, n in prefixes.items()]
+        return "\n".join(header + lines)
@@ -0,0 +1,175 @@
+import ctypes
+import ctypes.util
+import itertools
+import logging
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from src.document_loader import load_documents
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0x00080000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+class InotifyWatcher:
+    """
+    Linux inotify (through libc with ctypes) on a set of folder trees.
+    poll() returns files that were closed after writing or moved in; new
+    subfolders are watched as they appear.
+    """
+
+    def __init__(self, folders):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = folders
+        self.watches = {}
+        for folder in folders:
+            self._watch_tree(folder)
+
+    def _watch_tree(self, folder):
+        for root, dirs, _ in os.walk(folder):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                logging.warning(f"Cannot watch {root}: {os.strerror(ctypes.get_errno())}\n")
+            else:
+                self.watches[wd] = root
+
+    def poll(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped: fall back to a full scan
+                logging.warning("inotify queue overflowed, rescanning watched folders\n")
+                return [p for folder in self.folders for p in load_documents(folder, recursive=True)]
+            if wd not in self.watches or not name or name.startswith(b"."):
+                continue
+            path = os.path.join(self.watches[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path)
+                    # files written before the watch was in place
+                    paths.extend(load_documents(path, recursive=True))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """
+    Rescans the folder trees every `interval` seconds and reports files whose
+    size and modification time changed, once they stayed the same for a full
+    interval (so files still being written are not picked up).
+    """
+
+    def __init__(self, folders, interval=2.0):
+        self.folders = folders
+        self.interval = interval
+        self.reported = self._scan()
+        self.candidates = {}
+
+    def _scan(self):
+        signatures = {}
+        for folder in self.folders:
+            for path in load_documents(folder, recursive=True):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                signatures[path] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        current = self._scan()
+        ready = []
+        for path, signature in current.items():
+            if self.reported.get(path) == signature:
+                continue
+            if self.candidates.get(path) == signature:
+                ready.append(path)
+                self.reported[path] = signature
+        self.candidates = {p: s for p, s in current.items() if self.reported.get(p) != s}
+        return ready
+
+    def close(self):
+        pass
+
+def make_watcher(folders, interval=2.0):
+    """inotify on Linux (unless WATCH_POLL=1), otherwise polling."""
+    if sys.platform.startswith("linux") and os.getenv("WATCH_POLL", "0") != "1":
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify unavailable ({e}), polling every {interval}s\n")
+    return PollingWatcher(folders, interval)
+
+class WorkQueue:
+    """
+    Bounded priority queue of files to process, smallest first. A file that
+    is already waiting is not queued twice; put() blocks while the queue is
+    full, which holds the watcher back.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.queue = queue.PriorityQueue(maxsize)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+
+    def put(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        with self.lock:
+            if path in self.pending:
+                return False
+            self.pending.add(path)
+        self.queue.put((size, next(self.counter), path))
+        return True
+
+    def get(self, timeout=None):
+        """The smallest waiting file, or None after `timeout` seconds."""
+        try:
+            _, _, path = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self.lock:
+            self.pending.discard(path)
+        return path
+
+    def __len__(self):
+        return self.queue.qsize()
+
+def watch_into(watcher, work, stop, backlog=(), timeout=1.0):
+    """Watcher thread: queues the `backlog` files, then the files the watcher reports, until `stop` is set."""
+    for path in backlog:
+        if stop.is_set():
+            return
+        work.put(path)
+    while not stop.is_set():
+        for path in watcher.poll(timeout):
+            if os.path.isfile(path):
+                work.put(path)
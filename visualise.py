@@ -4,14 +4,34 @@ visualize.py
 Pyvis-based ontology visualizer (rdflib -> interactive HTML).
 
 Usage:
-    python visualize.py path/to/ontology.ttl [output.html]
+    python visualise.py render [path/to/ontology.ttl] [output.html]
+    python visualise.py export [source] [--out output.html] [--view full|classes] [--max-nodes N] [--no-cluster]
+    python visualise.py serve [source] [--port 8000]
+
+`render` draws every triple (small ontologies). `export` is the level-of-detail
+mode for large ones: literals folded into tooltips, an importance-sampled node
+budget, communities collapsed into super-nodes and a layout computed offline.
+`serve` loads the graph once and serves search, neighborhoods and class
+subtrees as JSON to a small browser page that renders only what is requested.
+A source is a Turtle/N-Triples file or an ontology state directory
+(output/state, see src/journal.py).
 """
 
 import sys
 import os
 import html
-from rdflib import Graph, RDF, RDFS, OWL, URIRef, Literal
+import json
+import hashlib
+import argparse
+from collections import Counter, defaultdict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from rdflib import Graph, RDF, RDFS, OWL, URIRef, Literal, BNode
+from rdflib.util import guess_format
 from pyvis.network import Network
+from src.journal import OntologyJournal
 
 def qname_or_str(g: Graph, uri):
     """Try to return a compact qname prefix:LocalName, otherwise the local name, else full URI."""
@@ -33,13 +53,42 @@ def safe_html_label(text: str) -> str:
     """Escape text for HTML then return. Wrap tags (b/i) added by caller."""
     return html.escape(text)
 
-def visualize_ontology(ttl_file, output_html="output/ontology_visualization.html", height="900px", width="100%"):
-    if not os.path.exists(ttl_file):
-        raise FileNotFoundError(f"TTL file not found: {ttl_file}")
+def stable_id(*parts) -> str:
+    """Short content hash; unlike hash(), the same in every run."""
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
 
-    # Load graph
+def bnode_key(g: Graph, b: BNode) -> str:
+    """Identifies a blank node by its non-blank neighbours, since its label changes between parses."""
+    parts = sorted(f"{p.n3()} {o.n3()}" for p, o in g.predicate_objects(b) if not isinstance(o, BNode))
+    parts += sorted(f"^{s.n3()} {p.n3()}" for s, p in g.subject_predicates(b) if not isinstance(s, BNode))
+    return stable_id(*parts)
+
+def term_id(g: Graph, term) -> str:
+    """Stable node id of a resource."""
+    if isinstance(term, BNode):
+        return f"node:{bnode_key(g, term)}"
+    return str(term)
+
+def load_graph(source: str) -> Graph:
+    """Loads a Turtle/N-Triples/... file, or an ontology state directory (snapshot + journal)."""
     g = Graph()
-    g.parse(ttl_file, format="turtle")
+    if os.path.isdir(source):
+        journal = OntologyJournal(source)
+        if not journal.exists():
+            raise FileNotFoundError(f"No ontology snapshot in: {source}")
+        journal.load(g)
+    elif os.path.exists(source):
+        g.parse(source, format=guess_format(source) or "turtle")
+    else:
+        raise FileNotFoundError(f"Ontology not found: {source}")
+    return g
+
+def default_source() -> str:
+    return "output/state" if os.path.isdir("output/state") else "output/final_ontology.ttl"
+
+def visualize_ontology(ttl_file, output_html="output/ontology_visualization.html", height="900px", width="100%"):
+    # Load graph
+    g = load_graph(ttl_file)
 
     # Create Pyvis network
     net = Network(height=height, width=width, directed=True, bgcolor="#ffffff")
@@ -111,7 +160,7 @@ def visualize_ontology(ttl_file, output_html="output/ontology_visualization.html
         p_label_short = qname_or_str(g, p) if isinstance(p, URIRef) else str(p)
         p_label_html = f"<i>{safe_html_label(p_label_short)}</i>"
 
-        subj_id = str(s)
+        subj_id = term_id(g, s)
         if subj_id not in added_nodes:
             subj_qn = qname_or_str(g, s) if isinstance(s, URIRef) else str(s)
             subj_label = f"<b>{safe_html_label(subj_qn)}</b>" if isinstance(s, URIRef) else safe_html_label(str(s))
@@ -119,8 +168,7 @@ def visualize_ontology(ttl_file, output_html="output/ontology_visualization.html
 
         if isinstance(o, Literal):
             # deterministic literal node id to avoid duplicates across same literal
-            lit_hash = abs(hash((str(o), p_label_short, subj_id)))
-            lit_id = f"lit:{lit_hash}"
+            lit_id = f"lit:{stable_id(str(o), p_label_short, subj_id)}"
             lit_label = safe_html_label(str(o))
             if lit_id not in added_nodes:
                 add_node_if_missing(lit_id, f"{lit_label}", color="#fefae0", shape="ellipse", size=30)
@@ -146,7 +194,7 @@ def visualize_ontology(ttl_file, output_html="output/ontology_visualization.html
             net.add_edge(subj_id, obj_id, label=p_label_html, color=edge_color)
         else:
             # fallback node for blank nodes or other types
-            unk_id = f"node:{abs(hash((str(o), p_label_short, subj_id)))}"
+            unk_id = term_id(g, o) if isinstance(o, BNode) else f"node:{stable_id(str(o), p_label_short, subj_id)}"
             if unk_id not in added_nodes:
                 add_node_if_missing(unk_id, safe_html_label(str(o)), color="#e0e0e0", shape="ellipse", size=36)
             net.add_edge(subj_id, unk_id, label=p_label_html, color="#999999")
@@ -156,7 +204,627 @@ def visualize_ontology(ttl_file, output_html="output/ontology_visualization.html
     net.write_html(output_html)
     print(f"Ontology visualization saved to {output_html}")
 
+# ---------------------------------------------------------------------------
+# Level-of-detail export for large ontologies
+# ---------------------------------------------------------------------------
+
+CLASS_TYPES = (RDFS.Class, OWL.Class)
+PROPERTY_TYPES = (RDF.Property, OWL.ObjectProperty, OWL.DatatypeProperty, OWL.AnnotationProperty)
+KIND_STYLE = {
+    "class": ("#8ecae6", "box"),
+    "property": ("#ffb703", "diamond"),
+    "individual": ("#b7e4c7", "dot"),
+    "blank": ("#e0e0e0", "dot"),
+}
+MAX_TOOLTIP_LITERALS = 20
+
+def _kind(g: Graph, term) -> str:
+    if isinstance(term, BNode):
+        return "blank"
+    types = set(g.objects(term, RDF.type))
+    if types & set(CLASS_TYPES) or (term, RDFS.subClassOf, None) in g:
+        return "class"
+    if types & set(PROPERTY_TYPES):
+        return "property"
+    return "individual"
+
+def build_view(g: Graph, view="full"):
+    """
+    Nodes and edges of one view of the graph. "full": every resource, with
+    its literals folded into the node tooltip instead of drawn as nodes;
+    "classes": only classes and rdfs:subClassOf, with instance counts.
+    Returns ({node id: info dict}, [(source id, target id, predicate label)]).
+    """
+    nodes = {}
+    edges = []
+
+    def node(term):
+        nid = term_id(g, term)
+        if nid not in nodes:
+            nodes[nid] = {"label": qname_or_str(g, term) if isinstance(term, URIRef) else "(blank node)",
+                          "kind": _kind(g, term), "literals": [], "notes": []}
+        return nid
+
+    if view == "classes":
+        classes = {c for t in CLASS_TYPES for c in g.subjects(RDF.type, t) if isinstance(c, URIRef)}
+        for sub, sup in g.subject_objects(RDFS.subClassOf):
+            if isinstance(sub, URIRef) and isinstance(sup, URIRef):
+                classes.update((sub, sup))
+                edges.append((term_id(g, sub), term_id(g, sup), "rdfs:subClassOf"))
+        instances = Counter(o for o in g.objects(None, RDF.type) if o in classes)
+        for c in classes:
+            nid = node(c)
+            nodes[nid]["kind"] = "class"
+            nodes[nid]["literals"] = [(qname_or_str(g, p), str(o)) for p, o in g.predicate_objects(c) if isinstance(o, Literal)]
+            if instances[c]:
+                nodes[nid]["notes"].append(f"{instances[c]} instances")
+        return nodes, sorted(set(edges))
+
+    for s, p, o in g:
+        sid = node(s)
+        if isinstance(o, Literal):
+            nodes[sid]["literals"].append((qname_or_str(g, p), str(o)))
+        elif p == RDF.type and (o in CLASS_TYPES or o in PROPERTY_TYPES or o == OWL.NamedIndividual):
+            continue
+        else:
+            edges.append((sid, node(o), qname_or_str(g, p)))
+    return nodes, sorted(set(edges))
+
+def tooltip(info) -> str:
+    lines = [info["label"], f"({info['kind']})"] + info["notes"]
+    literals = sorted(info["literals"])
+    for pred, value in literals[:MAX_TOOLTIP_LITERALS]:
+        value = " ".join(value.split())
+        lines.append(f"{pred}: {value[:200] + '...' if len(value) > 200 else value}")
+    if len(literals) > MAX_TOOLTIP_LITERALS:
+        lines.append(f"... {len(literals) - MAX_TOOLTIP_LITERALS} more")
+    return "\n".join(lines)
+
+def pagerank(n: int, src, dst, damping=0.85, iterations=50):
+    """PageRank over the undirected graph, vectorized: one bincount per iteration."""
+    if n == 0:
+        return np.zeros(0)
+    a = np.concatenate([src, dst])
+    b = np.concatenate([dst, src])
+    degree = np.bincount(a, minlength=n).astype(float)
+    rank = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        share = np.where(degree > 0, rank / np.maximum(degree, 1), 0.0)
+        dangling = rank[degree == 0].sum()
+        rank = (1 - damping) / n + damping * (np.bincount(b, weights=share[a], minlength=n) + dangling / n)
+    return rank
+
+def sample_nodes(scores, max_nodes: int, seed=0):
+    """
+    Indices of at most `max_nodes` nodes: the top quarter of the budget by
+    importance, the rest drawn with probability proportional to importance
+    (seeded, so the same graph always gives the same sample).
+    """
+    n = len(scores)
+    if n <= max_nodes:
+        return np.arange(n)
+    order = np.lexsort((np.arange(n), -scores))
+    core = order[:max_nodes // 4]
+    rest = order[max_nodes // 4:]
+    p = scores[rest] / scores[rest].sum()
+    drawn = np.random.default_rng(seed).choice(rest, size=max_nodes - len(core), replace=False, p=p)
+    return np.sort(np.concatenate([core, drawn]))
+
+def communities(n: int, src, dst, iterations=20):
+    """Label propagation in a fixed node order (ties go to the smallest label), so results are reproducible."""
+    neighbours = defaultdict(list)
+    for a, b in zip(src.tolist(), dst.tolist()):
+        if a != b:
+            neighbours[a].append(b)
+            neighbours[b].append(a)
+    labels = list(range(n))
+    for _ in range(iterations):
+        changed = False
+        for v in range(n):
+            if not neighbours[v]:
+                continue
+            counts = Counter(labels[u] for u in neighbours[v])
+            best = max(counts.values())
+            label = min(l for l, c in counts.items() if c == best)
+            if label != labels[v]:
+                labels[v] = label
+                changed = True
+        if not changed:
+            break
+    return np.array(labels, dtype=int)
+
+# above this many nodes, repulsion is approximated on a grid (see grid_repulsion)
+EXACT_LAYOUT_NODES = 1000
+
+def exact_repulsion(pos, k):
+    """All-pairs repulsion as one broadcast: n * n memory, so only for small graphs."""
+    delta = pos[:, None, :] - pos[None, :, :]
+    dist = np.maximum(np.linalg.norm(delta, axis=-1), 1e-3)
+    np.fill_diagonal(dist, np.inf)
+    return (delta * (k * k / dist ** 2)[..., None]).sum(axis=1)
+
+def _push(disp, targets, sources, weights, pos, k):
+    delta = pos[targets] - sources
+    factor = weights * k * k / np.maximum((delta ** 2).sum(axis=1), 1e-6)
+    for axis in (0, 1):
+        disp[:, axis] += np.bincount(targets, weights=delta[:, axis] * factor, minlength=len(disp))
+
+def grid_repulsion(pos, k, max_levels=12):
+    """
+    Barnes-Hut style repulsion over a pyramid of grids (4 x 4 cells a side,
+    then 8 x 8, ... down to cells about `k`, the ideal edge length, wide: a
+    quadtree with every level complete). At each level a node is pushed by
+    the centroid, weighted by node count, of each cell that is a child of a
+    cell next to its parent cell but is not next to its own cell; the nodes
+    in its own and the adjacent cells of the finest level push it directly.
+    Costs about n * 36 per level plus the close pairs per step, instead of
+    n * n.
+    """
+    n = len(pos)
+    low = pos.min(axis=0)
+    extent = max(float((pos.max(axis=0) - low).max()), 1e-9)
+    levels = int(np.clip(np.ceil(np.log2(extent / k)), 2, max_levels))
+    finest = 2 ** levels
+    cells = np.minimum(((pos - low) / extent * finest).astype(np.int64), finest - 1)
+    disp = np.zeros_like(pos)
+
+    offsets = np.arange(6)
+    for level in range(2, levels + 1):
+        side = 2 ** level
+        own = cells >> (levels - level)
+        keys = own[:, 0] * side + own[:, 1]
+        counts = np.bincount(keys, minlength=side * side)
+        centroids = np.stack([np.bincount(keys, weights=pos[:, axis], minlength=side * side)
+                              for axis in (0, 1)], axis=1) / np.maximum(counts, 1)[:, None]
+        # the 6 x 6 children of the 3 x 3 cells around the parent cell
+        first = (own >> 1) * 2 - 2
+        x = np.repeat(first[:, 0:1] + offsets, 6, axis=1)
+        y = np.tile(first[:, 1:2] + offsets, 6)
+        far = (x >= 0) & (x < side) & (y >= 0) & (y < side) & \
+              ((np.abs(x - own[:, 0:1]) > 1) | (np.abs(y - own[:, 1:2]) > 1))
+        cell = np.where(far, x * side + y, 0)
+        i, j = np.nonzero(far & (counts[cell] > 0))
+        cell = cell[i, j]
+        _push(disp, i, centroids[cell], counts[cell], pos, k)
+
+    # every (node, node of its own or an adjacent finest cell) pair
+    keys = cells[:, 0] * finest + cells[:, 1]
+    order = np.argsort(keys, kind="stable")
+    cell_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    nodes = np.arange(n)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            x, y = cells[:, 0] + dx, cells[:, 1] + dy
+            neighbour = x * finest + y
+            slot = np.minimum(np.searchsorted(cell_keys, neighbour), len(cell_keys) - 1)
+            found = (x >= 0) & (x < finest) & (y >= 0) & (y < finest) & (cell_keys[slot] == neighbour)
+            slot = slot[found]
+            sizes = counts[slot]
+            ii = np.repeat(nodes[found], sizes)
+            jj = order[np.repeat(starts[slot] - (np.cumsum(sizes) - sizes), sizes) + np.arange(sizes.sum())]
+            other = ii != jj
+            _push(disp, ii[other], pos[jj[other]], 1.0, pos, k)
+    return disp
+
+def force_layout(n: int, src, dst, groups, seed=0, iterations=120):
+    """
+    Fruchterman-Reingold layout computed with NumPy: all-pairs repulsion up
+    to EXACT_LAYOUT_NODES nodes, approximated on a grid beyond that. Each community
+    starts around its own point on a circle so that it stays together.
+    Returns an (n, 2) array of pixel coordinates.
+    """
+    if n == 0:
+        return np.zeros((0, 2))
+    rng = np.random.default_rng(seed)
+    group_ids, group_index = np.unique(groups, return_inverse=True)
+    angles = 2 * np.pi * np.arange(len(group_ids)) / max(len(group_ids), 1)
+    centers = np.stack([np.cos(angles), np.sin(angles)], axis=1) * (0.5 if len(group_ids) > 1 else 0.0)
+    k = np.sqrt(1.0 / n)
+    pos = centers[group_index] + rng.normal(scale=0.05, size=(n, 2))
+    temperature = 0.1
+    for _ in range(iterations):
+        disp = exact_repulsion(pos, k) if n <= EXACT_LAYOUT_NODES else grid_repulsion(pos, k)
+        if len(src):
+            d = pos[src] - pos[dst]
+            length = np.maximum(np.linalg.norm(d, axis=1), 1e-3)[:, None]
+            pull = d * length / k
+            np.add.at(disp, src, -pull)
+            np.add.at(disp, dst, pull)
+        length = np.maximum(np.linalg.norm(disp, axis=1), 1e-9)[:, None]
+        pos += disp / length * np.minimum(length, temperature)
+        temperature *= 0.96
+    pos -= pos.mean(axis=0)
+    extent = np.abs(pos).max() or 1.0
+    return pos / extent * 150 * np.sqrt(n)
+
+CLUSTER_SCRIPT = """
+<script type="text/javascript">
+  // communities start collapsed into super-nodes; double-click one to expand it
+  var communities = %s;
+  Object.keys(communities).forEach(function (cid) {
+    network.cluster({
+      joinCondition: function (node) { return String(node.community) === cid; },
+      clusterNodeProperties: {
+        id: "community:" + cid, label: communities[cid].label, title: communities[cid].title,
+        shape: "database", color: "#fb8500", size: communities[cid].size, physics: false
+      }
+    });
+  });
+  network.on("doubleClick", function (params) {
+    if (params.nodes.length === 1 && network.isCluster(params.nodes[0])) {
+      network.openCluster(params.nodes[0]);
+    }
+  });
+</script>
+"""
+
+def export_lod(source, output_html="output/ontology_lod.html", view="full", max_nodes=1000, cluster=True,
+               min_cluster_size=3, seed=0, height="900px", width="100%"):
+    """Scalable export: a bounded, pre-laid-out, clustered view of the ontology with browser physics off."""
+    g = load_graph(source)
+    nodes, edges = build_view(g, view)
+    ids = sorted(nodes)
+    index = {nid: i for i, nid in enumerate(ids)}
+    src = np.array([index[a] for a, _, _ in edges], dtype=int)
+    dst = np.array([index[b] for _, b, _ in edges], dtype=int)
+
+    scores = pagerank(len(ids), src, dst)
+    keep = sample_nodes(scores, max_nodes, seed)
+    remap = np.full(len(ids), -1)
+    remap[keep] = np.arange(len(keep))
+    kept_edges = [(remap[a], remap[b], label) for a, b, (_, _, label) in zip(src, dst, edges)
+                  if remap[a] >= 0 and remap[b] >= 0]
+    ksrc = np.array([a for a, _, _ in kept_edges], dtype=int)
+    kdst = np.array([b for _, b, _ in kept_edges], dtype=int)
+
+    groups = communities(len(keep), ksrc, kdst) if cluster else np.arange(len(keep))
+    pos = force_layout(len(keep), ksrc, kdst, groups, seed)
+    kept_scores = scores[keep] / (scores[keep].max() if len(keep) else 1)
+
+    net = Network(height=height, width=width, directed=True, bgcolor="#ffffff")
+    net.set_options("""
+{
+  "nodes": { "font": { "size": 14 } },
+  "edges": {
+    "arrows": { "to": { "enabled": true, "scaleFactor": 0.5 } },
+    "smooth": false,
+    "color": { "inherit": false }
+  },
+  "physics": { "enabled": false },
+  "interaction": { "hideEdgesOnDrag": true, "tooltipDelay": 100 }
+}
+""")
+    for i, original in enumerate(keep.tolist()):
+        info = nodes[ids[original]]
+        color, shape = KIND_STYLE[info["kind"]]
+        net.add_node(ids[original], label=info["label"], title=tooltip(info), color=color, shape=shape,
+                     size=int(10 + 30 * kept_scores[i]), x=float(pos[i, 0]), y=float(pos[i, 1]), physics=False,
+                     community=int(groups[i]))
+    for a, b, label in kept_edges:
+        net.add_edge(ids[keep[a]], ids[keep[b]], title=label, color="#219ebc" if label != "rdfs:subClassOf" else "#023047")
+
+    os.makedirs(os.path.dirname(output_html) or ".", exist_ok=True)
+    net.write_html(output_html)
+
+    super_nodes = {}
+    if cluster:
+        members = defaultdict(list)
+        for i, group in enumerate(groups.tolist()):
+            members[group].append(i)
+        for group, group_members in sorted(members.items()):
+            if len(group_members) < min_cluster_size:
+                continue
+            top = max(group_members, key=lambda i: (kept_scores[i], -i))
+            super_nodes[str(group)] = {
+                "label": f"{nodes[ids[keep[top]]]['label']} (+{len(group_members) - 1})",
+                "title": "\n".join(sorted(nodes[ids[keep[i]]]["label"] for i in group_members)[:50]),
+                "size": int(20 + 5 * np.sqrt(len(group_members))),
+            }
+    if super_nodes:
+        with open(output_html, "r", encoding="utf-8") as f:
+            page = f.read()
+        script = CLUSTER_SCRIPT % json.dumps(super_nodes)
+        page = page.replace("</body>", script + "</body>", 1) if "</body>" in page else page + script
+        with open(output_html, "w", encoding="utf-8") as f:
+            f.write(page)
+
+    print(f"Exported {len(keep)} of {len(ids)} nodes, {len(kept_edges)} edges and {len(super_nodes)} super-nodes "
+          f"({view} view) to {output_html}")
+
+# ---------------------------------------------------------------------------
+# Lazy-loading browser: a local server that returns one neighborhood at a time
+# ---------------------------------------------------------------------------
+
+class OntologyIndex:
+    """
+    The graph loaded once, as in-memory adjacency lists over the nodes of the
+    "full" view (literals folded into node details). Query results are kept
+    in an LRU cache of `cache_size` entries per query type.
+    """
+
+    def __init__(self, g: Graph, cache_size=1024):
+        self.nodes, edges = build_view(g, "full")
+        self.out = defaultdict(list)
+        self.inc = defaultdict(list)
+        self.children = defaultdict(list)
+        self.parents = defaultdict(list)
+        for a, b, label in edges:
+            self.out[a].append((b, label))
+            self.inc[b].append((a, label))
+            if label == "rdfs:subClassOf":
+                self.children[b].append(a)
+                self.parents[a].append(b)
+        for adjacency in (self.children, self.parents):
+            for nid in adjacency:
+                adjacency[nid].sort()
+        self.labels = sorted((info["label"].lower(), nid) for nid, info in self.nodes.items())
+        self.roots = sorted(nid for nid, info in self.nodes.items() if info["kind"] == "class" and not self.parents.get(nid))
+        self.search = lru_cache(maxsize=cache_size)(self._search)
+        self.neighborhood = lru_cache(maxsize=cache_size)(self._neighborhood)
+        self.subtree = lru_cache(maxsize=cache_size)(self._subtree)
+
+    def summary(self, nid):
+        info = self.nodes[nid]
+        return {"id": nid, "label": info["label"], "kind": info["kind"], "title": tooltip(info),
+                "degree": len(self.out.get(nid, ())) + len(self.inc.get(nid, ()))}
+
+    def details(self, nid):
+        info = self.nodes[nid]
+        return {**self.summary(nid), "literals": sorted(info["literals"]), "notes": info["notes"],
+                "parents": self.parents.get(nid, []), "children": len(self.children.get(nid, ()))}
+
+    def _search(self, query):
+        """Ids whose label contains `query` (case-insensitive): prefix matches first, then by label."""
+        query = query.lower().strip()
+        if not query:
+            return ()
+        hits = [(not label.startswith(query), label, nid) for label, nid in self.labels if query in label]
+        return tuple(nid for _, _, nid in sorted(hits))
+
+    def _neighborhood(self, nid, hops, limit):
+        """Nodes within `hops` edges of `nid` (either direction, breadth first, at most `limit`) and the edges among them."""
+        seen = {nid: 0}
+        frontier = [nid]
+        truncated = False
+        for depth in range(1, hops + 1):
+            next_frontier = []
+            for current in frontier:
+                for other, _ in sorted(self.out.get(current, []) + self.inc.get(current, [])):
+                    if other in seen:
+                        continue
+                    if len(seen) >= limit:
+                        truncated = True
+                        break
+                    seen[other] = depth
+                    next_frontier.append(other)
+            frontier = next_frontier
+        edges = sorted({(a, b, label) for a in seen for b, label in self.out.get(a, []) if b in seen})
+        return tuple(seen), tuple(edges), truncated
+
+    def _subtree(self, nid):
+        """The subclasses of `nid`, breadth first, with their depth."""
+        order = []
+        seen = {nid}
+        frontier = [nid]
+        depth = 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for current in frontier:
+                for child in self.children.get(current, []):
+                    if child not in seen:
+                        seen.add(child)
+                        order.append((child, depth))
+                        next_frontier.append(child)
+            frontier = next_frontier
+        return tuple(order)
+
+def _page(items, offset, limit):
+    return {"total": len(items), "offset": offset, "limit": limit, "items": list(items[offset:offset + limit])}
+
+BROWSER_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Ontology browser</title>
+<script src="https://unpkg.com/vis-network@9.1.9/standalone/umd/vis-network.min.js"></script>
+<style>
+  body { margin: 0; font-family: sans-serif; display: flex; height: 100vh; }
+  #side { width: 320px; padding: 8px; overflow-y: auto; border-right: 1px solid #ddd; }
+  #graph { flex: 1; }
+  #side input { width: 100%; box-sizing: border-box; }
+  .item { cursor: pointer; padding: 2px 0; }
+  .item:hover { text-decoration: underline; }
+  pre { white-space: pre-wrap; font-size: 12px; }
+</style>
+</head>
+<body>
+<div id="side">
+  <input id="q" placeholder="Search labels..." autofocus>
+  <div id="results"></div>
+  <div id="more"></div>
+  <hr>
+  <button id="subtree" disabled>Show subclasses</button>
+  <pre id="details">Search for a term, or pick a root class below. Double-click a node to expand it.</pre>
+</div>
+<div id="graph"></div>
+<script>
+var COLORS = __COLORS__;
+var nodes = new vis.DataSet(), edges = new vis.DataSet();
+var network = new vis.Network(document.getElementById("graph"), {nodes: nodes, edges: edges}, {
+  edges: {arrows: {to: {enabled: true, scaleFactor: 0.5}}, smooth: false},
+  physics: {solver: "forceAtlas2Based", stabilization: {iterations: 100}}
+});
+var selected = null, page = {query: "", offset: 0};
+
+function api(path, params) {
+  return fetch(path + "?" + new URLSearchParams(params)).then(function (r) { return r.json(); });
+}
+function addNodes(items) {
+  nodes.update(items.map(function (n) {
+    var style = COLORS[n.kind];
+    return {id: n.id, label: n.label, title: n.title, color: style[0], shape: style[1]};
+  }));
+}
+function addEdges(items) {
+  edges.update(items.map(function (e) { return {id: e[0] + " " + e[2] + " " + e[1], from: e[0], to: e[1], title: e[2]}; }));
+}
+function expand(id) {
+  api("/api/neighborhood", {id: id, hops: 1}).then(function (r) { addNodes(r.nodes); addEdges(r.edges); });
+  select(id);
+}
+function select(id) {
+  selected = id;
+  api("/api/node", {id: id}).then(function (d) {
+    document.getElementById("details").textContent = d.title + "\\n\\nparents: " + d.parents.join(", ") + "\\nsubclasses: " + d.children;
+    document.getElementById("subtree").disabled = d.children === 0;
+  });
+}
+function showList(r, append) {
+  var list = document.getElementById("results");
+  if (!append) list.innerHTML = "";
+  r.items.forEach(function (n) {
+    var div = document.createElement("div");
+    div.className = "item";
+    div.textContent = n.label + " (" + n.kind + ")";
+    div.onclick = function () { expand(n.id); };
+    list.appendChild(div);
+  });
+  var more = document.getElementById("more");
+  more.innerHTML = "";
+  if (r.offset + r.items.length < r.total) {
+    var link = document.createElement("a");
+    link.href = "#";
+    link.textContent = "more (" + (r.total - r.offset - r.items.length) + ")";
+    link.onclick = function (e) { e.preventDefault(); page.offset += r.limit; load(true); };
+    more.appendChild(link);
+  }
+}
+function load(append) {
+  if (page.query) api("/api/search", {q: page.query, offset: page.offset}).then(function (r) { showList(r, append); });
+  else api("/api/roots", {offset: page.offset}).then(function (r) { showList(r, append); });
+}
+var timer;
+document.getElementById("q").oninput = function (e) {
+  clearTimeout(timer);
+  timer = setTimeout(function () { page = {query: e.target.value, offset: 0}; load(false); }, 200);
+};
+document.getElementById("subtree").onclick = function () {
+  api("/api/subtree", {id: selected, limit: 200}).then(function (r) { addNodes(r.nodes); addEdges(r.edges); });
+};
+network.on("doubleClick", function (p) { if (p.nodes.length) expand(p.nodes[0]); });
+network.on("click", function (p) { if (p.nodes.length) select(p.nodes[0]); });
+load(false);
+</script>
+</body>
+</html>
+"""
+
+def make_handler(index: OntologyIndex, page_size=50):
+    class BrowserHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type="application/json"):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _json(self, payload, status=200):
+            self._send(status, json.dumps(payload))
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                offset = max(int(params.get("offset", 0)), 0)
+                limit = min(max(int(params.get("limit", page_size)), 1), 1000)
+                nid = params.get("id")
+                if url.path == "/":
+                    self._send(200, BROWSER_PAGE.replace("__COLORS__", json.dumps(KIND_STYLE)), "text/html")
+                elif url.path == "/api/search":
+                    page = _page(index.search(params.get("q", "")), offset, limit)
+                    page["items"] = [index.summary(n) for n in page["items"]]
+                    self._json(page)
+                elif url.path == "/api/roots":
+                    page = _page(index.roots, offset, limit)
+                    page["items"] = [index.summary(n) for n in page["items"]]
+                    self._json(page)
+                elif nid is None or nid not in index.nodes:
+                    self._json({"error": f"unknown node: {nid}"}, 404)
+                elif url.path == "/api/node":
+                    self._json(index.details(nid))
+                elif url.path == "/api/neighborhood":
+                    hops = min(max(int(params.get("hops", 1)), 1), 3)
+                    ids, edges, truncated = index.neighborhood(nid, hops, min(int(params.get("limit", 200)), 2000))
+                    self._json({"nodes": [index.summary(n) for n in ids], "edges": edges, "truncated": truncated})
+                elif url.path == "/api/subtree":
+                    page = _page(index.subtree(nid), offset, limit)
+                    ids = {nid} | {n for n, _ in page["items"]}
+                    self._json({**page,
+                                "nodes": [index.summary(n) for n in sorted(ids)],
+                                "edges": [(n, parent, "rdfs:subClassOf") for n in sorted(ids)
+                                          for parent in index.parents.get(n, []) if parent in ids]})
+                else:
+                    self._json({"error": f"unknown endpoint: {url.path}"}, 404)
+            except ValueError as e:
+                self._json({"error": str(e)}, 400)
+
+    return BrowserHandler
+
+def serve(source, host="127.0.0.1", port=8000, cache_size=1024):
+    g = load_graph(source)
+    index = OntologyIndex(g, cache_size)
+    del g
+    server = ThreadingHTTPServer((host, port), make_handler(index))
+    print(f"Browsing {len(index.nodes)} nodes from {source} at http://{host}:{port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+COMMANDS = ("render", "export", "serve")
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # `python visualise.py ontology.ttl [output.html]` still renders
+    if argv and argv[0] not in COMMANDS and not argv[0].startswith("-"):
+        argv.insert(0, "render")
+    parser = argparse.ArgumentParser(description="Visualize the ontology as interactive HTML")
+    commands = parser.add_subparsers(dest="command")
+
+    render = commands.add_parser("render", help="draw every triple (small ontologies)")
+    render.add_argument("source", nargs="?", default=None)
+    render.add_argument("output", nargs="?", default="output/ontology_visualization.html")
+
+    export = commands.add_parser("export", help="level-of-detail export for large ontologies")
+    export.add_argument("source", nargs="?", default=None)
+    export.add_argument("--out", default="output/ontology_lod.html")
+    export.add_argument("--view", choices=["full", "classes"], default="full")
+    export.add_argument("--max-nodes", type=int, default=1000)
+    export.add_argument("--no-cluster", action="store_true", help="do not collapse communities into super-nodes")
+    export.add_argument("--min-cluster-size", type=int, default=3)
+    export.add_argument("--seed", type=int, default=0)
+
+    browse = commands.add_parser("serve", help="local server that loads the neighbourhoods you explore on demand")
+    browse.add_argument("source", nargs="?", default=None)
+    browse.add_argument("--host", default="127.0.0.1")
+    browse.add_argument("--port", type=int, default=8000)
+    browse.add_argument("--cache-size", type=int, default=1024, help="LRU entries per query type")
+
+    args = parser.parse_args(argv)
+    source = getattr(args, "source", None) or default_source()
+    if args.command == "serve":
+        serve(source, args.host, args.port, args.cache_size)
+    elif args.command == "export":
+        export_lod(source, args.out, args.view, args.max_nodes, not args.no_cluster, args.min_cluster_size, args.seed)
+    else:
+        visualize_ontology(source, getattr(args, "output", "output/ontology_visualization.html"))
+
 if __name__ == "__main__":
-    o = "output/final_ontology.ttl"
-    f = "data/ontology_fragments/5.pdfpage_1.txt_0.ttl"
-    visualize_ontology(o)
\ No newline at end of file
+    main()